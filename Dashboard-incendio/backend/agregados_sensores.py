@@ -0,0 +1,156 @@
+# cSpell:disable
+# ============================================
+# AGREGADOS INCREMENTALES DE SENSORES
+# Mínimo / máximo / media por dispositivo a 1 s, 1 min y 1 h,
+# actualizados con cada lectura (O(1) y memoria acotada)
+# ============================================
+
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from almacen_sensores import CAMPOS, a_epoch
+
+# Resolución -> (segundos por cubeta, cubetas que se conservan por dispositivo)
+RESOLUCIONES = {
+    '1s': (1, 300),         # 5 minutos
+    '1m': (60, 1440),       # 24 horas
+    '1h': (3600, 720),      # 30 días
+}
+
+# Lecturas que llegan tarde: solo se buscan en las últimas cubetas
+MAX_CUBETAS_ATRAS = 3
+
+
+class _Cubeta:
+    __slots__ = ('inicio', 'lecturas', 'cuenta', 'minimo', 'maximo', 'suma')
+
+    def __init__(self, inicio):
+        self.inicio = inicio
+        self.lecturas = 0
+        self.cuenta = [0] * len(CAMPOS)
+        self.minimo = [None] * len(CAMPOS)
+        self.maximo = [None] * len(CAMPOS)
+        self.suma = [0.0] * len(CAMPOS)
+
+    def agregar(self, valores):
+        self.lecturas += 1
+        for i, valor in enumerate(valores):
+            if valor is None:
+                continue
+            if self.minimo[i] is None or valor < self.minimo[i]:
+                self.minimo[i] = valor
+            if self.maximo[i] is None or valor > self.maximo[i]:
+                self.maximo[i] = valor
+            self.suma[i] += valor
+            self.cuenta[i] += 1
+
+    def como_dict(self, dispositivo, segundos):
+        punto = {
+            'dispositivo': dispositivo,
+            'timestamp': datetime.fromtimestamp(self.inicio * segundos).isoformat(),
+            'lecturas': self.lecturas,
+        }
+        for i, campo in enumerate(CAMPOS):
+            # Media sobre las lecturas que traían el campo
+            punto[campo] = round(self.suma[i] / self.cuenta[i], 2) if self.cuenta[i] else None
+            punto[campo + '_min'] = self.minimo[i]
+            punto[campo + '_max'] = self.maximo[i]
+        return punto
+
+
+class AgregadosSensores:
+    """
+    Ventanas de agregados por dispositivo y resolución.
+
+    Cada lectura actualiza la cubeta en curso de cada resolución (o abre
+    una nueva); las cubetas más viejas salen solas del deque, así que la
+    memoria no crece con el número de lecturas. Los puntos tienen el mismo
+    formato que GET /api/sensores?step=...
+    """
+
+    def __init__(self, resoluciones=RESOLUCIONES):
+        self.resoluciones = resoluciones
+        self._series = {}           # (dispositivo, resolución) -> deque de _Cubeta
+        self._cambiados = set()     # dispositivos con lecturas desde el último pendientes()
+        self._lock = threading.Lock()
+
+    def agregar(self, lectura):
+        ts = a_epoch(lectura.get('timestamp')) or time.time()
+        dispositivo = lectura.get('dispositivo')
+        valores = [lectura.get(campo) for campo in CAMPOS]
+        with self._lock:
+            for resolucion, (segundos, maximo) in self.resoluciones.items():
+                serie = self._series.get((dispositivo, resolucion))
+                if serie is None:
+                    serie = self._series[(dispositivo, resolucion)] = deque(maxlen=maximo)
+                cubeta = self._cubeta(serie, int(ts // segundos))
+                if cubeta is not None:
+                    cubeta.agregar(valores)
+            self._cambiados.add(dispositivo)
+
+    def sembrar(self, almacen):
+        """
+        Reconstruye las cubetas a partir del historial persistente
+        (almacen_sensores.AlmacenSensores) para no perderlas al reiniciar
+        """
+        ahora = time.time()
+        with self._lock:
+            for resolucion, (segundos, maximo) in self.resoluciones.items():
+                for dispositivo, inicio, lecturas, campos in almacen.cubetas(segundos, ahora - segundos * maximo):
+                    serie = self._series.get((dispositivo, resolucion))
+                    if serie is None:
+                        serie = self._series[(dispositivo, resolucion)] = deque(maxlen=maximo)
+                    cubeta = _Cubeta(inicio)
+                    cubeta.lecturas = lecturas
+                    for i, (cuenta, suma, minimo, maximo_campo) in enumerate(campos):
+                        cubeta.cuenta[i] = cuenta
+                        cubeta.suma[i] = suma or 0.0
+                        cubeta.minimo[i] = minimo
+                        cubeta.maximo[i] = maximo_campo
+                    serie.append(cubeta)
+
+    def consultar(self, dispositivo=None, resolucion='1m', desde=None, limite=None):
+        """Cubetas (de la más vieja a la más nueva) de uno o todos los dispositivos"""
+        segundos = self.resoluciones[resolucion][0]
+        with self._lock:
+            puntos = [
+                cubeta.como_dict(disp, segundos)
+                for (disp, res), serie in self._series.items()
+                if res == resolucion and (dispositivo is None or disp == dispositivo)
+                for cubeta in (serie if limite is None else list(serie)[-limite:])
+                if desde is None or (cubeta.inicio + 1) * segundos > desde
+            ]
+        puntos.sort(key=lambda p: (p['timestamp'], str(p['dispositivo'])))
+        return puntos
+
+    def pendientes(self):
+        """
+        Cubeta en curso de cada resolución para los dispositivos con lecturas
+        nuevas desde la llamada anterior (lo que se empuja por Socket.IO)
+        """
+        with self._lock:
+            cambiados, self._cambiados = self._cambiados, set()
+            return {
+                resolucion: [
+                    self._series[(disp, resolucion)][-1].como_dict(disp, segundos)
+                    for disp in cambiados
+                ]
+                for resolucion, (segundos, _) in self.resoluciones.items()
+            } if cambiados else None
+
+    @staticmethod
+    def _cubeta(serie, inicio):
+        """Cubeta de la serie para `inicio` (la crea si es la más nueva)"""
+        if not serie or inicio > serie[-1].inicio:
+            serie.append(_Cubeta(inicio))
+            return serie[-1]
+        for atras in range(1, min(MAX_CUBETAS_ATRAS, len(serie)) + 1):
+            cubeta = serie[-atras]
+            if cubeta.inicio == inicio:
+                return cubeta
+            if cubeta.inicio < inicio:
+                break
+        # Demasiado vieja (o en un hueco del pasado): no se agrega
+        return None
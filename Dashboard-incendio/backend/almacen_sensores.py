@@ -0,0 +1,234 @@
+# cSpell:disable
+# ============================================
+# ALMACÉN DE SERIES TEMPORALES DE SENSORES
+# Historial persistente (SQLite en modo WAL) con escrituras
+# por lotes y consultas por rango con reducción en el servidor
+# ============================================
+
+import math
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+CAMPOS = ('temperatura', 'humedad', 'luminosidad')
+
+_UNIDADES = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def a_epoch(valor):
+    """Segundos epoch a partir de un número o de un ISO 8601 (None si no hay valor)"""
+    if valor is None or valor == '':
+        return None
+    if isinstance(valor, (int, float)):
+        return float(valor)
+    try:
+        return float(valor)
+    except ValueError:
+        # Sin zona horaria se interpreta como hora local (igual que datetime.now())
+        return datetime.fromisoformat(valor.replace('Z', '+00:00')).timestamp()
+
+
+def a_segundos(paso):
+    """'30', '30s', '5m', '1h', '1d' -> segundos"""
+    if paso is None or paso == '':
+        return None
+    coincidencia = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([smhd]?)\s*', str(paso))
+    if not coincidencia:
+        raise ValueError(f'Paso inválido: {paso}')
+    segundos = float(coincidencia.group(1)) * _UNIDADES[coincidencia.group(2) or 's']
+    if segundos <= 0:
+        raise ValueError(f'Paso inválido: {paso}')
+    return segundos
+
+
+class AlmacenSensores:
+    """
+    Historial de lecturas de todos los dispositivos.
+
+    - agregar() solo deja la lectura en memoria; un hilo la escribe en
+      SQLite junto con las demás en una sola transacción cada intervalo
+      segundos (o antes si se juntan max_lote).
+    - Índice por (dispositivo, ts): las consultas por rango no recorren
+      toda la tabla.
+    - consultar(..., paso) agrega en SQLite por cubetas de paso segundos
+      (media, mínimo y máximo), así un mes de datos son unos cientos de puntos.
+    - Las lecturas más viejas que retencion_dias se borran cada hora.
+    """
+
+    def __init__(self, ruta, intervalo=0.5, max_lote=500, retencion_dias=90, max_puntos=500):
+        self.ruta = ruta
+        self.intervalo = intervalo
+        self.max_lote = max_lote
+        self.retencion = retencion_dias * 86400 if retencion_dias else None
+        self.max_puntos = max_puntos
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pendientes = []
+        self._evento = threading.Event()
+        self._activo = True
+        self._ultima_purga = 0.0
+
+        self._conexion().executescript("""
+            CREATE TABLE IF NOT EXISTS lecturas (
+                dispositivo TEXT,
+                ts REAL NOT NULL,
+                temperatura REAL,
+                humedad REAL,
+                luminosidad REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_lecturas_dispositivo_ts ON lecturas (dispositivo, ts);
+            CREATE INDEX IF NOT EXISTS idx_lecturas_ts ON lecturas (ts);
+        """)
+        self._hilo = threading.Thread(target=self._bucle, name='almacen-sensores', daemon=True)
+        self._hilo.start()
+
+    # ---------------- escritura ----------------
+
+    def agregar(self, lectura):
+        """Encola una lectura normalizada (dict con 'timestamp' ISO) para el siguiente lote"""
+        fila = (
+            lectura.get('dispositivo'),
+            a_epoch(lectura.get('timestamp')) or time.time(),
+            *(lectura.get(campo) for campo in CAMPOS),
+        )
+        with self._lock:
+            self._pendientes.append(fila)
+            lleno = len(self._pendientes) >= self.max_lote
+        if lleno:
+            self._evento.set()
+
+    def vaciar(self):
+        """Escribe ya las lecturas pendientes (una transacción)"""
+        with self._lock:
+            filas, self._pendientes = self._pendientes, []
+        if not filas:
+            return
+        conexion = self._conexion()
+        with conexion:
+            conexion.executemany(
+                'INSERT INTO lecturas (dispositivo, ts, temperatura, humedad, luminosidad) '
+                'VALUES (?, ?, ?, ?, ?)', filas
+            )
+
+    def cerrar(self):
+        self._activo = False
+        self._evento.set()
+        self._hilo.join(timeout=5)
+        self.vaciar()
+
+    # ---------------- lectura ----------------
+
+    def consultar(self, dispositivo=None, desde=None, hasta=None, paso=None, limite=None):
+        """
+        Lecturas en [desde, hasta] (epoch) ordenadas por tiempo.
+        - paso (segundos): una fila por dispositivo y cubeta con media/mín/máx.
+        - Sin paso, si el rango tiene más de max_puntos lecturas se elige
+          el paso que lo deja en unos max_puntos puntos.
+        - limite: solo las últimas `limite` lecturas (sin paso).
+        Devuelve (puntos, paso usado o None).
+        """
+        self.vaciar()
+        condiciones, parametros = [], []
+        if dispositivo is not None:
+            condiciones.append('dispositivo = ?')
+            parametros.append(dispositivo)
+        if desde is not None:
+            condiciones.append('ts >= ?')
+            parametros.append(desde)
+        if hasta is not None:
+            condiciones.append('ts <= ?')
+            parametros.append(hasta)
+        donde = ('WHERE ' + ' AND '.join(condiciones)) if condiciones else ''
+        conexion = self._conexion()
+
+        if paso is None and limite is None:
+            total, primero, ultimo = conexion.execute(
+                f'SELECT COUNT(*), MIN(ts), MAX(ts) FROM lecturas {donde}', parametros
+            ).fetchone()
+            if total > self.max_puntos:
+                rango = (hasta if hasta is not None else ultimo) - (desde if desde is not None else primero)
+                paso = max(1, math.ceil(rango / self.max_puntos))
+
+        if paso is None:
+            filas = conexion.execute(
+                f'SELECT dispositivo, ts, temperatura, humedad, luminosidad FROM lecturas {donde} '
+                f'ORDER BY ts DESC {"LIMIT ?" if limite else ""}',
+                parametros + ([limite] if limite else [])
+            ).fetchall()
+            return [
+                {
+                    'dispositivo': d,
+                    'temperatura': t,
+                    'humedad': h,
+                    'luminosidad': l,
+                    'timestamp': datetime.fromtimestamp(ts).isoformat()
+                }
+                for d, ts, t, h, l in reversed(filas)
+            ], None
+
+        agregados = ', '.join(f'AVG({c}), MIN({c}), MAX({c})' for c in CAMPOS)
+        filas = conexion.execute(
+            f'SELECT dispositivo, CAST(ts / ? AS INTEGER) AS cubeta, COUNT(*), {agregados} '
+            f'FROM lecturas {donde} GROUP BY dispositivo, cubeta ORDER BY cubeta, dispositivo',
+            [paso] + parametros
+        ).fetchall()
+        puntos = []
+        for dispositivo_fila, cubeta, cantidad, *valores in filas:
+            punto = {
+                'dispositivo': dispositivo_fila,
+                'timestamp': datetime.fromtimestamp(cubeta * paso).isoformat(),
+                'lecturas': cantidad,
+            }
+            for i, campo in enumerate(CAMPOS):
+                media, minimo, maximo = valores[3 * i:3 * i + 3]
+                punto[campo] = round(media, 2) if media is not None else None
+                punto[campo + '_min'] = minimo
+                punto[campo + '_max'] = maximo
+            puntos.append(punto)
+        return puntos, paso
+
+    def cubetas(self, paso, desde=None):
+        """
+        Agregados exactos por dispositivo y cubeta de paso segundos desde
+        `desde` (para reconstruir los agregados en memoria al arrancar):
+        [(dispositivo, cubeta, lecturas, [(cuenta, suma, mín, máx) por campo])]
+        """
+        self.vaciar()
+        columnas = ', '.join(f'COUNT({c}), SUM({c}), MIN({c}), MAX({c})' for c in CAMPOS)
+        filas = self._conexion().execute(
+            f'SELECT dispositivo, CAST(ts / ? AS INTEGER) AS cubeta, COUNT(*), {columnas} '
+            f'FROM lecturas WHERE ts >= ? GROUP BY dispositivo, cubeta ORDER BY cubeta',
+            (paso, desde or 0)
+        ).fetchall()
+        return [
+            (d, cubeta, lecturas, [tuple(v[4 * i:4 * i + 4]) for i in range(len(CAMPOS))])
+            for d, cubeta, lecturas, *v in filas
+        ]
+
+    # ---------------- interno ----------------
+
+    def _conexion(self):
+        conexion = getattr(self._local, 'conexion', None)
+        if conexion is None:
+            conexion = sqlite3.connect(self.ruta, timeout=30)
+            conexion.execute('PRAGMA journal_mode=WAL')
+            conexion.execute('PRAGMA synchronous=NORMAL')
+            self._local.conexion = conexion
+        return conexion
+
+    def _bucle(self):
+        while self._activo:
+            self._evento.wait(self.intervalo)
+            self._evento.clear()
+            try:
+                self.vaciar()
+                if self.retencion and time.time() - self._ultima_purga > 3600:
+                    self._ultima_purga = time.time()
+                    conexion = self._conexion()
+                    with conexion:
+                        conexion.execute('DELETE FROM lecturas WHERE ts < ?', (time.time() - self.retencion,))
+            except sqlite3.Error as e:
+                print(f'⚠️ Error guardando lecturas de sensores: {e}')
@@ -1,11 +1,22 @@
 
 # cSpell:disable
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, send_file
 from flask_cors import CORS
-from flask_socketio import SocketIO, emit
+from flask_socketio import SocketIO
 from datetime import datetime
+import atexit
+import base64
+import glob
+import hashlib
+import math
+import mimetypes
+import os
+import re
+import tempfile
 
+from almacen_sensores import CAMPOS, AlmacenSensores, a_epoch, a_segundos
+from agregados_sensores import AgregadosSensores, RESOLUCIONES
 
 
 app = Flask(__name__)
@@ -19,9 +30,28 @@ UMBRALES = {
     'luminosidad': {'max': 2000}
 }
 
-# Historial de sensores (máx 60)
-MAX_HISTORIAL = 60
-historial_sensores = []
+# Historial de sensores persistente (SQLite en modo WAL, ver almacen_sensores.py)
+SENSORES_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sensores.db')
+RETENCION_DIAS = 90
+MAX_PUNTOS = 500      # puntos máximos por consulta de rango sin 'step'
+MAX_HISTORIAL = 60    # lecturas que devuelve GET /api/sensores sin parámetros
+almacen_sensores = AlmacenSensores(SENSORES_DB, retencion_dias=RETENCION_DIAS, max_puntos=MAX_PUNTOS)
+atexit.register(almacen_sensores.cerrar)
+
+# Agregados incrementales (1 s / 1 min / 1 h) para las gráficas; se empujan
+# por Socket.IO ('agregados_sensores') cada AGREGADOS_INTERVALO segundos,
+# con menos frecuencia que 'datos_sensores'
+AGREGADOS_INTERVALO = 5
+agregados_sensores = AgregadosSensores()
+# Tras un reinicio, los agregados salen del historial guardado
+agregados_sensores.sembrar(almacen_sensores)
+
+# Almacén de evidencias (imagen/audio) direccionado por sha256
+MEDIA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'media')
+os.makedirs(MEDIA_DIR, exist_ok=True)
+TIPOS_MEDIA = {'imagen': 'image/jpeg', 'audio': 'audio/wav'}
+mimetypes.add_type('audio/wav', '.wav')
+media_index = {}  # hash -> {'ruta', 'mime', 'tamano'}
 
 # Variables para almacenar los últimos datos
 ultimo_sensores = None
@@ -43,29 +73,135 @@ def health():
 def obtener_umbrales():
     return jsonify(UMBRALES), 200
 
-# Endpoint para recibir datos de sensores
-@app.route('/api/sensores', methods=['POST'])
-def recibir_sensores():
-    global ultimo_sensores, historial_sensores
-    data = request.get_json()
+def registrar_lectura(data):
+    """Normaliza una lectura, la guarda en el historial y la devuelve"""
+    global ultimo_sensores
     ultimo_sensores = {
+        'dispositivo': data.get('dispositivo'),
         'temperatura': data.get('temperatura'),
         'humedad': data.get('humedad'),
         'luminosidad': data.get('luminosidad'),
-        'timestamp': datetime.now().isoformat()
+        'timestamp': data.get('timestamp') or datetime.now().isoformat()
     }
-    # Guardar en historial
-    historial_sensores.append(ultimo_sensores)
-    if len(historial_sensores) > MAX_HISTORIAL:
-        historial_sensores = historial_sensores[-MAX_HISTORIAL:]
+    almacen_sensores.agregar(ultimo_sensores)
+    agregados_sensores.agregar(ultimo_sensores)
+    return ultimo_sensores
+
+def error_lectura(data):
+    """Motivo por el que una lectura no se puede guardar (None si es válida)"""
+    if not isinstance(data, dict):
+        return 'debe ser un objeto'
+    if not isinstance(data.get('dispositivo'), (str, type(None))):
+        return "'dispositivo' debe ser texto"
+    for campo in CAMPOS:
+        valor = data.get(campo)
+        if valor is not None and (isinstance(valor, bool) or not isinstance(valor, (int, float))
+                                  or not math.isfinite(valor)):
+            return f"'{campo}' debe ser numérico"
+    timestamp = data.get('timestamp')
+    if isinstance(timestamp, bool) or not isinstance(timestamp, (str, int, float, type(None))):
+        return "'timestamp' inválido"
+    try:
+        # Además tiene que poder volver a fecha al consultar las cubetas
+        epoch = a_epoch(timestamp)
+        if epoch is not None:
+            datetime.fromtimestamp(epoch)
+    except (ValueError, OverflowError, OSError):
+        return "'timestamp' inválido"
+    return None
+
+def emitir_agregados():
+    """Tarea de fondo: empuja las cubetas en curso de los dispositivos con lecturas nuevas"""
+    while True:
+        socketio.sleep(AGREGADOS_INTERVALO)
+        pendientes = agregados_sensores.pendientes()
+        if pendientes:
+            socketio.emit('agregados_sensores', pendientes)
+
+# Se arranca al crear la app (también bajo un servidor WSGI, sin __main__)
+socketio.start_background_task(emitir_agregados)
+
+# Endpoint para recibir datos de sensores
+@app.route('/api/sensores', methods=['POST'])
+def recibir_sensores():
+    lectura = registrar_lectura(request.get_json())
     # Emitir datos de sensores al frontend
-    socketio.emit('datos_sensores', ultimo_sensores)
-    return jsonify({'status': 'ok', 'mensaje': 'Datos recibidos', 'datos': ultimo_sensores}), 201
+    socketio.emit('datos_sensores', lectura)
+    return jsonify({'status': 'ok', 'mensaje': 'Datos recibidos', 'datos': lectura}), 201
+
+# Endpoint para recibir un lote de lecturas (de uno o varios dispositivos)
+@app.route('/api/sensores/lote', methods=['POST'])
+def recibir_sensores_lote():
+    data = request.get_json(silent=True) or {}
+    lecturas = data.get('lecturas')
+    if not isinstance(lecturas, list):
+        return jsonify({'status': 'error', 'mensaje': "Se esperaba {'lecturas': [...]}"}), 400
+    # Se valida todo el lote antes de guardar nada: un 400 no se reintenta
+    errores = [(i, error) for i, error in ((i, error_lectura(item)) for i, item in enumerate(lecturas)) if error]
+    if errores:
+        return jsonify({
+            'status': 'error',
+            'mensaje': 'Lecturas no válidas: ' + '; '.join(f'[{i}] {error}' for i, error in errores[:10])
+        }), 400
+
+    # Solo se emite la última lectura de cada dispositivo del lote
+    ultimas = {}
+    for item in lecturas:
+        lectura = registrar_lectura(item)
+        ultimas[lectura['dispositivo']] = lectura
+
+    for lectura in ultimas.values():
+        socketio.emit('datos_sensores', lectura)
+    return jsonify({'status': 'ok', 'mensaje': 'Lote recibido', 'recibidas': len(lecturas)}), 201
 
 # Endpoint para obtener historial de sensores
+# GET /api/sensores                          últimas MAX_HISTORIAL lecturas
+# GET /api/sensores?device=mkr-01&from=2024-05-01T00:00&to=...&step=1h
+#     from/to: ISO 8601 o epoch; step: segundos o 30s/5m/1h/1d (media, mín y máx
+#     por cubeta). Sin step, los rangos grandes se reducen a ~MAX_PUNTOS puntos
 @app.route('/api/sensores', methods=['GET'])
 def obtener_historial_sensores():
-    return jsonify({'historial': historial_sensores}), 200
+    args = request.args
+    try:
+        desde = a_epoch(args.get('from'))
+        hasta = a_epoch(args.get('to'))
+        paso = a_segundos(args.get('step'))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'mensaje': str(e)}), 400
+
+    if not any(args.get(k) for k in ('device', 'from', 'to', 'step')):
+        historial, _ = almacen_sensores.consultar(limite=MAX_HISTORIAL)
+        return jsonify({'historial': historial}), 200
+
+    historial, paso = almacen_sensores.consultar(args.get('device') or None, desde, hasta, paso)
+    return jsonify({
+        'historial': historial,
+        'dispositivo': args.get('device'),
+        'desde': args.get('from'),
+        'hasta': args.get('to'),
+        'paso': paso
+    }), 200
+
+# Endpoint de agregados (min/max/media por cubeta, mantenidos en memoria)
+# GET /api/sensores/agregados?device=mkr-01&res=1m&from=2024-05-01T10:00&limit=60
+@app.route('/api/sensores/agregados', methods=['GET'])
+def obtener_agregados_sensores():
+    args = request.args
+    resolucion = args.get('res', '1m')
+    if resolucion not in RESOLUCIONES:
+        return jsonify({'status': 'error', 'mensaje': f"res debe ser una de {list(RESOLUCIONES)}"}), 400
+    try:
+        desde = a_epoch(args.get('from'))
+        limite = int(args['limit']) if args.get('limit') else None
+    except ValueError as e:
+        return jsonify({'status': 'error', 'mensaje': str(e)}), 400
+    if limite is not None and limite < 1:
+        return jsonify({'status': 'error', 'mensaje': 'limit debe ser mayor o igual que 1'}), 400
+    return jsonify({
+        'resolucion': resolucion,
+        'dispositivo': args.get('device'),
+        'agregados': agregados_sensores.consultar(args.get('device') or None, resolucion, desde, limite)
+    }), 200
 
 # Endpoint para recibir estado
 @app.route('/api/estado', methods=['POST'])
@@ -73,6 +209,7 @@ def recibir_estado():
     global ultimo_estado
     data = request.get_json()
     ultimo_estado = {
+        'dispositivo': data.get('dispositivo'),
         'estado': data.get('estado'),
         'timestamp': datetime.now().isoformat()
     }
@@ -81,56 +218,136 @@ def recibir_estado():
     return jsonify({'status': 'ok', 'mensaje': 'Estado recibido', 'datos': ultimo_estado}), 201
 
 
-# Endpoint para recibir imagen
-@app.route('/api/imagen', methods=['POST'])
-def recibir_imagen():
-    global ultimo_imagen
-    data = request.get_json()
-    ultimo_imagen = {
-        'nombre': data.get('nombre'),
-        'data_url': data.get('data_url'),
+def guardar_media(origen, mime):
+    """
+    Guarda el contenido en MEDIA_DIR (por bloques si es un stream) y
+    devuelve su sha256. El mismo contenido se guarda una sola vez.
+    """
+    sha = hashlib.sha256()
+    tamano = 0
+    fd, temporal = tempfile.mkstemp(dir=MEDIA_DIR, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        if isinstance(origen, (bytes, bytearray)):
+            bloques = [origen]
+        else:
+            bloques = iter(lambda: origen.read(64 * 1024), b'')
+        for bloque in bloques:
+            sha.update(bloque)
+            f.write(bloque)
+            tamano += len(bloque)
+
+    hash_media = sha.hexdigest()
+    extension = mimetypes.guess_extension(mime) or ''
+    ruta = os.path.join(MEDIA_DIR, hash_media + extension)
+    if os.path.exists(ruta):
+        os.remove(temporal)
+    else:
+        os.replace(temporal, ruta)
+    media_index[hash_media] = {'ruta': ruta, 'mime': mime, 'tamano': tamano}
+    return hash_media
+
+def registrar_media(tipo, hash_media, nombre, dispositivo):
+    """
+    Actualiza la última imagen/audio y notifica a los navegadores solo con
+    metadatos (el contenido se descarga desde 'url').
+    Devuelve (metadatos, es_nuevo).
+    """
+    global ultimo_imagen, ultimo_audio
+    ultimo = ultimo_imagen if tipo == 'imagen' else ultimo_audio
+    # Mismo contenido: no se reenvía a los navegadores
+    if ultimo and ultimo.get('hash') == hash_media:
+        return ultimo, False
+
+    info = media_index[hash_media]
+    metadatos = {
+        'nombre': nombre,
+        'dispositivo': dispositivo,
+        'hash': hash_media,
+        'url': f'/api/media/{hash_media}',
+        'mime': info['mime'],
+        'tamano': info['tamano'],
+        'version': (ultimo or {}).get('version', 0) + 1,
         'timestamp': datetime.now().isoformat()
     }
-    # Emitir evidencia al frontend si también hay audio
-    if ultimo_audio:
-        socketio.emit('alerta_captura', {
-            'imagen': ultimo_imagen,
-            'audio': ultimo_audio,
-            'timestamp': ultimo_imagen['timestamp']
-        })
+    if tipo == 'imagen':
+        ultimo_imagen = metadatos
     else:
-        socketio.emit('alerta_captura', {
-            'imagen': ultimo_imagen,
-            'audio': None,
-            'timestamp': ultimo_imagen['timestamp']
-        })
-    return jsonify({'status': 'ok', 'mensaje': 'Imagen recibida', 'datos': ultimo_imagen}), 201
+        ultimo_audio = metadatos
+
+    socketio.emit('alerta_captura', {
+        'imagen': ultimo_imagen,
+        'audio': ultimo_audio,
+        'timestamp': metadatos['timestamp']
+    })
+    return metadatos, True
 
+def respuesta_media(tipo, metadatos, es_nuevo):
+    if not es_nuevo:
+        return jsonify({'status': 'ok', 'mensaje': 'Sin cambios', 'datos': metadatos}), 200
+    mensaje = 'Imagen recibida' if tipo == 'imagen' else 'Audio recibido'
+    return jsonify({'status': 'ok', 'mensaje': mensaje, 'datos': metadatos}), 201
 
-# Endpoint para recibir audio
+# Endpoint binario para subir evidencia (cuerpo = bytes del archivo)
+# POST /api/media/imagen?nombre=foto.jpg&dispositivo=mkr-01   (Content-Type: image/jpeg)
+@app.route('/api/media/<tipo>', methods=['POST'])
+def subir_media(tipo):
+    if tipo not in TIPOS_MEDIA:
+        return jsonify({'status': 'error', 'mensaje': f'Tipo no soportado: {tipo}'}), 400
+    mime = request.mimetype if request.mimetype and request.mimetype != 'application/octet-stream' else TIPOS_MEDIA[tipo]
+    hash_media = guardar_media(request.stream, mime)
+    metadatos, es_nuevo = registrar_media(
+        tipo, hash_media,
+        request.args.get('nombre', hash_media),
+        request.args.get('dispositivo')
+    )
+    return respuesta_media(tipo, metadatos, es_nuevo)
+
+# Endpoint para descargar evidencia por su hash (contenido inmutable => caché larga)
+@app.route('/api/media/<hash_media>', methods=['GET'])
+def obtener_media(hash_media):
+    if not re.fullmatch(r'[0-9a-f]{64}', hash_media):
+        return jsonify({'status': 'error', 'mensaje': 'Hash inválido'}), 400
+    info = media_index.get(hash_media)
+    if info is None:
+        # Tras un reinicio el índice está vacío, pero el archivo sigue en disco
+        encontrados = glob.glob(os.path.join(MEDIA_DIR, hash_media + '*'))
+        if not encontrados:
+            return jsonify({'status': 'error', 'mensaje': 'No encontrado'}), 404
+        ruta = encontrados[0]
+        info = {
+            'ruta': ruta,
+            'mime': mimetypes.guess_type(ruta)[0] or 'application/octet-stream',
+            'tamano': os.path.getsize(ruta)
+        }
+        media_index[hash_media] = info
+    response = send_file(info['ruta'], mimetype=info['mime'], etag=hash_media, conditional=True, max_age=31536000)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+def media_desde_data_url(tipo, data):
+    """Compatibilidad: acepta el JSON antiguo con data_url en base64"""
+    data_url = data.get('data_url') or ''
+    cabecera, _, b64_string = data_url.partition(',')
+    mime = cabecera[5:].split(';')[0] if cabecera.startswith('data:') else TIPOS_MEDIA[tipo]
+    hash_media = guardar_media(base64.b64decode(b64_string), mime or TIPOS_MEDIA[tipo])
+    return registrar_media(tipo, hash_media, data.get('nombre'), data.get('dispositivo'))
+
+# Endpoint para recibir imagen (JSON con data_url, se conserva por compatibilidad)
+@app.route('/api/imagen', methods=['POST'])
+def recibir_imagen():
+    data = request.get_json()
+    if ultimo_imagen and data.get('hash') and data.get('hash') == ultimo_imagen.get('hash'):
+        return respuesta_media('imagen', ultimo_imagen, False)
+    return respuesta_media('imagen', *media_desde_data_url('imagen', data))
+
+
+# Endpoint para recibir audio (JSON con data_url, se conserva por compatibilidad)
 @app.route('/api/audio', methods=['POST'])
 def recibir_audio():
-    global ultimo_audio
     data = request.get_json()
-    ultimo_audio = {
-        'nombre': data.get('nombre'),
-        'data_url': data.get('data_url'),
-        'timestamp': datetime.now().isoformat()
-    }
-    # Emitir evidencia al frontend si también hay imagen
-    if ultimo_imagen:
-        socketio.emit('alerta_captura', {
-            'imagen': ultimo_imagen,
-            'audio': ultimo_audio,
-            'timestamp': ultimo_audio['timestamp']
-        })
-    else:
-        socketio.emit('alerta_captura', {
-            'imagen': None,
-            'audio': ultimo_audio,
-            'timestamp': ultimo_audio['timestamp']
-        })
-    return jsonify({'status': 'ok', 'mensaje': 'Audio recibido', 'datos': ultimo_audio}), 201
+    if ultimo_audio and data.get('hash') and data.get('hash') == ultimo_audio.get('hash'):
+        return respuesta_media('audio', ultimo_audio, False)
+    return respuesta_media('audio', *media_desde_data_url('audio', data))
 
 # Endpoint para obtener los últimos datos
 @app.route('/api/ultimos', methods=['GET'])
@@ -0,0 +1,130 @@
+"""
+CACHÉ DE FEATURES DE ENTRENAMIENTO
+Extrae las features de muchos audios en paralelo (un proceso por núcleo)
+y las guarda en disco indexadas por el sha256 del archivo, así que al
+reentrenar solo se procesan los audios nuevos o modificados.
+
+En disco (una pareja de archivos por VERSION_FEATURES):
+    cache_features/features_<versión>.npy   matriz (N, 17) float64
+    cache_features/indice_<versión>.json    {sha256: fila}
+
+Si cambian los parámetros de features_audio.py cambia la versión y la
+caché anterior deja de usarse.
+"""
+
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from DeteccionAudio.features_audio import (
+    NOMBRES_FEATURES, VERSION_FEATURES, cargar_audio, features_de_senal
+)
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache_features")
+
+
+def sha256_archivo(ruta):
+    digest = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(bloque)
+    return digest.hexdigest()
+
+
+class CacheFeatures:
+    """Matriz de features (memory-mapped) más un índice sha256 -> fila"""
+
+    def __init__(self, directorio=CACHE_DIR, version=VERSION_FEATURES):
+        self.ruta_matriz = os.path.join(directorio, f"features_{version}.npy")
+        self.ruta_indice = os.path.join(directorio, f"indice_{version}.json")
+        self._indice = {}
+        self._matriz = np.zeros((0, len(NOMBRES_FEATURES)))
+
+        if os.path.exists(self.ruta_matriz) and os.path.exists(self.ruta_indice):
+            try:
+                with open(self.ruta_indice) as f:
+                    indice = json.load(f)
+                matriz = np.load(self.ruta_matriz, mmap_mode="r")
+                # El índice se escribe después de la matriz: nunca apunta más allá
+                if all(fila < len(matriz) for fila in indice.values()):
+                    self._indice, self._matriz = indice, matriz
+            except (OSError, ValueError) as e:
+                print(f"⚠️ Caché de features ilegible, se regenera: {e}")
+
+    def __len__(self):
+        return len(self._indice)
+
+    def obtener(self, hash_archivo):
+        fila = self._indice.get(hash_archivo)
+        return None if fila is None else np.array(self._matriz[fila])
+
+    def guardar(self, nuevas):
+        """Añade {sha256: features} y reescribe matriz e índice de forma atómica"""
+        nuevas = {h: f for h, f in nuevas.items() if h not in self._indice}
+        if not nuevas:
+            return
+        os.makedirs(os.path.dirname(self.ruta_matriz), exist_ok=True)
+
+        indice = dict(self._indice)
+        for hash_archivo in nuevas:
+            indice[hash_archivo] = len(indice)
+        matriz = np.concatenate([np.asarray(self._matriz), np.array(list(nuevas.values()))])
+
+        with open(self.ruta_matriz + ".tmp", "wb") as f:
+            np.save(f, matriz)
+        os.replace(self.ruta_matriz + ".tmp", self.ruta_matriz)
+        with open(self.ruta_indice + ".tmp", "w") as f:
+            json.dump(indice, f)
+        os.replace(self.ruta_indice + ".tmp", self.ruta_indice)
+
+        self._indice = indice
+        self._matriz = np.load(self.ruta_matriz, mmap_mode="r")
+
+
+def extraer_archivo(ruta):
+    """Worker: (features | None, error | None). Corre en otro proceso"""
+    try:
+        y, _ = cargar_audio(ruta)
+        return features_de_senal(y), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+def extraer_con_cache(rutas, procesos=None, cache=None):
+    """
+    Features de cada ruta (None si no se pudo procesar), en el mismo orden.
+    Solo se decodifican los archivos que no están en la caché, repartidos
+    entre `procesos` procesos (None = todos los núcleos).
+    """
+    cache = cache if cache is not None else CacheFeatures()
+    hashes = [sha256_archivo(ruta) for ruta in rutas]
+
+    resultado = [cache.obtener(h) for h in hashes]
+    pendientes = {}
+    for i, (features, hash_archivo) in enumerate(zip(resultado, hashes)):
+        if features is None:
+            # Archivos duplicados: se procesan una sola vez
+            pendientes.setdefault(hash_archivo, []).append(i)
+
+    print(f"💾 Caché de features: {len(rutas) - sum(map(len, pendientes.values()))} "
+          f"de {len(rutas)} audios; extrayendo {len(pendientes)}")
+    if not pendientes:
+        return resultado
+
+    nuevas = {}
+    orden = [indices[0] for indices in pendientes.values()]
+    with ProcessPoolExecutor(max_workers=procesos) as pool:
+        extraidas = pool.map(extraer_archivo, [rutas[i] for i in orden], chunksize=4)
+        for (hash_archivo, indices), (features, error) in zip(pendientes.items(), extraidas):
+            if features is None:
+                print(f"❌ Error procesando {rutas[indices[0]]}: {error}")
+                continue
+            nuevas[hash_archivo] = features
+            for i in indices:
+                resultado[i] = features
+
+    cache.guardar(nuevas)
+    return resultado
@@ -0,0 +1,99 @@
+"""
+Comparación sklearn vs bosque compilado (bosque_compilado.py):
+    - arranque: proceso nuevo que importa y carga el modelo
+    - latencia de una predicción (17 features) p50/p95
+    - igualdad exacta de probabilidades y clases
+
+Uso (desde la raíz del repo, tras entrenar_modelo.py):
+    python DeteccionAudio/comparar_bosque.py
+    python DeteccionAudio/comparar_bosque.py --repeticiones 500 --muestras 20000
+"""
+
+import argparse
+import os
+import pickle
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BASE_DIR)
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+from DeteccionAudio.bosque_compilado import BosqueCompilado
+from DeteccionAudio.entrenar_modelo import BOSQUE_PATH, MODELO_PATH, cargar_dataset
+
+ARRANQUE = {
+    "sklearn": f"import pickle; pickle.load(open({MODELO_PATH!r}, 'rb'))",
+    "compilado": (
+        f"import sys; sys.path.append({ROOT_DIR!r}); "
+        "from DeteccionAudio.bosque_compilado import BosqueCompilado; "
+        f"BosqueCompilado.cargar({BOSQUE_PATH!r})"
+    ),
+}
+
+
+def medir_arranque(codigo, veces):
+    """Mediana (s) de lanzar un intérprete que importa y carga el modelo"""
+    tiempos = []
+    for _ in range(veces):
+        inicio = time.perf_counter()
+        subprocess.run([sys.executable, "-c", codigo], check=True)
+        tiempos.append(time.perf_counter() - inicio)
+    return float(np.median(tiempos))
+
+
+def medir_latencia(predecir, x, repeticiones):
+    predecir(x)                 # calentamiento
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        predecir(x)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return {f"p{p}": round(float(np.percentile(tiempos, p)), 3) for p in (50, 95)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara el Random Forest de sklearn con el compilado")
+    parser.add_argument("--repeticiones", type=int, default=200)
+    parser.add_argument("--arranques", type=int, default=5)
+    parser.add_argument("--muestras", type=int, default=5000,
+                        help="vectores perturbados extra para comprobar igualdad")
+    args = parser.parse_args()
+
+    with open(MODELO_PATH, "rb") as f:
+        sklearn_modelo = pickle.load(f)
+    bosque = BosqueCompilado.cargar(BOSQUE_PATH)
+
+    # Igualdad: features del dataset (caché) y variaciones alrededor de ellas
+    X, _ = cargar_dataset()
+    rng = np.random.default_rng(0)
+    ruido = 1 + 0.3 * rng.standard_normal((args.muestras, X.shape[1]))
+    X = np.concatenate([X, X[rng.integers(0, len(X), args.muestras)] * ruido])
+    iguales_proba = np.array_equal(sklearn_modelo.predict_proba(X), bosque.predict_proba(X))
+    iguales_clase = np.array_equal(sklearn_modelo.predict(X), bosque.predict(X))
+
+    x = X[0]
+    latencia_sklearn = medir_latencia(
+        lambda v: (sklearn_modelo.predict([v]), sklearn_modelo.predict_proba([v])), x, args.repeticiones
+    )
+    latencia_bosque = medir_latencia(lambda v: bosque.predecir(v), x, args.repeticiones)
+
+    print("\n" + "=" * 60)
+    print("🌲 SKLEARN vs BOSQUE COMPILADO")
+    print("=" * 60)
+    print(f"✅ Probabilidades idénticas ({len(X)} vectores): {iguales_proba}")
+    print(f"✅ Clases idénticas: {iguales_clase}")
+    for nombre, codigo in ARRANQUE.items():
+        print(f"🚀 Arranque {nombre:<10} {medir_arranque(codigo, args.arranques):.2f} s")
+    print(f"⏱ Latencia sklearn    (predict + predict_proba): {latencia_sklearn} ms")
+    print(f"⏱ Latencia compilado  (una pasada):              {latencia_bosque} ms")
+    print(f"💾 Tamaño: pkl {os.path.getsize(MODELO_PATH) / 1024:.0f} KB, "
+          f"npz {os.path.getsize(BOSQUE_PATH) / 1024:.0f} KB")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,45 +2,77 @@
 DETECTOR DE INCENDIOS POR AUDIO
 Módulo independiente para analizar archivos de audio
 Uso: detectar_incendio("audio_prueba.wav")
+     detectar_incendio(wav_bytes)          # audio codificado en memoria
+     detectar_incendio((y, sr))            # señal ya decodificada
+Muchos archivos a la vez: puntuar_audios.py (directorios o globs)
 """
 
-import librosa
 import numpy as np
 import pickle
 import os
+import sys
 
-# Cargar modelo entrenado
-MODELO_PATH = "modelo_incendio.pkl"
+# Modelo entrenado, junto a este archivo (independiente del directorio actual)
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODELO_PATH = os.path.join(BASE_DIR, "modelo_incendio.pkl")
+# Mismo bosque aplanado a arrays de NumPy (entrenar_modelo.py lo exporta);
+# si existe se usa este: no necesita scikit-learn y predice mucho más rápido
+BOSQUE_PATH = os.path.join(BASE_DIR, "modelo_incendio.npz")
+
+# registro_modelos.py está en la raíz del repo (compartido con DeteccionImagen)
+ROOT_DIR = os.path.dirname(BASE_DIR)
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+from registro_modelos import registro
+from DeteccionAudio.features_audio import cargar_audio, features_de_senal
+from DeteccionAudio.bosque_compilado import BosqueCompilado
+
+def cargar_modelo(ruta):
+    if ruta.endswith(".npz"):
+        return BosqueCompilado.cargar(ruta)
+    with open(ruta, 'rb') as f:
+        return pickle.load(f)
+
+def ruta_modelo():
+    """El bosque compilado si está exportado; si no, el pickle de sklearn"""
+    return BOSQUE_PATH if os.path.exists(BOSQUE_PATH) else MODELO_PATH
+
+# Se carga una sola vez por proceso y se recarga si se reentrena
+registro.registrar("audio_incendio", ruta_modelo(), cargar_modelo)
 
 def extraer_features(archivo_audio):
     """
     Extrae características del audio (igual que en entrenamiento)
+    Acepta ruta, bytes codificados o señal decodificada (ver cargar_audio)
     """
     try:
-        y, sr = librosa.load(archivo_audio, duration=5)
+        y, sr = cargar_audio(archivo_audio)
         
-        # Extraer características
-        mfcc = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13)
-        mfcc_mean = np.mean(mfcc, axis=1)
-        centroid = np.mean(librosa.feature.spectral_centroid(y=y, sr=sr))
-        zcr = np.mean(librosa.feature.zero_crossing_rate(y))
-        rms = np.mean(librosa.feature.rms(y=y))
-        rolloff = np.mean(librosa.feature.spectral_rolloff(y=y, sr=sr))
-        
-        features = np.concatenate([mfcc_mean, [centroid, zcr, rms, rolloff]])
-        return features
+        # Las 17 características a partir de una sola STFT (features_audio.py)
+        return features_de_senal(y)
         
     except Exception as e:
         print(f"❌ Error procesando audio: {e}")
         return None
 
+def probabilidad_incendio(features):
+    """
+    Probabilidad (0-1) de la clase incendio para un vector de features ya
+    extraído (p. ej. por DetectorAudioStream en stream_audio.py)
+    """
+    modelo = registro.obtener("audio_incendio")
+    probabilidades = modelo.predict_proba([features])[0]
+    return float(probabilidades[list(modelo.classes_).index(1)])
+
 def detectar_incendio(ruta_audio):
     """
     FUNCIÓN PRINCIPAL
-    Analiza un archivo de audio y determina si hay incendio
+    Analiza un audio y determina si hay incendio
     
     Args:
-        ruta_audio (str): Ruta al archivo de audio (.wav, .mp3, etc)
+        ruta_audio (str | bytes | tuple): Ruta al archivo de audio (.wav, .mp3, etc),
+            bytes del archivo en memoria o tupla (y, sr) ya decodificada
     
     Returns:
         dict: {
@@ -50,8 +82,9 @@ def detectar_incendio(ruta_audio):
         }
     """
     
-    # Verificar que existe el audio
-    if not os.path.exists(ruta_audio):
+    # Verificar que existe el audio (solo si es una ruta)
+    en_memoria = isinstance(ruta_audio, (bytes, bytearray, memoryview, tuple, np.ndarray))
+    if not en_memoria and not os.path.exists(ruta_audio):
         return {
             "incendio_detectado": False,
             "confianza": 0.0,
@@ -59,17 +92,16 @@ def detectar_incendio(ruta_audio):
         }
     
     # Verificar que existe el modelo
-    if not os.path.exists(MODELO_PATH):
+    if not os.path.exists(registro.info()["audio_incendio"]["ruta"]):
         return {
             "incendio_detectado": False,
             "confianza": 0.0,
             "mensaje": "❌ Modelo no entrenado. Ejecuta entrenar_modelo.py primero"
         }
     
-    # Cargar modelo
+    # Modelo compartido (cargado una vez, recargado si cambia el archivo)
     try:
-        with open(MODELO_PATH, 'rb') as f:
-            modelo = pickle.load(f)
+        modelo = registro.obtener("audio_incendio")
     except Exception as e:
         return {
             "incendio_detectado": False,
@@ -78,7 +110,7 @@ def detectar_incendio(ruta_audio):
         }
     
     # Extraer características del audio
-    print(f"🔍 Analizando: {ruta_audio}...")
+    print(f"🔍 Analizando: {'audio en memoria' if en_memoria else ruta_audio}...")
     features = extraer_features(ruta_audio)
     
     if features is None:
@@ -88,10 +120,11 @@ def detectar_incendio(ruta_audio):
             "mensaje": "❌ No se pudo procesar el audio"
         }
     
-    # Predecir
-    prediccion = modelo.predict([features])[0]
+    # Predecir: clase y probabilidad en una sola pasada (predict = argmax de predict_proba)
     probabilidades = modelo.predict_proba([features])[0]
-    confianza = probabilidades[prediccion]
+    indice = int(np.argmax(probabilidades))
+    prediccion = modelo.classes_[indice]
+    confianza = probabilidades[indice]
     
     # Resultado
     es_incendio = bool(prediccion == 1)
@@ -4,73 +4,46 @@ Ejecutar DESPUÉS de descargar_dataset.py
 """
 
 import os
-import librosa
+import sys
+import time
 import numpy as np
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score, classification_report
 import pickle
 
-def extraer_features(archivo_audio):
-    """
-    Extrae características importantes del audio para ML
-    """
-    try:
-        # Cargar audio
-        y, sr = librosa.load(archivo_audio, duration=5)
-        
-        # Características importantes para detectar fuego:
-        # 1. MFCC - Captura textura del sonido (crepitar)
-        mfcc = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13)
-        mfcc_mean = np.mean(mfcc, axis=1)
-        
-        # 2. Spectral Centroid - Brillo del sonido
-        centroid = np.mean(librosa.feature.spectral_centroid(y=y, sr=sr))
-        
-        # 3. Zero Crossing Rate - Cambios rápidos (crepitar)
-        zcr = np.mean(librosa.feature.zero_crossing_rate(y))
-        
-        # 4. RMS Energy - Intensidad del sonido
-        rms = np.mean(librosa.feature.rms(y=y))
-        
-        # 5. Spectral Rolloff - Energía en altas frecuencias
-        rolloff = np.mean(librosa.feature.spectral_rolloff(y=y, sr=sr))
-        
-        # Combinar todas las features
-        features = np.concatenate([mfcc_mean, [centroid, zcr, rms, rolloff]])
-        return features
-        
-    except Exception as e:
-        print(f"❌ Error procesando {archivo_audio}: {e}")
-        return None
+# Mismos archivos que carga detector_audio_incendio.py
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODELO_PATH = os.path.join(BASE_DIR, "modelo_incendio.pkl")
+BOSQUE_PATH = os.path.join(BASE_DIR, "modelo_incendio.npz")
+
+# Los módulos de DeteccionAudio se importan como paquete desde la raíz del repo
+ROOT_DIR = os.path.dirname(BASE_DIR)
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
 
-def cargar_dataset():
+from DeteccionAudio.cache_features import extraer_con_cache
+from DeteccionAudio.bosque_compilado import exportar_bosque
+
+def cargar_dataset(procesos=None):
     """
     Carga todos los audios y extrae sus características
+    (en paralelo y reutilizando la caché de features: ver cache_features.py)
     """
-    X = []  # Features
-    y = []  # Labels (0=no incendio, 1=incendio)
-    
-    print("🔍 Procesando audios de INCENDIO...")
-    carpeta_incendio = "dataset/incendio"
-    for archivo in os.listdir(carpeta_incendio):
-        ruta = os.path.join(carpeta_incendio, archivo)
-        features = extraer_features(ruta)
-        if features is not None:
-            X.append(features)
-            y.append(1)  # Etiqueta: SÍ es incendio
-            print(f"  ✅ {archivo}")
-    
-    print("\n🔍 Procesando audios NORMALES...")
-    carpeta_normal = "dataset/no_incendio"
-    for archivo in os.listdir(carpeta_normal):
-        ruta = os.path.join(carpeta_normal, archivo)
-        features = extraer_features(ruta)
-        if features is not None:
-            X.append(features)
-            y.append(0)  # Etiqueta: NO es incendio
-            print(f"  ✅ {archivo}")
-    
+    rutas = []
+    etiquetas = []  # Labels (0=no incendio, 1=incendio)
+    for carpeta, etiqueta in (("dataset/incendio", 1), ("dataset/no_incendio", 0)):
+        for archivo in sorted(os.listdir(carpeta)):
+            rutas.append(os.path.join(carpeta, archivo))
+            etiquetas.append(etiqueta)
+
+    print(f"🔍 Procesando {len(rutas)} audios...")
+    inicio = time.perf_counter()
+    features = extraer_con_cache(rutas, procesos)
+    print(f"⏱ Features listas en {time.perf_counter() - inicio:.1f} s")
+
+    X = [f for f in features if f is not None]  # Features
+    y = [e for f, e in zip(features, etiquetas) if f is not None]
     return np.array(X), np.array(y)
 
 def entrenar_modelo():
@@ -114,12 +87,31 @@ def entrenar_modelo():
     print(classification_report(y_test, y_pred, 
                                 target_names=['No Incendio', 'Incendio']))
     
-    # Guardar modelo entrenado
-    with open('modelo_incendio.pkl', 'wb') as f:
+    # Guardar modelo entrenado junto al detector. Escritura atómica:
+    # detector_audio_incendio lo recarga en caliente y nunca debe leer
+    # un archivo a medio escribir
+    with open(MODELO_PATH + '.tmp', 'wb') as f:
         pickle.dump(modelo, f)
+    os.replace(MODELO_PATH + '.tmp', MODELO_PATH)
     
-    print("\n💾 Modelo guardado como 'modelo_incendio.pkl'")
+    print(f"\n💾 Modelo guardado como '{MODELO_PATH}'")
+    exportar_modelo(modelo)
     print("✅ ¡Listo para usar en detector_audio_incendio.py!")
 
+def exportar_modelo(modelo=None):
+    """
+    Aplana el bosque a arrays de NumPy (bosque_compilado.py) para
+    predecir sin scikit-learn. Sin modelo, exporta el .pkl guardado
+    """
+    if modelo is None:
+        with open(MODELO_PATH, 'rb') as f:
+            modelo = pickle.load(f)
+    exportar_bosque(modelo, BOSQUE_PATH)
+    print(f"💾 Bosque compilado guardado como '{BOSQUE_PATH}'")
+
 if __name__ == "__main__":
-    entrenar_modelo()
\ No newline at end of file
+    # --exportar: solo regenerar el .npz a partir del .pkl existente
+    if "--exportar" in sys.argv[1:]:
+        exportar_modelo()
+    else:
+        entrenar_modelo()
\ No newline at end of file
@@ -0,0 +1,150 @@
+"""
+MOTOR DE FEATURES DE AUDIO
+Las 17 características del modelo (13 MFCC + centroide, ZCR, RMS y
+rolloff) a partir de UNA sola STFT, con NumPy vectorizado.
+
+Reproduce los valores de las llamadas separadas a librosa.feature.*
+(n_fft=2048, hop=512, ventana Hann, center=True) dentro de la
+tolerancia numérica, así que modelo_incendio.pkl sigue siendo válido.
+
+Lo comparten detector_audio_incendio.py y entrenar_modelo.py.
+"""
+
+import hashlib
+import io
+
+import librosa
+import numpy as np
+import scipy.fft
+import scipy.signal
+
+# Frecuencia y duración usadas en entrenamiento (valores por defecto de librosa.load)
+SR_MODELO = 22050
+DURACION = 5
+
+# Parámetros por defecto de librosa.feature.*
+N_FFT = 2048
+HOP = 512
+N_MELS = 128
+N_MFCC = 13
+ROLL_PERCENT = 0.85
+TOP_DB = 80.0
+AMIN = 1e-10
+
+# Remuestreo al cargar (soxr). Los modos de menor calidad ("soxr_qq",
+# "soxr_lq", "polyphase") alteran la banda alta lo suficiente como para
+# mover los MFCC varias unidades, así que se mantiene el de librosa.load
+RES_TYPE = "soxr_hq"
+
+# Versión de las features: cambia con cualquier parámetro de arriba (o al
+# subir el número a mano si cambia el código), e invalida la caché de
+# features de entrenamiento (cache_features.py)
+VERSION_FEATURES = hashlib.sha256(repr((
+    1, SR_MODELO, DURACION, N_FFT, HOP, N_MELS, N_MFCC, ROLL_PERCENT, TOP_DB, AMIN, RES_TYPE
+)).encode()).hexdigest()[:12]
+
+NOMBRES_FEATURES = [f"mfcc_{i}" for i in range(N_MFCC)] + ["centroid", "zcr", "rms", "rolloff"]
+
+# Constantes precalculadas (dependen solo de SR_MODELO y N_FFT)
+_VENTANA = scipy.signal.get_window("hann", N_FFT, fftbins=True).astype(np.float32)
+_FRECUENCIAS = np.fft.rfftfreq(N_FFT, 1.0 / SR_MODELO)
+_MEL = librosa.filters.mel(sr=SR_MODELO, n_fft=N_FFT, n_mels=N_MELS)
+_DCT = scipy.fft.dct(np.eye(N_MELS), type=2, norm="ortho", axis=0)[:N_MFCC]
+
+
+def cargar_audio(audio):
+    """
+    Devuelve (y, sr) a SR_MODELO a partir de:
+        - ruta a un archivo
+        - bytes de un archivo codificado (wav, flac, ogg...)
+        - tupla (y, sr) o ndarray (se asume SR_MODELO)
+
+    Los archivos se leen a su frecuencia nativa y se remuestrean con RES_TYPE.
+    """
+    if isinstance(audio, tuple):
+        y, sr = audio
+        y = np.asarray(y, dtype=np.float32)
+        if y.ndim > 1:
+            y = librosa.to_mono(y)
+        y = y[:int(sr * DURACION)]
+        if sr != SR_MODELO:
+            y = librosa.resample(y, orig_sr=sr, target_sr=SR_MODELO, res_type=RES_TYPE)
+        return y[:SR_MODELO * DURACION], SR_MODELO
+    if isinstance(audio, np.ndarray):
+        return cargar_audio((audio, SR_MODELO))
+    if isinstance(audio, (bytes, bytearray, memoryview)):
+        audio = io.BytesIO(audio)
+    return cargar_audio(librosa.load(audio, sr=None, mono=True, duration=DURACION))
+
+
+def enmarcar(y, modo="constant"):
+    """Frames (T, N_FFT) centrados como librosa (center=True), sin copiar la señal"""
+    y = np.pad(y, N_FFT // 2, mode=modo)
+    return np.lib.stride_tricks.sliding_window_view(y, N_FFT)[::HOP]
+
+
+def features_por_frame(y):
+    """
+    Cantidades por frame de las que salen las 17 features:
+        mel (N_MELS, T)  potencia mel
+        centroid, zcr, rms, rolloff  (T,)
+    """
+    y = np.asarray(y, dtype=np.float32)
+    # ZCR: librosa rellena repitiendo los extremos (el resto, con ceros)
+    return features_de_frames(enmarcar(y), enmarcar(y, modo="edge"))
+
+
+def features_de_frames(frames, frames_zcr=None):
+    """
+    Igual que features_por_frame pero a partir de frames (T, N_FFT) ya
+    extraídos; frames_zcr son los frames para el ZCR si difieren.
+    """
+    if frames_zcr is None:
+        frames_zcr = frames
+
+    # Una sola STFT (magnitud) para centroide, rolloff y mel
+    magnitud = np.abs(np.fft.rfft(frames * _VENTANA, axis=1)).T
+    mel = _MEL @ (magnitud ** 2)
+
+    total = magnitud.sum(axis=0)
+    centroid = (_FRECUENCIAS @ magnitud) / np.maximum(total, np.finfo(magnitud.dtype).tiny)
+
+    acumulada = np.cumsum(magnitud, axis=0)
+    # Primera frecuencia cuya energía acumulada alcanza el ROLL_PERCENT del total
+    indice = np.argmax(acumulada >= ROLL_PERCENT * acumulada[-1], axis=0)
+    rolloff = _FRECUENCIAS[indice]
+
+    # RMS en el dominio del tiempo sobre los mismos frames (sin ventana)
+    rms = np.sqrt(np.mean(frames.astype(np.float64) ** 2, axis=1))
+
+    # ZCR: no cuenta la primera muestra de cada frame; |x| <= 1e-10 es cero
+    signo = np.signbit(np.where(np.abs(frames_zcr) <= 1e-10, 0, frames_zcr))
+    zcr = np.count_nonzero(signo[:, 1:] != signo[:, :-1], axis=1) / N_FFT
+
+    return mel, centroid, zcr, rms, rolloff
+
+
+def agregar_features(mel, centroid, zcr, rms, rolloff):
+    """Vector de 17 features (medias sobre los frames de la ventana)"""
+    db = 10.0 * np.log10(np.maximum(AMIN, mel))
+    db = np.maximum(db, db.max() - TOP_DB)
+    mfcc = _DCT @ db
+    return np.concatenate([
+        mfcc.mean(axis=1),
+        [centroid.mean(), zcr.mean(), rms.mean(), rolloff.mean()],
+    ])
+
+
+def features_de_senal(y):
+    """17 features de una señal mono a SR_MODELO"""
+    return agregar_features(*features_por_frame(y))
+
+
+def extraer_features_librosa(y, sr=SR_MODELO):
+    """Implementación original con librosa (referencia para comprobar tolerancias)"""
+    mfcc = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=N_MFCC)
+    centroid = np.mean(librosa.feature.spectral_centroid(y=y, sr=sr))
+    zcr = np.mean(librosa.feature.zero_crossing_rate(y))
+    rms = np.mean(librosa.feature.rms(y=y))
+    rolloff = np.mean(librosa.feature.spectral_rolloff(y=y, sr=sr))
+    return np.concatenate([np.mean(mfcc, axis=1), [centroid, zcr, rms, rolloff]])
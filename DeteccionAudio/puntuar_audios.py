@@ -0,0 +1,181 @@
+"""
+PUNTUACIÓN MASIVA DE AUDIOS
+Analiza directorios o globs completos con el detector de audio en un
+solo proceso (p. ej. un día de evidencias archivadas o las muestras de
+un proveedor nuevo):
+
+    - decodificación y features en paralelo (un proceso por núcleo)
+    - clasificación vectorizada por lotes (bosque compilado)
+    - resultados en streaming a CSV o JSONL (según la extensión)
+    - reanudable: los audios ya puntuados en la salida se saltan (los que
+      dieron error se reintentan)
+    - informe de rendimiento (audios/s)
+
+Uso (desde la raíz del repo):
+    python DeteccionAudio/puntuar_audios.py evidencias/ --salida resultados.csv
+    python DeteccionAudio/puntuar_audios.py "proveedor/**/*.wav" --salida r.jsonl --procesos 8
+"""
+
+import argparse
+import csv
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BASE_DIR)
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+from DeteccionAudio.cache_features import extraer_archivo
+from DeteccionAudio.detector_audio_incendio import registro
+
+EXTENSIONES = (".wav", ".mp3", ".flac", ".ogg", ".m4a", ".aac")
+COLUMNAS = ["ruta", "incendio_detectado", "probabilidad_incendio", "confianza", "error"]
+
+
+def buscar_audios(entradas):
+    """Rutas de audio (ordenadas, sin duplicados) a partir de archivos, directorios o globs"""
+    rutas = []
+    for entrada in entradas:
+        if os.path.isdir(entrada):
+            for raiz, _, archivos in os.walk(entrada):
+                rutas.extend(os.path.join(raiz, a) for a in archivos if a.lower().endswith(EXTENSIONES))
+        elif os.path.isfile(entrada):
+            rutas.append(entrada)
+        else:
+            rutas.extend(r for r in glob.glob(entrada, recursive=True) if os.path.isfile(r))
+    return sorted(set(os.path.normpath(r) for r in rutas))
+
+
+class Salida:
+    """Escritura incremental en CSV o JSONL; reanuda una salida existente"""
+
+    def __init__(self, ruta, formato=None):
+        self.ruta = ruta
+        self.formato = formato or ("jsonl" if ruta.endswith((".jsonl", ".json")) else "csv")
+        self.hechas = self._leer_hechas()
+        nueva = not os.path.exists(ruta) or os.path.getsize(ruta) == 0
+        self._archivo = open(ruta, "a", newline="", encoding="utf-8")
+        if self.formato == "csv":
+            self._csv = csv.DictWriter(self._archivo, fieldnames=COLUMNAS)
+            if nueva:
+                self._csv.writeheader()
+
+    def _leer_hechas(self):
+        if not os.path.exists(self.ruta):
+            return set()
+        # Una interrupción puede dejar la última línea a medias: se descarta
+        with open(self.ruta, "rb+") as f:
+            contenido = f.read()
+            completo = contenido[:contenido.rfind(b"\n") + 1]
+            if len(completo) != len(contenido):
+                f.truncate(len(completo))
+        lineas = completo.decode("utf-8").splitlines()
+        if self.formato == "csv":
+            filas = csv.DictReader(lineas)
+        else:
+            filas = (json.loads(linea) for linea in lineas if linea.strip())
+        # Los audios que fallaron se vuelven a intentar al reanudar
+        return {fila["ruta"] for fila in filas if not fila.get("error")}
+
+    def escribir(self, filas):
+        for fila in filas:
+            if self.formato == "csv":
+                self._csv.writerow(fila)
+            else:
+                self._archivo.write(json.dumps(fila, ensure_ascii=False) + "\n")
+        # Cada lote queda en disco: si se interrumpe, se reanuda desde aquí
+        self._archivo.flush()
+
+    def cerrar(self):
+        self._archivo.close()
+
+
+def clasificar_lote(modelo, lote):
+    """Filas de resultado de [(ruta, features | None, error | None)] con una sola predicción"""
+    validas = [i for i, (_, features, _) in enumerate(lote) if features is not None]
+    probabilidades = modelo.predict_proba(np.array([lote[i][1] for i in validas])) if validas else []
+    clase_incendio = list(modelo.classes_).index(1)
+
+    filas = []
+    por_indice = dict(zip(validas, probabilidades))
+    for i, (ruta, _, error) in enumerate(lote):
+        fila = dict.fromkeys(COLUMNAS, "")
+        fila["ruta"] = ruta
+        if i in por_indice:
+            p = por_indice[i]
+            indice = int(np.argmax(p))
+            fila["incendio_detectado"] = bool(modelo.classes_[indice] == 1)
+            fila["probabilidad_incendio"] = round(float(p[clase_incendio]), 4)
+            fila["confianza"] = round(float(p[indice]), 4)
+        else:
+            fila["error"] = error
+        filas.append(fila)
+    return filas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Puntúa en lote audios con el detector de incendios")
+    parser.add_argument("entradas", nargs="+", help="archivos, directorios o globs ('**' recursivo)")
+    parser.add_argument("--salida", required=True, help="CSV o JSONL (se reanuda si ya existe)")
+    parser.add_argument("--formato", choices=["csv", "jsonl"], default=None)
+    parser.add_argument("--procesos", type=int, default=None, help="procesos de decodificación (todos los núcleos)")
+    parser.add_argument("--lote", type=int, default=256, help="audios por predicción vectorizada")
+    args = parser.parse_args()
+
+    rutas = buscar_audios(args.entradas)
+    salida = Salida(args.salida, args.formato)
+    pendientes = [r for r in rutas if r not in salida.hechas]
+    print(f"🔍 {len(rutas)} audios encontrados, {len(rutas) - len(pendientes)} ya puntuados, "
+          f"{len(pendientes)} pendientes")
+    if not pendientes:
+        salida.cerrar()
+        return
+
+    modelo = registro.obtener("audio_incendio")
+    inicio = time.perf_counter()
+    hechos = errores = incendios = 0
+    lote = []
+    try:
+        with ProcessPoolExecutor(max_workers=args.procesos) as pool:
+            extraidas = pool.map(extraer_archivo, pendientes, chunksize=8)
+            for ruta, (features, error) in zip(pendientes, extraidas):
+                lote.append((ruta, features, error))
+                if len(lote) < args.lote:
+                    continue
+                filas = clasificar_lote(modelo, lote)
+                salida.escribir(filas)
+                hechos += len(filas)
+                errores += sum(1 for f in filas if f["error"])
+                incendios += sum(1 for f in filas if f["incendio_detectado"] is True)
+                lote = []
+                transcurrido = time.perf_counter() - inicio
+                print(f"  ⏱ {hechos}/{len(pendientes)} audios ({hechos / transcurrido:.1f} audios/s)")
+
+            if lote:
+                filas = clasificar_lote(modelo, lote)
+                salida.escribir(filas)
+                hechos += len(filas)
+                errores += sum(1 for f in filas if f["error"])
+                incendios += sum(1 for f in filas if f["incendio_detectado"] is True)
+    except KeyboardInterrupt:
+        print("\n⛔ Interrumpido: vuelve a ejecutar el mismo comando para continuar")
+    finally:
+        salida.cerrar()
+
+    transcurrido = time.perf_counter() - inicio
+    print("\n" + "=" * 60)
+    print(f"✅ {hechos} audios puntuados en {transcurrido:.1f} s "
+          f"({hechos / max(transcurrido, 1e-9):.1f} audios/s)")
+    print(f"🔥 Incendio: {incendios}   ❌ Errores: {errores}")
+    print(f"💾 Resultados en {args.salida}")
+
+
+if __name__ == "__main__":
+    main()
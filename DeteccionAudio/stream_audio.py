@@ -0,0 +1,186 @@
+"""
+DETECCIÓN CONTINUA DE INCENDIO POR AUDIO
+Consume PCM en trozos (p. ej. el stream audio.wav de la cámara) y cada
+salto (~0.5 s) emite la probabilidad de incendio de la última ventana
+de DURACION segundos.
+
+Los frames interiores de la STFT se calculan una sola vez al llegar el
+audio y se reutilizan en todas las ventanas que los contienen; por
+ventana solo se recalculan los pocos frames de los bordes (los que
+librosa rellena con ceros), así que las features coinciden con las de
+extraer_features sobre esos mismos DURACION segundos.
+"""
+
+import threading
+import time
+from collections import deque, namedtuple
+
+import numpy as np
+import soxr
+
+from DeteccionAudio.features_audio import (
+    DURACION, HOP, N_FFT, SR_MODELO, agregar_features, enmarcar, features_de_frames
+)
+
+ResultadoAudio = namedtuple("ResultadoAudio", ["timestamp", "probabilidad", "features"])
+
+# Salto entre ventanas en frames de la STFT: 22 * 512 muestras ≈ 0.51 s.
+# Debe ser múltiplo de HOP para que los frames de ventanas sucesivas coincidan
+FRAMES_POR_SALTO = 22
+
+_DTYPES_PCM = {1: np.uint8, 2: np.int16, 4: np.int32}
+
+
+class DetectorAudioStream:
+    """
+    clasificar(features) -> probabilidad de incendio (0-1).
+    al_resultado(ResultadoAudio) se llama en el hilo que aporta el audio.
+
+    La memoria está acotada: una ventana de muestras más un frame, y las
+    features de los frames de una ventana.
+    """
+
+    def __init__(self, clasificar, sr_entrada=SR_MODELO, duracion=DURACION,
+                 frames_por_salto=FRAMES_POR_SALTO, al_resultado=None):
+        self.clasificar = clasificar
+        self.al_resultado = al_resultado
+
+        self.muestras_ventana = int(SR_MODELO * duracion)
+        self.salto = frames_por_salto * HOP
+        self._frames_ventana = 1 + self.muestras_ventana // HOP
+        # Frames de la ventana cuyo soporte no sale de ella (los demás
+        # llevan relleno y se calculan aparte en cada ventana)
+        mitad = N_FFT // 2
+        self._interiores = [
+            t for t in range(self._frames_ventana)
+            if t * HOP - mitad >= 0 and t * HOP + mitad <= self.muestras_ventana
+        ]
+        self._bordes = [t for t in range(self._frames_ventana) if t not in self._interiores]
+
+        self._lock = threading.Lock()
+        self._ultimo = None
+        self._reiniciar(sr_entrada)
+
+    def _reiniciar(self, sr_entrada):
+        """Vacía el estado (al empezar o si cambia el formato de entrada)"""
+        self.sr_entrada = sr_entrada
+        self._resampler = None
+        if sr_entrada != SR_MODELO:
+            self._resampler = soxr.ResampleStream(sr_entrada, SR_MODELO, 1, dtype="float32")
+        self._resto = b""               # bytes de una muestra incompleta
+        self._muestras = np.zeros(0, dtype=np.float32)
+        self._inicio = 0                # índice global de self._muestras[0]
+        self._recibidas = 0             # muestras totales recibidas (a SR_MODELO)
+        self._siguiente_frame = self._interiores[0] if self._interiores else 0
+        self._frames = deque()          # (índice global, mel, centroid, zcr, rms, rolloff)
+        self._siguiente_ventana = 0     # índice global de inicio de la próxima ventana
+
+    # ---------------- entrada ----------------
+
+    def agregar_pcm(self, datos, canales=1, bytes_muestra=2, frecuencia=None):
+        """
+        Añade PCM entero intercalado tal como llega del WAV de la cámara
+        (los trozos pueden cortar una muestra por la mitad).
+        Si cambia la frecuencia de entrada se empieza de cero.
+        """
+        if frecuencia is not None and frecuencia != self.sr_entrada:
+            with self._lock:
+                self._reiniciar(frecuencia)
+
+        datos = self._resto + bytes(datos)
+        usable = len(datos) - len(datos) % (canales * bytes_muestra)
+        self._resto = datos[usable:]
+        pcm = np.frombuffer(datos[:usable], dtype=_DTYPES_PCM[bytes_muestra]).astype(np.float32)
+        if bytes_muestra == 1:
+            pcm = (pcm - 128.0) / 128.0
+        else:
+            pcm /= float(2 ** (8 * bytes_muestra - 1))
+        if canales > 1:
+            pcm = pcm.reshape(-1, canales).mean(axis=1)
+        self.agregar_senal(pcm)
+
+    def agregar_senal(self, y):
+        """Añade muestras float mono (a sr_entrada) y emite las ventanas completas"""
+        y = np.asarray(y, dtype=np.float32)
+        with self._lock:
+            if self._resampler is not None:
+                y = self._resampler.resample_chunk(y)
+            if len(y) == 0:
+                return
+            self._muestras = np.concatenate([self._muestras, y])
+            self._recibidas += len(y)
+            self._calcular_frames()
+            resultados = self._emitir_ventanas()
+            self._recortar()
+
+        for resultado in resultados:
+            if self.al_resultado is not None:
+                self.al_resultado(resultado)
+
+    def ultimo(self, max_antiguedad=None):
+        """Último ResultadoAudio (o None si no hay / es más viejo que max_antiguedad)"""
+        resultado = self._ultimo
+        if resultado is None:
+            return None
+        if max_antiguedad is not None and time.time() - resultado.timestamp > max_antiguedad:
+            return None
+        return resultado
+
+    # ---------------- internos (con self._lock) ----------------
+
+    def _calcular_frames(self):
+        """Frames globales (centrados en múltiplos de HOP) con todo su soporte disponible"""
+        mitad = N_FFT // 2
+        ultimo = (self._recibidas - mitad) // HOP        # último centro completo
+        if ultimo < self._siguiente_frame:
+            return
+        centros = np.arange(self._siguiente_frame, ultimo + 1) * HOP
+        desde = centros[0] - mitad - self._inicio
+        segmento = self._muestras[desde:centros[-1] + mitad - self._inicio]
+        frames = np.lib.stride_tricks.sliding_window_view(segmento, N_FFT)[::HOP]
+
+        mel, centroid, zcr, rms, rolloff = features_de_frames(frames)
+        for i, indice in enumerate(range(self._siguiente_frame, ultimo + 1)):
+            self._frames.append((indice, mel[:, i], centroid[i], zcr[i], rms[i], rolloff[i]))
+        self._siguiente_frame = ultimo + 1
+
+    def _emitir_ventanas(self):
+        resultados = []
+        while self._recibidas >= self._siguiente_ventana + self.muestras_ventana:
+            inicio = self._siguiente_ventana
+            features = self._features_ventana(inicio)
+            resultado = ResultadoAudio(time.time(), float(self.clasificar(features)), features)
+            self._ultimo = resultado
+            resultados.append(resultado)
+            self._siguiente_ventana += self.salto
+        return resultados
+
+    def _features_ventana(self, inicio):
+        primer_frame = inicio // HOP
+        interiores = {primer_frame + t for t in self._interiores}
+        cache = [f for f in self._frames if f[0] in interiores]
+
+        # Frames de borde: con el relleno de librosa (ceros / repetición)
+        y = self._muestras[inicio - self._inicio:inicio - self._inicio + self.muestras_ventana]
+        bordes = features_de_frames(
+            enmarcar(y)[self._bordes],
+            enmarcar(y, modo="edge")[self._bordes]
+        )
+
+        mel = np.column_stack([bordes[0]] + [f[1][:, None] for f in cache])
+        por_frame = [
+            np.concatenate([bordes[k], [f[k + 1] for f in cache]]) for k in range(1, 5)
+        ]
+        return agregar_features(mel, *por_frame)
+
+    def _recortar(self):
+        """Descarta muestras y frames que ya no entran en ninguna ventana futura"""
+        inicio = self._siguiente_ventana
+        # Muestras: desde la próxima ventana o el soporte del próximo frame
+        conservar = min(inicio, self._siguiente_frame * HOP - N_FFT // 2)
+        if conservar > self._inicio:
+            self._muestras = self._muestras[conservar - self._inicio:]
+            self._inicio = conservar
+        primer_frame = inicio // HOP
+        while self._frames and self._frames[0][0] < primer_frame:
+            self._frames.popleft()
@@ -0,0 +1,295 @@
+"""
+Benchmark de precisión y latencia del detector sobre el split test
+(o valid) del dataset incluido.
+
+Cada combinación backend x tamaño de entrada x lote x hilos se ejecuta
+en un proceso nuevo (pico de RSS aislado) y reporta:
+    mAP50, mAP50-95, precisión y recall (a --conf, IoU 0.5),
+    latencia por lote p50/p95/p99, imágenes por segundo y pico de RSS.
+
+La latencia es de extremo a extremo (inferencia + postprocesado + NMS de
+merge_detections) para todos los backends: ultralytics hace su NMS dentro
+del modelo y onnx/openvino solo en merge_detections, así que medir solo
+predict_boxes no los compara igual. La parte de merge_detections se
+reporta aparte en nms_ms.
+
+Uso:
+    python benchmark.py
+    python benchmark.py --backends ultralytics onnx --imgsz 480 640 --batch-sizes 1 8 --threads 2 4
+    python benchmark.py --baseline results/benchmarks/benchmark_20240101_120000.json
+"""
+
+import argparse
+import glob
+import itertools
+import json
+import multiprocessing
+import os
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+import detector
+
+DATASET_DIR = os.path.join(detector.BASE_DIR, "datasets", "Converted_data_yolov8_format")
+OUTPUT_DIR = os.path.join(detector.BASE_DIR, "results", "benchmarks")
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+
+
+# ---------------- dataset ----------------
+
+def load_split(split, resize):
+    """[(frame, cajas reales (M, 4) x1 y1 x2 y2 en píxeles del frame)]"""
+    samples = []
+    for image_path in sorted(glob.glob(os.path.join(DATASET_DIR, split, "images", "*"))):
+        frame = cv2.imread(image_path)
+        if frame is None:
+            continue
+        if resize is not None:
+            frame = cv2.resize(frame, resize)
+        height, width = frame.shape[:2]
+
+        label_path = os.path.join(
+            DATASET_DIR, split, "labels", os.path.splitext(os.path.basename(image_path))[0] + ".txt"
+        )
+        boxes = []
+        if os.path.exists(label_path):
+            with open(label_path) as f:
+                for line in f:
+                    values = line.split()
+                    if len(values) < 5:
+                        continue
+                    cx, cy, w, h = (float(v) for v in values[1:5])
+                    boxes.append([
+                        (cx - w / 2) * width, (cy - h / 2) * height,
+                        (cx + w / 2) * width, (cy + h / 2) * height,
+                    ])
+        samples.append((frame, np.array(boxes, dtype=np.float32).reshape(-1, 4)))
+    return samples
+
+
+# ---------------- métricas ----------------
+
+def iou_matrix(a, b):
+    """IoU entre cada caja de a (N, 4) y de b (M, 4)"""
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def match(pred_boxes, pred_scores, gt_boxes):
+    """(N, T) booleano: predicción i es verdadero positivo con el umbral de IoU t"""
+    tp = np.zeros((len(pred_scores), len(IOU_THRESHOLDS)), dtype=bool)
+    if len(pred_scores) == 0 or len(gt_boxes) == 0:
+        return tp
+    ious = iou_matrix(pred_boxes, gt_boxes)
+    order = np.argsort(-pred_scores)
+    for t, threshold in enumerate(IOU_THRESHOLDS):
+        taken = np.zeros(len(gt_boxes), dtype=bool)
+        for i in order:
+            candidates = np.where(~taken & (ious[i] >= threshold))[0]
+            if len(candidates):
+                best = candidates[np.argmax(ious[i, candidates])]
+                taken[best] = True
+                tp[i, t] = True
+    return tp
+
+
+def average_precision(tp, scores, num_gt):
+    """AP con interpolación de 101 puntos (COCO) para una columna de tp"""
+    if num_gt == 0 or len(scores) == 0:
+        return 0.0
+    order = np.argsort(-scores)
+    tp_cum = np.cumsum(tp[order])
+    recall = tp_cum / num_gt
+    precision = tp_cum / np.arange(1, len(tp_cum) + 1)
+    precision = np.maximum.accumulate(precision[::-1])[::-1]
+    points = np.linspace(0, 1, 101)
+    indexes = np.searchsorted(recall, points, side="left")
+    return float(np.mean([precision[i] if i < len(precision) else 0.0 for i in indexes]))
+
+
+def evaluate(predictions, samples, conf_threshold):
+    tps, scores = [], []
+    for (boxes, image_scores), (_, gt_boxes) in zip(predictions, samples):
+        tps.append(match(boxes, image_scores, gt_boxes))
+        scores.append(image_scores)
+    tp = np.concatenate(tps) if tps else np.zeros((0, len(IOU_THRESHOLDS)), dtype=bool)
+    scores = np.concatenate(scores) if scores else np.zeros(0)
+    num_gt = sum(len(gt) for _, gt in samples)
+
+    aps = [average_precision(tp[:, t], scores, num_gt) for t in range(len(IOU_THRESHOLDS))]
+    kept = scores >= conf_threshold
+    true_positives = int(tp[kept, 0].sum())
+    return {
+        "map50": round(aps[0], 4),
+        "map50_95": round(float(np.mean(aps)), 4),
+        "precision": round(true_positives / max(int(kept.sum()), 1), 4),
+        "recall": round(true_positives / max(num_gt, 1), 4),
+    }
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:         # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux en KB, macOS en bytes
+    return round(peak / 1024 / (1024 if peak > 1 << 32 else 1), 1)
+
+
+# ---------------- ejecución ----------------
+
+def run_config(config):
+    """Ejecuta una combinación (en su propio proceso) y devuelve sus métricas"""
+    samples = load_split(config["split"], config["resize"])
+    frames = [frame for frame, _ in samples]
+
+    backend = detector.use_backend(config["backend"], config["model"], config["threads"])
+    fixed_size = getattr(backend, "fixed_size", None)
+    if fixed_size is not None and fixed_size != config["imgsz"]:
+        raise ValueError(
+            f"{config['backend']}: el modelo tiene entrada fija de {fixed_size}x{fixed_size} "
+            f"y se pidió --imgsz {config['imgsz']} (reexporta con dynamic=True o usa --imgsz {fixed_size})"
+        )
+    backend.size = config["imgsz"]
+    batch_size = config["batch_size"]
+    if batch_size > 1 and getattr(backend, "static_batch", False):
+        print(f"⚠️ {config['backend']}: el modelo tiene lote fijo en 1, batch={batch_size} "
+              f"se ejecuta imagen a imagen")
+
+    # Calentamiento (carga perezosa de pesos, asignación de buffers)
+    backend.predict_boxes(frames[:batch_size], config["min_conf"])
+
+    latencies, nms_latencies, predictions = [], [], []
+    start = time.perf_counter()
+    for first in range(0, len(frames), batch_size):
+        batch = frames[first:first + batch_size]
+        t0 = time.perf_counter()
+        results = backend.predict_boxes(batch, config["min_conf"])
+        t1 = time.perf_counter()
+        merged = [detector.merge_detections(boxes, scores, config["iou"]) for boxes, scores in results]
+        t2 = time.perf_counter()
+        latencies.append((t2 - t0) * 1000)
+        nms_latencies.append((t2 - t1) * 1000)
+        for detections in merged:
+            predictions.append((
+                np.array([d.box for d in detections], dtype=np.float32).reshape(-1, 4),
+                np.array([d.confidence for d in detections], dtype=np.float32),
+            ))
+    total = time.perf_counter() - start
+
+    result = {key: config[key] for key in ("backend", "model", "imgsz", "batch_size", "threads")}
+    result.update(evaluate(predictions, samples, config["conf"]))
+    result.update({
+        "images": len(frames),
+        "latency_ms": {f"p{p}": round(float(np.percentile(latencies, p)), 2) for p in (50, 95, 99)},
+        "nms_ms": {f"p{p}": round(float(np.percentile(nms_latencies, p)), 2) for p in (50, 95)},
+        "images_per_second": round(len(frames) / total, 2),
+        "peak_rss_mb": peak_rss_mb(),
+    })
+    return result
+
+
+def compare(results, baseline_path):
+    """Diferencias frente a una ejecución anterior con la misma combinación"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)["results"]
+    key = lambda r: (r["backend"], r["model"], r["imgsz"], r["batch_size"], r["threads"])
+    previous = {key(r): r for r in baseline}
+    print("\nComparación con", baseline_path)
+    for result in results:
+        old = previous.get(key(result))
+        if old is None:
+            continue
+        print(
+            f"  {result['backend']:<12} imgsz={result['imgsz']:<4} batch={result['batch_size']:<3} "
+            f"threads={result['threads']}: "
+            f"mAP50 {result['map50'] - old['map50']:+.4f}  "
+            f"p95 {result['latency_ms']['p95'] - old['latency_ms']['p95']:+.1f} ms  "
+            f"img/s {result['images_per_second'] - old['images_per_second']:+.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de precisión y latencia del detector de fuego")
+    parser.add_argument("--split", default="test", choices=["train", "valid", "test"])
+    parser.add_argument("--backends", nargs="+", default=[detector.BACKEND],
+                        help="ultralytics, onnx u openvino")
+    parser.add_argument("--model", action="append", default=[], metavar="BACKEND=RUTA",
+                        help="modelo para un backend (por defecto el de detector.py)")
+    parser.add_argument("--imgsz", nargs="+", type=int, default=[detector.IMGSZ])
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1])
+    parser.add_argument("--threads", nargs="+", type=int, default=[None])
+    parser.add_argument("--resize", default="800x600",
+                        help="redimensionado previo como detect_fire ('none' para desactivar)")
+    parser.add_argument("--conf", type=float, default=0.25, help="umbral para precisión/recall")
+    parser.add_argument("--iou", type=float, default=0.7, help="IoU del NMS")
+    parser.add_argument("--output", default=None, help="JSON de salida")
+    parser.add_argument("--baseline", default=None, help="JSON de una ejecución anterior")
+    args = parser.parse_args()
+
+    models = dict(item.split("=", 1) for item in args.model)
+    resize = None if args.resize == "none" else tuple(int(v) for v in args.resize.split("x"))
+
+    configs = [
+        {
+            "split": args.split, "resize": resize, "backend": backend,
+            "model": models.get(backend), "imgsz": imgsz, "batch_size": batch_size,
+            "threads": threads, "conf": args.conf, "min_conf": 0.001, "iou": args.iou,
+        }
+        for backend, imgsz, batch_size, threads in itertools.product(
+            args.backends, args.imgsz, args.batch_sizes, args.threads
+        )
+    ]
+
+    # Un proceso por combinación: el pico de RSS y los hilos no se mezclan
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for config in configs:
+        with context.Pool(1) as pool:
+            try:
+                result = pool.apply(run_config, (config,))
+            except ValueError as e:
+                # Combinación que el modelo no admite: se salta, el resto sigue
+                print(f"❌ {e}")
+                continue
+        results.append(result)
+        print(
+            f"{result['backend']:<12} imgsz={result['imgsz']:<4} batch={result['batch_size']:<3} "
+            f"threads={result['threads']}  "
+            f"mAP50={result['map50']:.3f} mAP50-95={result['map50_95']:.3f} "
+            f"P={result['precision']:.3f} R={result['recall']:.3f}  "
+            f"p50/p95/p99={result['latency_ms']['p50']}/{result['latency_ms']['p95']}/"
+            f"{result['latency_ms']['p99']} ms (NMS p50 {result['nms_ms']['p50']} ms)  "
+            f"{result['images_per_second']} img/s  "
+            f"RSS={result['peak_rss_mb']} MB"
+        )
+
+    output = args.output or os.path.join(
+        OUTPUT_DIR, f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "split": args.split,
+            "resize": args.resize,
+            "results": results,
+        }, f, indent=2)
+    print(f"\n💾 Resultados guardados en {output}")
+
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Filtro previo barato para no pasar por YOLO frames que no cambiaron.
+
+Cada frame se reduce a una miniatura en gris y a un hash perceptual
+(dHash de 64 bits):
+    - si la miniatura apenas difiere de la del último frame inferido,
+      se reutiliza su resultado;
+    - si no, se busca en una pequeña caché LRU un hash cercano
+      (distancia de Hamming) cuya miniatura también apenas difiera, y se
+      reutiliza ese resultado (el dHash solo no ve un fuego pequeño que
+      aparece en una escena estática);
+    - solo los frames realmente nuevos llegan al modelo (y los idénticos
+      dentro de un mismo lote, una sola vez).
+
+"Apenas difiere" cuenta píxeles de la miniatura que cambian más de
+pixel_threshold, no la diferencia media: una llama pequeña cambia pocos
+píxeles mucho, y en la media de toda la imagen desaparece.
+"""
+
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+_MISS = object()
+
+
+class ChangeGate:
+
+    def __init__(self, pixel_threshold=20, max_changed=0.002, max_hamming=4, cache_size=16, thumb_size=32):
+        self.pixel_threshold = pixel_threshold  # diferencia (0-255) de un píxel de la miniatura
+        self.max_changed = max_changed          # fracción de píxeles cambiados que se tolera
+        self.max_hamming = max_hamming          # bits distintos del dHash
+        self.cache_size = cache_size
+        self.thumb_size = thumb_size
+
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()             # dhash -> (miniatura, resultado)
+        self._reference = None                  # (miniatura, resultado) del último inferido
+
+        self.frames = 0
+        self.hits = 0
+        self.inferences = 0
+
+    def signature(self, frame):
+        """(miniatura gris thumb_size x thumb_size, dHash de 64 bits)"""
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        thumb = cv2.resize(gray, (self.thumb_size, self.thumb_size), interpolation=cv2.INTER_AREA)
+        small = cv2.resize(thumb, (9, 8), interpolation=cv2.INTER_AREA)
+        bits = np.packbits(small[:, 1:] > small[:, :-1])
+        return thumb, int.from_bytes(bits.tobytes(), "big")
+
+    def detect(self, frames, detect):
+        """
+        Igual que detect(frames) pero solo infiere los frames que cambiaron;
+        el resto reutiliza el último resultado equivalente.
+        """
+        results = [None] * len(frames)
+        pending = []
+        duplicates = []                         # (índice, posición en pending)
+
+        with self._lock:
+            for i, frame in enumerate(frames):
+                thumb, dhash = self.signature(frame)
+                self.frames += 1
+                cached = self._lookup(thumb, dhash)
+                if cached is not _MISS:
+                    self.hits += 1
+                    results[i] = cached
+                    continue
+                # Igual a un frame del mismo lote que ya va al modelo
+                same = next(
+                    (j for j, (_, pending_thumb, _) in enumerate(pending) if self._unchanged(thumb, pending_thumb)),
+                    None
+                )
+                if same is None:
+                    pending.append((i, thumb, dhash))
+                else:
+                    self.hits += 1
+                    duplicates.append((i, same))
+
+        if pending:
+            outputs = detect([frames[i] for i, _, _ in pending])
+            with self._lock:
+                for (i, thumb, dhash), output in zip(pending, outputs):
+                    results[i] = output
+                    self._store(thumb, dhash, output)
+                self.inferences += len(pending)
+            for i, same in duplicates:
+                results[i] = outputs[same]
+
+        return results
+
+    def stats(self):
+        with self._lock:
+            return {
+                "frames": self.frames,
+                "hits": self.hits,
+                "inferences": self.inferences,
+                "skipped_inferences": self.hits,
+                "hit_rate": round(self.hits / self.frames, 3) if self.frames else 0.0,
+            }
+
+    def _unchanged(self, thumb, other):
+        changed = np.count_nonzero(cv2.absdiff(thumb, other) > self.pixel_threshold)
+        return changed <= self.max_changed * thumb.size
+
+    # Llamar con self._lock tomado
+
+    def _lookup(self, thumb, dhash):
+        if self._reference is not None:
+            reference_thumb, result = self._reference
+            if self._unchanged(thumb, reference_thumb):
+                return result
+
+        for key in reversed(self._cache):
+            if bin(key ^ dhash).count("1") > self.max_hamming:
+                continue
+            cached_thumb, _ = self._cache[key]
+            if self._unchanged(thumb, cached_thumb):
+                self._cache.move_to_end(key)
+                self._reference = self._cache[key]
+                return self._reference[1]
+        return _MISS
+
+    def _store(self, thumb, dhash, result):
+        self._reference = (thumb, result)
+        self._cache[dhash] = self._reference
+        self._cache.move_to_end(dhash)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
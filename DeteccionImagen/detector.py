@@ -1,47 +1,486 @@
-from ultralytics import YOLO
 import cv2
+import numpy as np
 import os
+import sys
+from collections import namedtuple
 from datetime import datetime
 
 # Ruta absoluta al directorio actual (DeteccionImagen/)
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
+# registro_modelos.py está en la raíz del repo (compartido con DeteccionAudio)
+ROOT_DIR = os.path.dirname(BASE_DIR)
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+from registro_modelos import registro
+
 # Ruta absoluta al modelo
 MODEL_PATH = os.path.join(BASE_DIR, "models", "yolov8s_best.pt")
 
-# Cargar modelo UNA SOLA VEZ
-_model = YOLO(MODEL_PATH)
+# Backend de inferencia: "ultralytics" (PyTorch), "onnx", "openvino" o
+# "server" (inference_server.py compartido por varios procesos).
+# Los modelos onnx/openvino se generan con export_model.py
+BACKEND = "ultralytics"
 
-def detect_fire(
-    image_path: str,
+# Hilos de CPU para onnx/openvino (None = los que decida el runtime)
+INFERENCE_THREADS = None
+
+# Lado de la entrada cuadrada con la que se exportó el modelo
+IMGSZ = 640
+
+# Modo mosaico (tiled=True): recortes solapados a resolución completa
+TILE_SIZE = 640
+TILE_OVERLAP = 0.2          # fracción de solape entre recortes vecinos
+TILE_FULL_FRAME = True      # añadir también el frame completo al lote
+TILE_IOU_THRESHOLD = 0.5    # NMS entre recortes
+
+DEFAULT_MODEL_PATHS = {
+    "ultralytics": MODEL_PATH,
+    "onnx": os.path.join(BASE_DIR, "models", "yolov8s_best.onnx"),
+    "openvino": os.path.join(
+        BASE_DIR, "models", "yolov8s_best_openvino_model", "yolov8s_best.xml"
+    ),
+    # Para "server" la "ruta" es la URL del servidor de inferencia
+    "server": "http://127.0.0.1:8765",
+}
+
+# Resultado compacto por imagen de detect_fire_batch
+FireDetection = namedtuple("FireDetection", ["confidence", "box"])
+
+
+# ---------------- backends de inferencia ----------------
+
+class UltralyticsBackend:
+    """Modelo .pt a través de ultralytics/PyTorch (el comportamiento original)"""
+
+    def __init__(self, model_path, threads=None):
+        import torch
+        from ultralytics import YOLO
+        if threads:
+            # Afecta a todo el proceso (PyTorch no tiene hilos por modelo)
+            torch.set_num_threads(threads)
+        self._model = YOLO(model_path)
+        self.size = IMGSZ
+
+    def predict(self, frames, conf_threshold):
+        results = self._model(frames, conf=conf_threshold, imgsz=self.size, verbose=False)
+        return [best_detection(result) for result in results]
+
+    def predict_boxes(self, frames, conf_threshold):
+        results = self._model(frames, conf=conf_threshold, imgsz=self.size, verbose=False)
+        return [
+            (result.boxes.xyxy.cpu().numpy(), result.boxes.conf.cpu().numpy())
+            for result in results
+        ]
+
+
+class _RawOutputBackend:
+    """Backends que devuelven la salida cruda de YOLOv8 (sin NMS): _infer(batch)"""
+
+    size = IMGSZ
+    fixed_size = None       # lado de entrada si el modelo no admite otro
+    static_batch = False    # lote fijo en 1: los lotes se infieren imagen a imagen
+
+    def predict(self, frames, conf_threshold):
+        batch, transforms = preprocess(frames, self.size)
+        return postprocess(self._infer(batch), transforms, frames, conf_threshold)
+
+    def predict_boxes(self, frames, conf_threshold):
+        batch, transforms = preprocess(frames, self.size)
+        return postprocess_boxes(self._infer(batch), transforms, frames, conf_threshold)
+
+
+class OnnxBackend(_RawOutputBackend):
+    """Modelo exportado a ONNX (FP32 o INT8) con ONNX Runtime en CPU"""
+
+    def __init__(self, model_path, threads=None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self._session = ort.InferenceSession(
+            model_path, options, providers=["CPUExecutionProvider"]
+        )
+        model_input = self._session.get_inputs()[0]
+        self._input_name = model_input.name
+        # Exportado sin dynamic=True el lote queda fijo en 1 y el tamaño de entrada también
+        self.static_batch = model_input.shape[0] == 1
+        self.fixed_size = model_input.shape[2] if isinstance(model_input.shape[2], int) else None
+        self.size = self.fixed_size or IMGSZ
+
+    def _infer(self, batch):
+        if self.static_batch:
+            return np.concatenate([
+                self._session.run(None, {self._input_name: batch[i:i + 1]})[0]
+                for i in range(len(batch))
+            ])
+        return self._session.run(None, {self._input_name: batch})[0]
+
+
+class OpenVinoBackend(_RawOutputBackend):
+    """Modelo exportado a OpenVINO IR (FP32 o INT8) en CPU"""
+
+    def __init__(self, model_path, threads=None):
+        import openvino as ov
+
+        config = {"PERFORMANCE_HINT": "LATENCY"}
+        if threads:
+            config["INFERENCE_NUM_THREADS"] = threads
+        core = ov.Core()
+        self._model = core.compile_model(core.read_model(model_path), "CPU", config)
+
+    def _infer(self, batch):
+        return self._model(batch)[0]
+
+
+class RemoteBackend:
+    """
+    Cliente de inference_server.py: el modelo vive en un único proceso y
+    este solo envía los frames (BGR crudo, sin recodificar) por loopback.
+    last_metrics guarda queue_ms / compute_ms / batch_size de cada frame
+    de la última llamada.
+    """
+
+    def __init__(self, model_path, threads=None):
+        import requests
+        self.url = model_path.rstrip("/")
+        self._session = requests.Session()
+        self.last_metrics = []
+
+    def predict(self, frames, conf_threshold):
+        frames = [np.ascontiguousarray(frame, dtype=np.uint8) for frame in frames]
+        response = self._session.post(
+            f"{self.url}/predict",
+            params={"conf": conf_threshold},
+            data=b"".join(frame.tobytes() for frame in frames),
+            headers={
+                "Content-Type": "application/octet-stream",
+                "X-Shapes": ";".join(",".join(map(str, frame.shape)) for frame in frames),
+            },
+            timeout=30
+        )
+        response.raise_for_status()
+        body = response.json()
+        self.last_metrics = body["metrics"]
+        return [
+            FireDetection(d["confidence"], tuple(d["box"])) if d else None
+            for d in body["detections"]
+        ]
+
+
+BACKENDS = {
+    "ultralytics": UltralyticsBackend,
+    "onnx": OnnxBackend,
+    "openvino": OpenVinoBackend,
+    "server": RemoteBackend,
+}
+
+# Nombre del detector en el registro de modelos del proceso
+REGISTRY_NAME = "yolo"
+
+
+def use_backend(name=None, model_path=None, threads=None):
+    """
+    Carga el backend de inferencia (por defecto BACKEND) y lo deja
+    activo para locate_fire / detect_fire / detect_fire_batch.
+
+    El modelo queda en el registro de modelos del proceso: si el archivo
+    cambia en disco (p. ej. un modelo reentrenado o reexportado) se
+    recarga en caliente.
+    """
+    name = name or BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Backend desconocido: {name} (opciones: {', '.join(BACKENDS)})")
+    if threads is None:
+        threads = INFERENCE_THREADS
+    registro.registrar(
+        REGISTRY_NAME,
+        model_path or DEFAULT_MODEL_PATHS[name],
+        lambda path: BACKENDS[name](path, threads),
+        # La "ruta" del backend server es una URL
+        vigilar=name != "server"
+    )
+    return registro.obtener(REGISTRY_NAME)
+
+
+def get_backend():
+    """Backend activo; el modelo se carga UNA SOLA VEZ, en el primer uso"""
+    if not registro.registrado(REGISTRY_NAME):
+        return use_backend()
+    return registro.obtener(REGISTRY_NAME)
+
+
+def letterbox(frame, size=IMGSZ):
+    """
+    Redimensiona manteniendo la proporción y rellena hasta size x size
+    (gris 114, como ultralytics). Devuelve (imagen, escala, (pad_x, pad_y)).
+    """
+    height, width = frame.shape[:2]
+    scale = min(size / height, size / width)
+    new_width, new_height = round(width * scale), round(height * scale)
+    pad_x, pad_y = (size - new_width) // 2, (size - new_height) // 2
+
+    canvas = np.full((size, size, 3), 114, dtype=np.uint8)
+    canvas[pad_y:pad_y + new_height, pad_x:pad_x + new_width] = cv2.resize(
+        frame, (new_width, new_height), interpolation=cv2.INTER_LINEAR
+    )
+    return canvas, scale, (pad_x, pad_y)
+
+
+def preprocess(frames, size=IMGSZ):
+    """Lote NCHW float32 RGB en [0, 1] y la transformación de cada frame"""
+    batch = np.empty((len(frames), 3, size, size), dtype=np.float32)
+    transforms = []
+    for i, frame in enumerate(frames):
+        canvas, scale, pad = letterbox(frame, size)
+        batch[i] = canvas[:, :, ::-1].transpose(2, 0, 1)
+        transforms.append((scale, pad))
+    batch /= 255.0
+    return batch, transforms
+
+
+def postprocess(output, transforms, frames, conf_threshold):
+    """
+    Mejor caja por imagen a partir de la salida cruda de YOLOv8
+    (N, 4 + clases, anclas) con cajas (cx, cy, w, h) en la entrada.
+
+    Solo se necesita la caja de mayor confianza, que nunca la elimina el
+    NMS, así que basta con un argmax (sin NMS).
+    """
+    detections = []
+    for pred, (scale, (pad_x, pad_y)), frame in zip(output, transforms, frames):
+        scores = pred[4:].max(axis=0)
+        best = int(np.argmax(scores))
+        confidence = float(scores[best])
+        if confidence < conf_threshold:
+            detections.append(None)
+            continue
+
+        cx, cy, w, h = pred[:4, best]
+        height, width = frame.shape[:2]
+        x1 = np.clip((cx - w / 2 - pad_x) / scale, 0, width)
+        y1 = np.clip((cy - h / 2 - pad_y) / scale, 0, height)
+        x2 = np.clip((cx + w / 2 - pad_x) / scale, 0, width)
+        y2 = np.clip((cy + h / 2 - pad_y) / scale, 0, height)
+        box = (int(x1), int(y1), int(x2), int(y2))
+        detections.append(FireDetection(round(confidence, 2), box))
+    return detections
+
+
+def postprocess_boxes(output, transforms, frames, conf_threshold):
+    """
+    Todas las cajas candidatas por imagen, sin NMS:
+    [(cajas (K, 4) x1 y1 x2 y2 en el frame, confianzas (K,))]
+    """
+    boxes_per_frame = []
+    for pred, (scale, (pad_x, pad_y)), frame in zip(output, transforms, frames):
+        scores = pred[4:].max(axis=0)
+        keep = scores >= conf_threshold
+        cx, cy, w, h = pred[:4, keep]
+        height, width = frame.shape[:2]
+        boxes = np.stack([
+            np.clip((cx - w / 2 - pad_x) / scale, 0, width),
+            np.clip((cy - h / 2 - pad_y) / scale, 0, height),
+            np.clip((cx + w / 2 - pad_x) / scale, 0, width),
+            np.clip((cy + h / 2 - pad_y) / scale, 0, height),
+        ], axis=1)
+        boxes_per_frame.append((boxes, scores[keep]))
+    return boxes_per_frame
+
+
+# ---------------- modo mosaico ----------------
+
+def make_tiles(frame, tile_size=TILE_SIZE, overlap=TILE_OVERLAP):
+    """Recortes solapados (vistas, sin copia) que cubren el frame: [(x0, y0, recorte)]"""
+    height, width = frame.shape[:2]
+    step = max(1, int(tile_size * (1 - overlap)))
+
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        positions = list(range(0, length - tile_size, step))
+        positions.append(length - tile_size)
+        return positions
+
+    return [
+        (x, y, frame[y:y + tile_size, x:x + tile_size])
+        for y in starts(height)
+        for x in starts(width)
+    ]
+
+
+def merge_detections(boxes, scores, iou_threshold=TILE_IOU_THRESHOLD):
+    """NMS sobre cajas de todos los recortes; FireDetection de mayor a menor confianza"""
+    if len(scores) == 0:
+        return []
+    rects = [[float(x1), float(y1), float(x2 - x1), float(y2 - y1)] for x1, y1, x2, y2 in boxes]
+    keep = np.array(cv2.dnn.NMSBoxes(rects, [float(v) for v in scores], 0.0, iou_threshold)).flatten()
+    keep = sorted(keep, key=lambda i: -scores[i])
+    return [
+        FireDetection(round(float(scores[i]), 2), tuple(int(v) for v in boxes[i]))
+        for i in keep
+    ]
+
+
+def _tile_boxes(tiles, conf_threshold):
+    """Cajas de cada recorte; los backends sin predict_boxes aportan solo la mejor"""
+    backend = get_backend()
+    if hasattr(backend, "predict_boxes"):
+        return backend.predict_boxes(tiles, conf_threshold)
+    return [
+        (np.array([d.box], dtype=np.float32), np.array([d.confidence])) if d else
+        (np.empty((0, 4), dtype=np.float32), np.empty(0))
+        for d in backend.predict(tiles, conf_threshold)
+    ]
+
+
+def detect_fire_tiled(
+    image,
+    tile_size: int = TILE_SIZE,
+    overlap: float = TILE_OVERLAP,
+    conf_threshold: float = 0.25,
+    iou_threshold: float = TILE_IOU_THRESHOLD,
+    full_frame: bool = TILE_FULL_FRAME
+):
+    """
+    Detecta fuego a resolución completa: los recortes solapados (y el
+    frame entero si full_frame) pasan por el modelo en un único lote y
+    las cajas se fusionan con NMS entre recortes.
+
+    Returns:
+        lista de FireDetection en coordenadas del frame original,
+        de mayor a menor confianza (vacía si no hay fuego)
+    """
+    frame = load_frame(image)
+    tiles = make_tiles(frame, tile_size, overlap)
+    if full_frame and len(tiles) > 1:
+        tiles.append((0, 0, frame))
+
+    results = _tile_boxes([tile for _, _, tile in tiles], conf_threshold)
+    boxes = np.concatenate([
+        tile_boxes + np.array([x, y, x, y], dtype=np.float32)
+        for (x, y, _), (tile_boxes, _) in zip(tiles, results)
+    ])
+    scores = np.concatenate([tile_scores for _, tile_scores in results])
+    return merge_detections(boxes, scores, iou_threshold)
+
+
+def load_frame(image):
+    """
+    Devuelve un frame BGR a partir de:
+        - ruta a un archivo (str / PathLike)
+        - bytes JPEG/PNG codificados
+        - ndarray ya decodificado (se usa tal cual)
+    """
+    if isinstance(image, np.ndarray):
+        return image
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        buffer = np.frombuffer(image, dtype=np.uint8)
+        frame = cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+    else:
+        frame = cv2.imread(os.fspath(image))
+    if frame is None:
+        raise ValueError("No se pudo decodificar la imagen")
+    return frame
+
+
+def locate_fire(
+    image,
     resize_width: int = 800,
     resize_height: int = 600,
-    conf_threshold: float = 0.25
+    conf_threshold: float = 0.25,
+    gate=None,
+    tiled: bool = False
 ):
     """
-    Detecta fuego en una imagen.
+    Detecta fuego sin escribir nada a disco.
+
+    Con gate (change_gate.ChangeGate) un frame que no cambió respecto a
+    uno ya analizado reutiliza su resultado en vez de pasar por el modelo.
+
+    Con tiled=True no se redimensiona: el frame completo se analiza por
+    recortes (ver detect_fire_tiled) para no perder fuegos pequeños.
 
     Returns:
-        False
+        None
         OR
-        (True, output_image_path, best_confidence)
+        (best_confidence, (x1, y1, x2, y2), frame)   # frame redimensionado (u original con tiled)
     """
 
-    frame = cv2.imread(image_path)
-    frame = cv2.resize(frame, (resize_width, resize_height))
+    frame = load_frame(image)
+    if not tiled:
+        frame = cv2.resize(frame, (resize_width, resize_height))
 
-    results = _model(frame, conf=conf_threshold, verbose=False)
-    result = results[0]
+    detection = _predict([frame], conf_threshold, gate, tiled)[0]
 
     # No hay detecciones
+    if detection is None:
+        return None
+
+    return detection.confidence, detection.box, frame
+
+
+def _predict(frames, conf_threshold, gate=None, tiled=False):
+    def predict(pending):
+        if tiled:
+            return [
+                next(iter(detect_fire_tiled(frame, conf_threshold=conf_threshold)), None)
+                for frame in pending
+            ]
+        return get_backend().predict(pending, conf_threshold)
+
+    if gate is None:
+        return predict(frames)
+    return gate.detect(frames, predict)
+
+
+def best_detection(result):
+    """Mejor caja de un resultado de ultralytics como FireDetection (o None)"""
     if result.boxes is None or len(result.boxes) == 0:
-        return False
+        return None
+
+    confs = result.boxes.conf.cpu().numpy()
+    best = int(np.argmax(confs))
+    box = tuple(int(v) for v in result.boxes.xyxy[best].cpu().numpy())
+    return FireDetection(round(float(confs[best]), 2), box)
+
+
+def detect_fire_batch(
+    images,
+    batch_size: int = 8,
+    resize_width: int = 800,
+    resize_height: int = 600,
+    conf_threshold: float = 0.25,
+    gate=None
+):
+    """
+    Detecta fuego en varias imágenes (rutas, bytes o ndarrays) pasando
+    por YOLOv8 lotes de batch_size frames en una sola llamada.
+
+    Returns:
+        lista alineada con images; cada elemento es
+        None  OR  FireDetection(confidence, (x1, y1, x2, y2))
+        (coordenadas sobre el frame redimensionado, igual que locate_fire)
+    """
+    images = list(images)
+    detections = []
 
-    # Mejor deteccion
-    best_box = max(result.boxes, key=lambda b: float(b.conf[0]))
-    best_conf = round(float(best_box.conf[0]), 2)
+    for start in range(0, len(images), batch_size):
+        frames = [
+            cv2.resize(load_frame(image), (resize_width, resize_height))
+            for image in images[start:start + batch_size]
+        ]
+        detections.extend(_predict(frames, conf_threshold, gate))
 
-    x1, y1, x2, y2 = map(int, best_box.xyxy[0])
+    return detections
+
+
+def save_annotated(frame, box, confidence, output_path=None):
+    """Dibuja la caja sobre una copia del frame y la guarda como JPG"""
+    x1, y1, x2, y2 = box
 
     annotated_frame = frame.copy()
     cv2.rectangle(
@@ -49,7 +488,7 @@ def detect_fire(
         (0, 0, 255), 2
     )
 
-    label = f"Fire {best_conf}"
+    label = f"Fire {confidence}"
     cv2.putText(
         annotated_frame, label,
         (x1, max(y1 - 10, 20)),
@@ -57,11 +496,45 @@ def detect_fire(
         (0, 0, 255), 2
     )
 
-    output_dir = "predicts_yolov8/images"
-    os.makedirs(output_dir, exist_ok=True)
+    if output_path is None:
+        output_dir = "predicts_yolov8/images"
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output_path = os.path.join(output_dir, f"predict_{timestamp}.jpg")
 
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    output_path = os.path.join(output_dir, f"predict_{timestamp}.jpg")
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
     cv2.imwrite(output_path, annotated_frame)
+    return output_path
+
+
+def detect_fire(
+    image,
+    resize_width: int = 800,
+    resize_height: int = 600,
+    conf_threshold: float = 0.25,
+    annotate: bool = True,
+    gate=None,
+    tiled: bool = False
+):
+    """
+    Detecta fuego en una imagen (ruta, bytes codificados o ndarray BGR).
+
+    Con annotate=False no se dibuja ni se escribe la imagen anotada
+    (output_image_path es None); usar locate_fire + save_annotated
+    para generarla más tarde.
+
+    Returns:
+        False
+        OR
+        (True, output_image_path, best_confidence)
+    """
+
+    detection = locate_fire(image, resize_width, resize_height, conf_threshold, gate, tiled)
+    if detection is None:
+        return False
+
+    best_conf, box, frame = detection
+    if not annotate:
+        return True, None, best_conf
 
+    output_path = save_annotated(frame, box, best_conf)
     return True, output_path, best_conf
@@ -0,0 +1,121 @@
+"""
+Exporta models/yolov8s_best.pt a un backend CPU ligero (ONNX u OpenVINO),
+opcionalmente con cuantización INT8 estática calibrada con el split
+valid del dataset.
+
+Uso:
+    python export_model.py --format onnx
+    python export_model.py --format onnx --int8
+    python export_model.py --format openvino --int8
+
+Luego elegir el backend en detector.py (BACKEND) o con
+detector.use_backend("onnx", ruta_del_modelo).
+"""
+
+import argparse
+import glob
+import os
+
+import cv2
+
+from detector import BASE_DIR, IMGSZ, MODEL_PATH, preprocess
+
+DATASET_DIR = os.path.join(BASE_DIR, "datasets", "Converted_data_yolov8_format")
+DATA_YAML = os.path.join(DATASET_DIR, "data.yaml")
+CALIBRATION_DIR = os.path.join(DATASET_DIR, "valid", "images")
+
+
+def calibration_images(directory, max_images):
+    """Rutas de las imágenes de calibración (jpg/png)"""
+    paths = sorted(
+        glob.glob(os.path.join(directory, "*.jpg")) +
+        glob.glob(os.path.join(directory, "*.png"))
+    )
+    if not paths:
+        raise FileNotFoundError(f"No hay imágenes de calibración en {directory}")
+    return paths[:max_images]
+
+
+class CalibrationReader:
+    """Alimenta quantize_static con el mismo preprocesado que usa detector.py"""
+
+    def __init__(self, input_name, paths, imgsz):
+        self.input_name = input_name
+        self.paths = iter(paths)
+        self.imgsz = imgsz
+
+    def get_next(self):
+        for path in self.paths:
+            frame = cv2.imread(path)
+            if frame is None:
+                continue
+            batch, _ = preprocess([frame], self.imgsz)
+            return {self.input_name: batch}
+        return None
+
+
+def export_onnx(imgsz, int8, calibration_dir, max_images):
+    from ultralytics import YOLO
+
+    # dynamic=True para poder pasar lotes de cualquier tamaño
+    onnx_path = YOLO(MODEL_PATH).export(
+        format="onnx", imgsz=imgsz, dynamic=True, simplify=True
+    )
+    if not int8:
+        return onnx_path
+
+    import onnxruntime as ort
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_static
+
+    input_name = ort.InferenceSession(
+        onnx_path, providers=["CPUExecutionProvider"]
+    ).get_inputs()[0].name
+    paths = calibration_images(calibration_dir, max_images)
+    print(f"🔧 Calibrando INT8 con {len(paths)} imágenes de {calibration_dir}")
+
+    int8_path = os.path.splitext(onnx_path)[0] + "_int8.onnx"
+    quantize_static(
+        onnx_path,
+        int8_path,
+        CalibrationReader(input_name, paths, imgsz),
+        quant_format=QuantFormat.QDQ,
+        per_channel=True,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+    )
+    return int8_path
+
+
+def export_openvino(imgsz, int8):
+    from ultralytics import YOLO
+
+    # Con int8=True ultralytics calibra con NNCF sobre el split 'val'
+    # de data.yaml, que apunta a valid/images
+    export_dir = YOLO(MODEL_PATH).export(
+        format="openvino", imgsz=imgsz, dynamic=True, int8=int8, data=DATA_YAML
+    )
+    return os.path.join(export_dir, os.path.splitext(os.path.basename(MODEL_PATH))[0] + ".xml")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta el detector de fuego a ONNX / OpenVINO")
+    parser.add_argument("--format", choices=["onnx", "openvino"], default="onnx")
+    parser.add_argument("--int8", action="store_true", help="cuantización INT8 estática")
+    parser.add_argument("--imgsz", type=int, default=IMGSZ)
+    parser.add_argument("--calibration-dir", default=CALIBRATION_DIR,
+                        help="imágenes para calibrar INT8 (solo onnx)")
+    parser.add_argument("--max-images", type=int, default=300,
+                        help="máximo de imágenes de calibración")
+    args = parser.parse_args()
+
+    if args.format == "onnx":
+        model_path = export_onnx(args.imgsz, args.int8, args.calibration_dir, args.max_images)
+    else:
+        model_path = export_openvino(args.imgsz, args.int8)
+
+    print(f"✅ Modelo exportado: {model_path}")
+    print(f'   detector.use_backend("{args.format}", r"{model_path}")')
+
+
+if __name__ == "__main__":
+    main()
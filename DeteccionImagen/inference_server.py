@@ -0,0 +1,245 @@
+"""
+Servidor de inferencia local (HTTP en loopback) para compartir UN modelo
+entre varios procesos (orquestadores, Streamlit, pruebas).
+
+Las peticiones concurrentes se agrupan en lotes dinámicos: el lote se
+lanza al llenarse (max_batch) o cuando la petición más antigua lleva
+max_latency esperando.
+
+Uso:
+    python inference_server.py --backend onnx --port 8765
+
+Y en cada cliente:
+    detector.use_backend("server", "http://127.0.0.1:8765")
+    detect_fire(...)   # mismo contrato de siempre
+
+Endpoints:
+    POST /predict?conf=0.25   frames BGR crudos (cabecera X-Shapes "h,w,c;h,w,c")
+                              o una imagen codificada (image/jpeg, image/png)
+    GET  /metrics             tiempos de cola / cómputo y tamaño de lote
+    GET  /health
+"""
+
+import argparse
+import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from detector import BACKEND, get_backend, load_frame, use_backend
+
+
+class DynamicBatcher:
+    """
+    Junta frames de peticiones concurrentes y los infiere en lote en un solo hilo.
+
+    get_backend() se consulta en cada lote (p. ej. detector.get_backend),
+    así un modelo reexportado se recarga en caliente desde el registro.
+    """
+
+    def __init__(self, get_backend, max_batch=8, max_latency=0.01, history=1000):
+        self.get_backend = get_backend
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+
+        self._cond = threading.Condition()
+        self._pending = deque()          # (instante de llegada, frame, conf, Future)
+        self._metrics = deque(maxlen=history)
+        self._metrics_lock = threading.Lock()
+        self.requests = 0
+        self.batches = 0
+        self._active = True
+        self._thread = threading.Thread(target=self._loop, name="batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, frame, conf_threshold):
+        """Future con (FireDetection | None, métricas de esta petición)"""
+        future = Future()
+        with self._cond:
+            self._pending.append((time.perf_counter(), frame, conf_threshold, future))
+            self._cond.notify()
+        return future
+
+    def stop(self):
+        with self._cond:
+            self._active = False
+            self._cond.notify()
+        self._thread.join(timeout=5)
+
+    def metrics(self):
+        with self._metrics_lock:
+            samples = list(self._metrics)
+            summary = {"requests": self.requests, "batches": self.batches}
+        if samples:
+            queue_ms, compute_ms, batch_size = (np.array(v) for v in zip(*samples))
+            summary["avg_batch_size"] = round(float(batch_size.mean()), 2)
+            for name, values in (("queue_ms", queue_ms), ("compute_ms", compute_ms)):
+                summary[name] = {
+                    f"p{p}": round(float(np.percentile(values, p)), 2) for p in (50, 95, 99)
+                }
+        return summary
+
+    def _next_batch(self):
+        with self._cond:
+            while self._active and not self._pending:
+                self._cond.wait()
+            if not self._active:
+                return []
+            # Esperar más peticiones hasta llenar el lote o agotar la latencia
+            # máxima de la más antigua
+            deadline = self._pending[0][0] + self.max_latency
+            while self._active and len(self._pending) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            count = min(self.max_batch, len(self._pending))
+            return [self._pending.popleft() for _ in range(count)]
+
+    def _loop(self):
+        while self._active:
+            batch = self._next_batch()
+            if not batch:
+                continue
+
+            start = time.perf_counter()
+            try:
+                # La mejor caja no depende del umbral: se infiere con el más
+                # bajo del lote y se filtra por petición
+                detections = self.get_backend().predict(
+                    [frame for _, frame, _, _ in batch],
+                    min(conf for _, _, conf, _ in batch)
+                )
+            except Exception as e:
+                for _, _, _, future in batch:
+                    future.set_exception(e)
+                continue
+            compute_ms = (time.perf_counter() - start) * 1000
+
+            with self._metrics_lock:
+                self.batches += 1
+                self.requests += len(batch)
+                for arrived, _, _, _ in batch:
+                    self._metrics.append(((start - arrived) * 1000, compute_ms, len(batch)))
+
+            for (arrived, _, conf, future), detection in zip(batch, detections):
+                if detection is not None and detection.confidence < conf:
+                    detection = None
+                future.set_result((detection, {
+                    "queue_ms": round((start - arrived) * 1000, 2),
+                    "compute_ms": round(compute_ms, 2),
+                    "batch_size": len(batch),
+                }))
+
+
+def read_frames(body, content_type, shapes):
+    """Frames BGR de la petición: crudos según X-Shapes o una imagen codificada"""
+    if content_type.startswith("image/"):
+        return [load_frame(body)]
+
+    frames = []
+    offset = 0
+    for shape in shapes.split(";"):
+        dims = tuple(int(v) for v in shape.split(","))
+        size = int(np.prod(dims))
+        frames.append(np.frombuffer(body, np.uint8, size, offset).reshape(dims))
+        offset += size
+    if offset != len(body):
+        raise ValueError("El cuerpo no coincide con X-Shapes")
+    return frames
+
+
+def make_handler(batcher):
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"       # keep-alive para los clientes
+
+        def do_GET(self):
+            path = urlparse(self.path).path
+            if path == "/metrics":
+                self._json(200, batcher.metrics())
+            elif path == "/health":
+                self._json(200, {"status": "ok"})
+            else:
+                self._json(404, {"error": "not found"})
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            if url.path != "/predict":
+                self._json(404, {"error": "not found"})
+                return
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            try:
+                conf = float(parse_qs(url.query).get("conf", ["0.25"])[0])
+                frames = read_frames(
+                    body,
+                    self.headers.get("Content-Type", ""),
+                    self.headers.get("X-Shapes", "")
+                )
+            except ValueError as e:
+                self._json(400, {"error": str(e)})
+                return
+
+            futures = [batcher.submit(frame, conf) for frame in frames]
+            try:
+                results = [future.result(timeout=30) for future in futures]
+            except Exception as e:
+                self._json(500, {"error": str(e)})
+                return
+
+            self._json(200, {
+                "detections": [
+                    {"confidence": d.confidence, "box": list(d.box)} if d else None
+                    for d, _ in results
+                ],
+                "metrics": [metrics for _, metrics in results],
+            })
+
+        def _json(self, status, data):
+            payload = json.dumps(data).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor local de inferencia del detector de fuego")
+    parser.add_argument("--backend", default=BACKEND, help="ultralytics, onnx u openvino")
+    parser.add_argument("--model", default=None, help="ruta del modelo (por defecto la del backend)")
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--max-batch", type=int, default=8)
+    parser.add_argument("--max-latency-ms", type=float, default=10.0)
+    args = parser.parse_args()
+
+    if args.backend == "server":
+        parser.error("el servidor necesita un backend local")
+
+    use_backend(args.backend, args.model, args.threads)
+    batcher = DynamicBatcher(get_backend, args.max_batch, args.max_latency_ms / 1000)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(batcher))
+    print(f"🧠 Servidor de inferencia ({args.backend}) en http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        batcher.stop()
+
+
+if __name__ == "__main__":
+    main()
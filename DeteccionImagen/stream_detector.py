@@ -0,0 +1,235 @@
+"""
+Detección continua de fuego sobre un stream de vídeo (MJPEG / RTSP / archivo).
+
+Un hilo decodifica y otro infiere, unidos por una cola acotada que
+descarta el frame más viejo: la inferencia siempre trabaja sobre lo más
+reciente. Si la inferencia no da abasto, el hilo de decodificación salta
+frames (grab sin decodificar) para mantenerse en tiempo real.
+"""
+
+import math
+import threading
+import time
+from collections import deque, namedtuple
+
+import cv2
+
+# Lo que reciben los suscriptores tras cada inferencia
+StreamUpdate = namedtuple(
+    "StreamUpdate",
+    ["timestamp", "confidence", "rolling_confidence", "peak_confidence", "box", "frame"]
+)
+
+
+class DropOldestQueue:
+    """Cola acotada: al llenarse, put() expulsa el elemento más antiguo"""
+
+    def __init__(self, maxsize=2):
+        self._items = deque(maxlen=maxsize)
+        self._cond = threading.Condition()
+        self.dropped = 0
+
+    def put(self, item):
+        with self._cond:
+            if len(self._items) == self._items.maxlen:
+                self.dropped += 1
+            self._items.append(item)
+            self._cond.notify()
+
+    def get_all(self, timeout=None):
+        """Vacía la cola (espera hasta timeout si está vacía)"""
+        with self._cond:
+            if not self._items:
+                self._cond.wait(timeout)
+            items = list(self._items)
+            self._items.clear()
+            return items
+
+
+class StreamDetector:
+    """
+    detect(frames) -> lista de None / FireDetection(confidence, box),
+    p. ej. detector.get_backend().predict con un umbral fijo.
+
+    La confianza "rolling" es la media de las inferencias de los últimos
+    window segundos (0 cuando no hubo detección): sirve para avisos, pero
+    unas llamas detectadas en solo parte de los frames la diluyen. Para
+    decidir una alerta se usa peak_confidence, la máxima de la ventana.
+
+    Con gate (change_gate.ChangeGate) solo llegan a detect los frames
+    que cambiaron; el resto reutiliza el resultado anterior.
+    """
+
+    def __init__(self, source, detect, queue_size=2, window=3.0,
+                 max_skip=30, reconnect_delay=2.0, gate=None, name="stream"):
+        self.source = source
+        self.detect = detect
+        self.gate = gate
+        self.window = window
+        self.max_skip = max_skip
+        self.reconnect_delay = reconnect_delay
+        self.name = name
+
+        self._queue = DropOldestQueue(queue_size)
+        self._lock = threading.Lock()
+        self._subscribers = []
+        self._history = deque()          # (timestamp, confidence)
+        self._latest = None
+        self._active = False
+        self._threads = []
+
+        # Medias móviles para el salto adaptativo
+        self._frame_interval = None      # segundos entre frames de la fuente
+        self._inference_time = None      # segundos por frame inferido
+        self.skip = 1                    # se decodifica 1 de cada `skip` frames
+
+        self.frames_read = 0
+        self.frames_inferred = 0
+
+    # ---------------- ciclo de vida ----------------
+
+    def start(self):
+        if self._active:
+            return self
+        self._active = True
+        for target, suffix in ((self._decode_loop, "decode"), (self._inference_loop, "infer")):
+            thread = threading.Thread(target=target, name=f"{self.name}-{suffix}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, timeout=5):
+        self._active = False
+        self._queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        self._threads = []
+
+    # ---------------- suscripción ----------------
+
+    def subscribe(self, callback):
+        """callback(StreamUpdate) se llama en el hilo de inferencia: debe ser rápido"""
+        with self._lock:
+            self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    def latest(self, max_age=None):
+        """Último StreamUpdate (o None si no hay / es más viejo que max_age)"""
+        with self._lock:
+            update = self._latest
+        if update is None:
+            return None
+        if max_age is not None and time.time() - update.timestamp > max_age:
+            return None
+        return update
+
+    def stats(self):
+        stats = {
+            "frames_read": self.frames_read,
+            "frames_inferred": self.frames_inferred,
+            "frames_dropped": self._queue.dropped,
+            "skip": self.skip,
+            "source_fps": round(1 / self._frame_interval, 1) if self._frame_interval else None,
+            "inference_ms": round(self._inference_time * 1000, 1) if self._inference_time else None,
+        }
+        if self.gate is not None:
+            stats["gate"] = self.gate.stats()
+        return stats
+
+    # ---------------- hilos ----------------
+
+    def _decode_loop(self):
+        while self._active:
+            capture = cv2.VideoCapture(self.source)
+            if not capture.isOpened():
+                print(f"⚠️ {self.name}: no se pudo abrir {self.source}")
+                time.sleep(self.reconnect_delay)
+                continue
+            try:
+                self._read_frames(capture)
+            finally:
+                capture.release()
+            if self._active:
+                time.sleep(self.reconnect_delay)
+
+    def _read_frames(self, capture):
+        previous = None
+        counter = 0
+        while self._active:
+            # grab() sin decodificar para los frames que se saltan
+            if not capture.grab():
+                print(f"⚠️ {self.name}: stream interrumpido, reconectando...")
+                return
+            now = time.time()
+            if previous is not None:
+                self._frame_interval = _ema(self._frame_interval, now - previous)
+            previous = now
+            self.frames_read += 1
+
+            counter += 1
+            if counter < self.skip:
+                continue
+            counter = 0
+
+            ok, frame = capture.retrieve()
+            if ok:
+                self._queue.put((now, frame))
+
+    def _inference_loop(self):
+        while self._active:
+            items = [item for item in self._queue.get_all(timeout=1.0) if item is not None]
+            if not items:
+                continue
+
+            start = time.perf_counter()
+            try:
+                frames = [frame for _, frame in items]
+                if self.gate is not None:
+                    detections = self.gate.detect(frames, self.detect)
+                else:
+                    detections = self.detect(frames)
+            except Exception as e:
+                print(f"❌ {self.name}: error en la inferencia: {e}")
+                time.sleep(1)
+                continue
+            elapsed = (time.perf_counter() - start) / len(items)
+            self._inference_time = _ema(self._inference_time, elapsed)
+            self._adapt_skip()
+
+            for (timestamp, frame), detection in zip(items, detections):
+                self.frames_inferred += 1
+                self._publish(timestamp, frame, detection)
+
+    def _adapt_skip(self):
+        """Decodificar solo los frames que la inferencia alcanza a procesar"""
+        if not self._frame_interval or not self._inference_time:
+            return
+        self.skip = max(1, min(self.max_skip, math.ceil(self._inference_time / self._frame_interval)))
+
+    def _publish(self, timestamp, frame, detection):
+        confidence = detection.confidence if detection is not None else 0.0
+        box = detection.box if detection is not None else None
+
+        with self._lock:
+            self._history.append((timestamp, confidence))
+            while self._history and self._history[0][0] < timestamp - self.window:
+                self._history.popleft()
+            rolling = sum(c for _, c in self._history) / len(self._history)
+            peak = max(c for _, c in self._history)
+            update = StreamUpdate(timestamp, confidence, round(rolling, 3), round(peak, 3), box, frame)
+            self._latest = update
+            subscribers = list(self._subscribers)
+
+        for callback in subscribers:
+            try:
+                callback(update)
+            except Exception as e:
+                print(f"❌ {self.name}: error en suscriptor: {e}")
+
+
+def _ema(previous, value, alpha=0.2):
+    return value if previous is None else previous + alpha * (value - previous)
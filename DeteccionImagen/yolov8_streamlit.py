@@ -0,0 +1,95 @@
+"""
+Funciones de la app Streamlit (main.py): carga del modelo y detección
+continua sobre webcam / cámara IP (MJPEG, RTSP) / YouTube usando
+StreamDetector.
+"""
+
+import time
+
+import cv2
+import streamlit as st
+from ultralytics import YOLO
+
+import config
+from change_gate import ChangeGate
+from detector import best_detection
+from stream_detector import StreamDetector
+
+
+def load_model(model_path):
+    """Carga el modelo YOLOv8 de detección"""
+    return YOLO(model_path)
+
+
+def _confidence_slider():
+    return float(st.sidebar.slider("Select Model Confidence", 25, 100, 40)) / 100
+
+
+def _detect_with(model, conf):
+    """Adapta el modelo de ultralytics a la interfaz detect(frames) de StreamDetector"""
+    def detect(frames):
+        results = model(frames, conf=conf, verbose=False)
+        return [best_detection(result) for result in results]
+    return detect
+
+
+def _annotate(update):
+    frame = update.frame.copy()
+    if update.box is not None:
+        x1, y1, x2, y2 = update.box
+        cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 0, 255), 2)
+        cv2.putText(frame, f"Fire {update.confidence}", (x1, max(y1 - 10, 20)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 255), 2)
+    return frame
+
+
+def _display_stream(model, source, conf):
+    """
+    Muestra el último frame inferido y la confianza rolling hasta que el
+    usuario interactúe con la app (Streamlit vuelve a ejecutar el script).
+    """
+    detector = StreamDetector(
+        source, _detect_with(model, conf), gate=ChangeGate(), name="streamlit"
+    ).start()
+    frame_slot = st.empty()
+    status_slot = st.empty()
+    try:
+        while True:
+            update = detector.latest()
+            if update is not None:
+                frame_slot.image(_annotate(update), channels="BGR",
+                                 caption="Detected Video", use_column_width=True)
+                stats = detector.stats()
+                status_slot.markdown(
+                    f"**Fire confidence ({detector.window:.0f}s rolling):** "
+                    f"{update.rolling_confidence:.2f} · "
+                    f"inference {stats['inference_ms']} ms · skip 1/{stats['skip']} · "
+                    f"unchanged frames {stats['gate']['hit_rate']:.0%}"
+                )
+            time.sleep(0.1)
+    finally:
+        detector.stop()
+
+
+def play_webcam(model):
+    """Webcam local (índice) o cámara IP (URL MJPEG / RTSP)"""
+    source = st.sidebar.text_input("Webcam index or stream URL", value=str(config.WEBCAM_PATH))
+    conf = _confidence_slider()
+    if st.sidebar.button("Detect Objects"):
+        try:
+            _display_stream(model, int(source) if source.isdigit() else source, conf)
+        except Exception as ex:
+            st.sidebar.error("Error loading video: " + str(ex))
+
+
+def play_youtube_video(model):
+    """Vídeo de YouTube a través de la URL directa del mp4 (pytube)"""
+    source_youtube = st.sidebar.text_input("YouTube Video url")
+    conf = _confidence_slider()
+    if st.sidebar.button("Detect Objects"):
+        try:
+            from pytube import YouTube
+            stream = YouTube(source_youtube).streams.filter(file_extension="mp4", res=720).first()
+            _display_stream(model, stream.url, conf)
+        except Exception as ex:
+            st.sidebar.error("Error loading video: " + str(ex))
@@ -0,0 +1,216 @@
+# ============================================
+# CAPTURA CONTINUA (PRE-ROLL)
+# Mantiene en memoria las últimas fotos y el último audio
+# de la cámara IP para tener evidencia al instante
+# ============================================
+
+import io
+import struct
+import threading
+import time
+import wave
+from collections import deque
+
+import requests
+
+
+class CapturadorCamara:
+    """
+    Captura en segundo plano fotos (shot.jpg) y audio PCM (audio.wav)
+    de una cámara IP y los guarda en buffers circulares acotados.
+
+    Las fotos se expulsan por antigüedad cuando se supera max_fotos o
+    max_bytes_fotos; el audio conserva solo los últimos segundos_audio.
+    """
+
+    def __init__(self, url, intervalo_foto=1.0, max_fotos=10,
+                 max_bytes_fotos=5 * 1024 * 1024, segundos_audio=10,
+                 max_bytes_audio=4 * 1024 * 1024):
+        self.url = url
+        self.intervalo_foto = intervalo_foto
+        self.max_fotos = max_fotos
+        self.max_bytes_fotos = max_bytes_fotos
+        self.segundos_audio = segundos_audio
+        self.max_bytes_audio = max_bytes_audio
+
+        self._lock = threading.Lock()
+        self._fotos = deque()           # (timestamp, bytes jpeg)
+        self._bytes_fotos = 0
+        self._pcm = bytearray()
+        self._formato = None            # (canales, bytes_muestra, frecuencia)
+        self._oyentes_pcm = []
+        self._activo = False
+        self._hilos = []
+        self._session = requests.Session()
+
+    # ---------------- ciclo de vida ----------------
+
+    def iniciar(self):
+        if self._activo:
+            return
+        self._activo = True
+        for objetivo, nombre in ((self._bucle_fotos, "fotos"), (self._bucle_audio, "audio")):
+            hilo = threading.Thread(target=objetivo, name=f"preroll-{nombre}", daemon=True)
+            hilo.start()
+            self._hilos.append(hilo)
+
+    def detener(self):
+        self._activo = False
+        for hilo in self._hilos:
+            hilo.join(timeout=2)
+        self._hilos = []
+
+    def suscribir_pcm(self, callback):
+        """
+        callback(datos, canales, bytes_muestra, frecuencia) con cada trozo de
+        PCM recibido (en el hilo de audio: debe ser rápido y no bloquear)
+        """
+        self._oyentes_pcm.append(callback)
+
+    # ---------------- lectura del buffer ----------------
+
+    def ultima_foto(self, max_antiguedad=None):
+        """Bytes JPEG de la foto más reciente (o None si no hay / es vieja)"""
+        with self._lock:
+            if not self._fotos:
+                return None
+            timestamp, jpeg = self._fotos[-1]
+        if max_antiguedad is not None and time.time() - timestamp > max_antiguedad:
+            return None
+        return jpeg
+
+    def fotos(self):
+        """Copia de las fotos en memoria, de la más antigua a la más nueva"""
+        with self._lock:
+            return list(self._fotos)
+
+    def audio_reciente(self, segundos):
+        """
+        WAV (bytes) con los últimos `segundos` de audio.
+        Devuelve None si todavía no hay tanto audio acumulado.
+        """
+        with self._lock:
+            if self._formato is None:
+                return None
+            canales, ancho, frecuencia = self._formato
+            bloque = canales * ancho
+            necesarios = int(segundos * frecuencia) * bloque
+            if len(self._pcm) < necesarios:
+                return None
+            pcm = bytes(self._pcm[-necesarios:])
+
+        salida = io.BytesIO()
+        with wave.open(salida, "wb") as wav:
+            wav.setnchannels(canales)
+            wav.setsampwidth(ancho)
+            wav.setframerate(frecuencia)
+            wav.writeframes(pcm)
+        return salida.getvalue()
+
+    def uso_memoria(self):
+        """Bytes ocupados por los buffers"""
+        with self._lock:
+            return self._bytes_fotos + len(self._pcm)
+
+    # ---------------- hilos de captura ----------------
+
+    def _bucle_fotos(self):
+        while self._activo:
+            inicio = time.time()
+            try:
+                jpeg = self._session.get(f"{self.url}/shot.jpg", timeout=5).content
+                self._guardar_foto(inicio, jpeg)
+            except Exception as e:
+                print(f"⚠️ Pre-roll: error capturando foto: {e}")
+                time.sleep(2)
+            time.sleep(max(0.0, self.intervalo_foto - (time.time() - inicio)))
+
+    def _guardar_foto(self, timestamp, jpeg):
+        with self._lock:
+            self._fotos.append((timestamp, jpeg))
+            self._bytes_fotos += len(jpeg)
+            while self._fotos and (
+                len(self._fotos) > self.max_fotos or
+                self._bytes_fotos > self.max_bytes_fotos
+            ):
+                _, vieja = self._fotos.popleft()
+                self._bytes_fotos -= len(vieja)
+
+    def _bucle_audio(self):
+        espera = 1
+        while self._activo:
+            try:
+                response = self._session.get(f"{self.url}/audio.wav", stream=True, timeout=10)
+                self._leer_stream_audio(response.iter_content(chunk_size=4096))
+                espera = 1
+            except Exception as e:
+                print(f"⚠️ Pre-roll: error en stream de audio: {e}")
+                time.sleep(espera)
+                espera = min(espera * 2, 30)
+
+    def _leer_stream_audio(self, chunks):
+        cabecera = bytearray()
+        formato = None
+        for chunk in chunks:
+            if not self._activo:
+                return
+            if formato is None:
+                cabecera += chunk
+                resultado = leer_cabecera_wav(cabecera)
+                if resultado is None:
+                    continue
+                formato, inicio_datos = resultado
+                with self._lock:
+                    if self._formato != formato:
+                        self._pcm.clear()
+                    self._formato = formato
+                chunk = bytes(cabecera[inicio_datos:])
+            self._guardar_pcm(chunk)
+            for callback in list(self._oyentes_pcm):
+                try:
+                    callback(chunk, *formato)
+                except Exception as e:
+                    print(f"⚠️ Pre-roll: error en oyente de audio: {e}")
+
+    def _guardar_pcm(self, datos):
+        with self._lock:
+            canales, ancho, frecuencia = self._formato
+            bloque = canales * ancho
+            self._pcm += datos
+            limite = min(self.max_bytes_audio, self.segundos_audio * frecuencia * bloque)
+            exceso = len(self._pcm) - limite
+            if exceso > 0:
+                # Recortar alineado a muestras completas
+                exceso += (-exceso) % bloque
+                del self._pcm[:exceso]
+
+
+def leer_cabecera_wav(datos):
+    """
+    Interpreta la cabecera RIFF/WAVE de un stream.
+    Devuelve ((canales, bytes_muestra, frecuencia), inicio_datos)
+    o None si aún no llegaron bytes suficientes.
+    """
+    if len(datos) < 12:
+        return None
+    if datos[:4] != b"RIFF" or datos[8:12] != b"WAVE":
+        raise ValueError("El stream de audio no es WAV")
+
+    pos = 12
+    formato = None
+    while pos + 8 <= len(datos):
+        nombre = bytes(datos[pos:pos + 4])
+        tamano = struct.unpack("<I", datos[pos + 4:pos + 8])[0]
+        if nombre == b"data":
+            if formato is None:
+                raise ValueError("Chunk 'data' antes de 'fmt '")
+            return formato, pos + 8
+        if pos + 8 + tamano > len(datos):
+            return None
+        if nombre == b"fmt ":
+            _, canales, frecuencia, _, _, bits = struct.unpack(
+                "<HHIIHH", datos[pos + 8:pos + 24]
+            )
+            formato = (canales, bits // 8, frecuencia)
+        pos += 8 + tamano + (tamano & 1)
+    return None
@@ -0,0 +1,109 @@
+# ============================================
+# CLIENTE HTTP DEL DASHBOARD
+# Sesión compartida con pool de conexiones keep-alive
+# y concurrencia acotada; micro-lotes de envíos pequeños
+# ============================================
+
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class ClienteDashboard:
+    """
+    Cliente único para la API REST del dashboard (lo usan los workers
+    del outbox).
+
+    - Reutiliza conexiones TCP (keep-alive) mediante una requests.Session.
+    - Limita las peticiones simultáneas a max_concurrencia.
+    """
+
+    def __init__(self, api_url, max_concurrencia=8, timeout=5):
+        self.api_url = api_url.rstrip("/")
+        self.timeout = timeout
+
+        self._session = requests.Session()
+        adaptador = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=max_concurrencia,
+            pool_block=True
+        )
+        self._session.mount("http://", adaptador)
+        self._session.mount("https://", adaptador)
+
+        self._concurrencia = threading.BoundedSemaphore(max_concurrencia)
+
+    def post(self, endpoint, **kwargs):
+        """POST síncrono reutilizando la sesión (lanza excepción si falla la red)"""
+        kwargs.setdefault("timeout", self.timeout)
+        with self._concurrencia:
+            return self._session.post(f"{self.api_url}/{endpoint}", **kwargs)
+
+    def cerrar(self):
+        self._session.close()
+
+
+class MicroLote:
+    """
+    Agrupa envíos pequeños (p. ej. lecturas de sensores) y llama a
+    vaciar(lista) una sola vez cuando se juntan max_lote elementos o
+    cuando el más antiguo lleva max_espera segundos esperando.
+    """
+
+    def __init__(self, vaciar, max_lote=50, max_espera=0.5, nombre="lote"):
+        self.vaciar_lote = vaciar
+        self.max_lote = max_lote
+        self.max_espera = max_espera
+
+        self._cond = threading.Condition()
+        self._items = []
+        self._limite = None             # instante en que vence el lote actual
+        self._activo = True
+        self._hilo = threading.Thread(target=self._bucle, name=nombre, daemon=True)
+        self._hilo.start()
+
+    def agregar(self, item):
+        """Añade un elemento al lote actual (no bloquea)"""
+        with self._cond:
+            self._items.append(item)
+            if len(self._items) == 1:
+                self._limite = time.monotonic() + self.max_espera
+                self._cond.notify()
+            if len(self._items) >= self.max_lote:
+                self._vaciar()
+
+    def vaciar(self):
+        """Envía ya lo que haya pendiente"""
+        with self._cond:
+            self._vaciar()
+
+    def cerrar(self):
+        with self._cond:
+            self._activo = False
+            self._vaciar()
+            self._cond.notify()
+        self._hilo.join(timeout=2)
+
+    def _vaciar(self):
+        # Llamar con self._cond tomado
+        if not self._items:
+            return
+        lote, self._items, self._limite = self._items, [], None
+        try:
+            self.vaciar_lote(lote)
+        except Exception as e:
+            print(f"❌ Error enviando lote de {len(lote)} elementos: {e}")
+
+    def _bucle(self):
+        with self._cond:
+            while self._activo:
+                if self._limite is None:
+                    self._cond.wait()
+                    continue
+                restante = self._limite - time.monotonic()
+                if restante > 0:
+                    self._cond.wait(restante)
+                else:
+                    self._vaciar()
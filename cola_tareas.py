@@ -0,0 +1,66 @@
+# ============================================
+# COLA DE TAREAS EN SEGUNDO PLANO
+# Pool de workers con cola acotada para no bloquear
+# el callback MQTT (captura, IA, subidas, alertas)
+# ============================================
+
+import queue
+import threading
+import traceback
+
+
+class ColaTareas:
+    """Pool de hilos que consume tareas de una cola acotada"""
+
+    def __init__(self, num_workers=4, tamano_max=100, nombre="worker"):
+        self._cola = queue.Queue(maxsize=tamano_max)
+        self._hilos = []
+        for i in range(num_workers):
+            hilo = threading.Thread(
+                target=self._bucle,
+                name=f"{nombre}-{i}",
+                daemon=True
+            )
+            hilo.start()
+            self._hilos.append(hilo)
+
+    def encolar(self, funcion, *args, **kwargs):
+        """
+        Encola una tarea sin bloquear.
+        Devuelve False si la cola está llena (la tarea se descarta).
+        """
+        try:
+            self._cola.put_nowait((funcion, args, kwargs))
+            return True
+        except queue.Full:
+            print(f"⚠️ Cola de tareas llena, descartando: {funcion.__name__}")
+            return False
+
+    def pendientes(self):
+        """Número de tareas esperando en la cola"""
+        return self._cola.qsize()
+
+    def detener(self, timeout=5):
+        """Envía señal de parada a los workers y espera a que terminen"""
+        for _ in self._hilos:
+            try:
+                self._cola.put(None, timeout=timeout)
+            except queue.Full:
+                break
+        for hilo in self._hilos:
+            hilo.join(timeout=timeout)
+
+    def _bucle(self):
+        while True:
+            tarea = self._cola.get()
+            if tarea is None:
+                self._cola.task_done()
+                break
+            funcion, args, kwargs = tarea
+            try:
+                funcion(*args, **kwargs)
+            except Exception as e:
+                print(f"❌ Error en tarea {funcion.__name__}: {e}")
+                traceback.print_exc()
+            finally:
+                self._cola.task_done()
@@ -0,0 +1,81 @@
+# ============================================
+# ESTADO POR DISPOSITIVO
+# Máquina de estados Normal/Riesgo/Confirmado por placa,
+# repartida en shards (un hilo por shard)
+# ============================================
+
+import zlib
+
+from cola_tareas import ColaTareas
+
+
+class EstadoDispositivo:
+    """Estado compacto de la máquina de estados de un dispositivo"""
+
+    __slots__ = (
+        "dispositivo",
+        "estado",
+        "contador_riesgo",
+        "contador_normal",
+        "evidencia_tomada",
+        "alerta_enviada",
+        "evidencia",
+    )
+
+    def __init__(self, dispositivo):
+        self.dispositivo = dispositivo
+        self.estado = "Normal"
+        self.contador_riesgo = 0
+        self.contador_normal = 0
+        self.evidencia_tomada = False
+        self.alerta_enviada = False
+        self.evidencia = None          # evidencia del evento confirmado
+
+
+class TablaDispositivos:
+    """
+    Tabla de estados indexada por id de dispositivo.
+
+    Cada dispositivo pertenece siempre al mismo shard y cada shard se
+    procesa en un único hilo, así que las lecturas de una placa se aplican
+    en orden y sin locks, mientras placas distintas avanzan en paralelo.
+    """
+
+    def __init__(self, num_shards=4, tamano_cola=1000):
+        self._shards = [
+            ColaTareas(1, tamano_cola, nombre=f"shard-{i}")
+            for i in range(num_shards)
+        ]
+        self._estados = [{} for _ in range(num_shards)]
+
+    def indice_shard(self, dispositivo):
+        """Shard estable (independiente de PYTHONHASHSEED) para un dispositivo"""
+        return zlib.crc32(dispositivo.encode("utf-8")) % len(self._shards)
+
+    def encolar(self, dispositivo, funcion, *args):
+        """
+        Ejecuta funcion(estado, *args) en el hilo del shard del dispositivo.
+        Devuelve False si la cola del shard está llena.
+        """
+        indice = self.indice_shard(dispositivo)
+        return self._shards[indice].encolar(
+            self._ejecutar, indice, dispositivo, funcion, args
+        )
+
+    def _ejecutar(self, indice, dispositivo, funcion, args):
+        estados = self._estados[indice]
+        estado = estados.get(dispositivo)
+        if estado is None:
+            estado = estados[dispositivo] = EstadoDispositivo(dispositivo)
+        funcion(estado, *args)
+
+    def __len__(self):
+        return sum(len(estados) for estados in self._estados)
+
+    def pendientes(self):
+        """Lecturas esperando en todos los shards"""
+        return sum(shard.pendientes() for shard in self._shards)
+
+    def detener(self, timeout=5):
+        for shard in self._shards:
+            shard.detener(timeout)
@@ -8,14 +8,27 @@ from awscrt import mqtt
 import json
 import time
 import requests
-import base64
+import hashlib
 import mimetypes
+import os
+import threading
+import uuid
 import boto3
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 
-from DeteccionAudio.detector_audio_incendio import detectar_incendio
-from DeteccionImagen.detector import detect_fire
+from DeteccionAudio.detector_audio_incendio import detectar_incendio, probabilidad_incendio
+from DeteccionAudio.stream_audio import DetectorAudioStream
+from DeteccionImagen.detector import locate_fire, save_annotated, use_backend, get_backend
+from DeteccionImagen.stream_detector import StreamDetector
+from DeteccionImagen.change_gate import ChangeGate
 from telegram_message import enviar_alerta_telegram
+from cola_tareas import ColaTareas
+from estado_dispositivos import TablaDispositivos
+from captura_continua import CapturadorCamara
+from cliente_dashboard import ClienteDashboard, MicroLote
+from outbox import Outbox, ErrorPermanente
+from registro_modelos import registro
 
 # ════════════════════════════════════════════
 # CONFIGURACIÓN AWS IoT CORE
@@ -31,11 +44,69 @@ TOPIC_SENSORES = "sdk/test/python"
 # CONFIGURACIÓN GENERAL
 # ════════════════════════════════════════════
 CAMERA_URL = "http://10.7.135.227:8080"
-PHOTO_PATH = "foto_incendio.jpg"
-AUDIO_PATH = "audio_incendio.wav"
+# Evidencias: una carpeta por evento (evidencias/<evento_id>/foto.jpg, audio.wav)
+EVIDENCIAS_DIR = "evidencias"
+
+# Dispositivos (cada placa envía su id en el campo "device" del payload)
+DISPOSITIVO_DEFECTO = "default"
+# Cámara IP de cada dispositivo (los que no aparecen usan CAMERA_URL)
+CAMARAS = {
+    # "mkr-cocina": "http://10.7.135.228:8080",
+}
+
+# Pre-roll: buffer en memoria de fotos y audio de cada cámara (opcional)
+PREROLL_ACTIVO = False
+PREROLL_INTERVALO_FOTO = 1.0      # segundos entre fotos
+PREROLL_MAX_FOTOS = 10
+PREROLL_MAX_MB_FOTOS = 5
+PREROLL_SEGUNDOS_AUDIO = 10
+PREROLL_MAX_MB_AUDIO = 4
+PREROLL_MAX_ANTIGUEDAD_FOTO = 5   # segundos; más vieja => pedir foto nueva
+
+# Detección continua sobre el vídeo de cada cámara (opcional)
+STREAM_ACTIVO = False
+STREAM_RUTA = "/video"            # MJPEG de la cámara IP (o rtsp://... en STREAMS)
+STREAMS = {
+    # "http://10.7.135.228:8080": "rtsp://10.7.135.228:8080/h264_pcm.sdp",
+}
+STREAM_VENTANA = 3.0              # segundos de la confianza rolling
+STREAM_MAX_ANTIGUEDAD = 2.0       # segundos; más viejo => YOLO sobre la foto
+STREAM_CONFIANZA_MIN = 0.25
+# Filtro de cambios: los frames casi idénticos reutilizan el último resultado
+STREAM_FILTRO_CAMBIOS = True
+STREAM_DIFERENCIA_PIXEL = 20      # diferencia (0-255) a partir de la que un píxel de la miniatura cambió
+STREAM_PIXELES_CAMBIADOS = 0.002  # fracción de píxeles cambiados que aún cuenta como el mismo frame
+STREAM_CACHE_RESULTADOS = 16
+
+# Detección continua sobre el audio de cada cámara (opcional): ventana de
+# 5 s evaluada cada ~0.5 s; usa el stream audio.wav del pre-roll
+AUDIO_CONTINUO_ACTIVO = False
+AUDIO_UMBRAL_RIESGO = 0.8         # probabilidad que ya cuenta como lectura de riesgo
+AUDIO_MAX_ANTIGUEDAD = 2.0        # segundos; más viejo => modelo sobre la grabación
 
 # API REST DASHBOARD
 API_URL = "http://localhost:5001/api"
+DASHBOARD_CONCURRENCIA = 8        # peticiones/conexiones simultáneas
+LOTE_MAX_LECTURAS = 50            # lecturas por POST a /sensores/lote
+LOTE_MAX_ESPERA = 0.5             # segundos máximos que espera una lectura
+
+# Outbox persistente para dashboard, S3 y Telegram (reintentos con backoff)
+OUTBOX_PATH = "outbox.db"
+OUTBOX_CONCURRENCIA = {"dashboard": 4, "s3": 2, "telegram": 1}
+OUTBOX_BACKOFF_MAX = 300          # segundos entre reintentos como máximo
+OUTBOX_MAX_INTENTOS = 50          # después la tarea queda como fallida
+OUTBOX_RETENCION = 7              # días que se conservan las fallidas (para revisarlas) y las hechas (idempotencia)
+OUTBOX_MUESTREO = 5               # segundos entre mediciones de la profundidad (para el log)
+
+# Detector de imagen: "ultralytics" (PyTorch), "onnx", "openvino" o "server"
+# (los modelos onnx/openvino se generan con DeteccionImagen/export_model.py;
+# "server" usa el modelo compartido de DeteccionImagen/inference_server.py)
+YOLO_BACKEND = "ultralytics"
+YOLO_MODELO = None                # None = ruta por defecto (URL para "server")
+YOLO_HILOS = None                 # hilos de CPU (None = automático)
+# Modo mosaico: la foto se analiza a resolución completa por recortes
+# solapados (más lento, pero no pierde fuegos pequeños o lejanos)
+YOLO_MOSAICO = False
 
 # Umbrales
 TEMP_UMBRAL = 45
@@ -46,19 +117,78 @@ HUMEDAD_MIN = 20
 LECTURAS_RIESGO = 5
 LECTURAS_RECUPERACION = 5
 
-# ════════════════════════════════════════════
-# ESTADO LOCAL
-# ════════════════════════════════════════════
-estado_local = "Normal"
-contador_riesgo = 0
-contador_normal = 0
-evidencia_tomada = False
+# Workers en segundo plano (captura, IA, subidas, alertas)
+NUM_WORKERS = 4
+TAMANO_COLA = 100
+
+# Shards de la máquina de estados (un hilo por shard)
+NUM_SHARDS = 4
+TAMANO_COLA_SHARD = 1000
 
 # Umbral de decisión
 PESO_IMAGEN = 0.9
 PESO_AUDIO = 0.1
 UMBRAL_ALERTA = 0.6
-alerta_enviada = False
+
+# ════════════════════════════════════════════
+# ESTADO LOCAL (por dispositivo)
+# ════════════════════════════════════════════
+# Todas las lecturas y resultados de un dispositivo se aplican
+# en el hilo de su shard, así que su estado no necesita locks
+dispositivos = TablaDispositivos(NUM_SHARDS, TAMANO_COLA_SHARD)
+cola_tareas = ColaTareas(NUM_WORKERS, TAMANO_COLA)
+
+# Ramas paralelas de cada evidencia (foto+YOLO y audio+ML)
+pool_evidencia = ThreadPoolExecutor(max_workers=2 * NUM_WORKERS, thread_name_prefix="evidencia")
+# Una única instancia de YOLO compartida: las inferencias se serializan
+lock_yolo = threading.Lock()
+
+# Capturadores pre-roll por URL de cámara
+capturadores = {}
+
+# Detectores de vídeo continuo por URL de cámara
+detectores_stream = {}
+
+# Detectores de audio continuo por URL de cámara
+detectores_audio = {}
+
+# Cliente HTTP compartido (keep-alive) para todos los envíos al dashboard
+dashboard = ClienteDashboard(API_URL, DASHBOARD_CONCURRENCIA)
+
+# Todos los efectos secundarios pasan por el outbox: la detección solo
+# inserta una fila en SQLite y los workers de cada destino reintentan
+outbox = Outbox(
+    OUTBOX_PATH, OUTBOX_CONCURRENCIA,
+    backoff_max=OUTBOX_BACKOFF_MAX,
+    max_intentos=OUTBOX_MAX_INTENTOS,
+    retencion=OUTBOX_RETENCION * 86400
+)
+
+# Profundidad del outbox muestreada en segundo plano: la consulta recorre
+# toda la tabla y no debe correr en el callback de MQTT
+profundidad_outbox = {}
+
+def muestrear_outbox():
+    global profundidad_outbox
+    while True:
+        try:
+            profundidad_outbox = outbox.profundidad()
+        except Exception as e:
+            print(f"⚠️ No se pudo medir el outbox: {e}")
+        time.sleep(OUTBOX_MUESTREO)
+
+threading.Thread(target=muestrear_outbox, name="muestreo-outbox", daemon=True).start()
+
+# Las lecturas de todos los dispositivos se agrupan en micro-lotes
+lote_sensores = MicroLote(
+    lambda lecturas: outbox.encolar("dashboard", "json", {
+        "endpoint": "sensores/lote",
+        "json": {"lecturas": lecturas}
+    }),
+    max_lote=LOTE_MAX_LECTURAS,
+    max_espera=LOTE_MAX_ESPERA,
+    nombre="lote-sensores"
+)
 
 # Cliente S3 (opcional, para subir a AWS)
 s3_client = boto3.client('s3')
@@ -68,57 +198,209 @@ BUCKET_NAME = "incendios-multimedia-227338491492"
 # FUNCIONES DE CAPTURA
 # ════════════════════════════════════════════
 
-def tomar_foto():
-    """Captura foto desde cámara IP"""
+def camara_de(dispositivo):
+    """URL de la cámara IP asociada al dispositivo"""
+    return CAMARAS.get(dispositivo, CAMERA_URL)
+
+
+def iniciar_capturador(url):
+    """Capturador en segundo plano de una cámara (uno solo por URL)"""
+    if url not in capturadores:
+        capturador = CapturadorCamara(
+            url,
+            intervalo_foto=PREROLL_INTERVALO_FOTO,
+            max_fotos=PREROLL_MAX_FOTOS,
+            max_bytes_fotos=PREROLL_MAX_MB_FOTOS * 1024 * 1024,
+            segundos_audio=PREROLL_SEGUNDOS_AUDIO,
+            max_bytes_audio=PREROLL_MAX_MB_AUDIO * 1024 * 1024
+        )
+        capturador.iniciar()
+        capturadores[url] = capturador
+        print(f"🎞 Pre-roll activo: {url}")
+    return capturadores[url]
+
+
+def iniciar_preroll():
+    """Arranca un capturador en segundo plano por cada cámara configurada"""
+    for url in {CAMERA_URL, *CAMARAS.values()}:
+        iniciar_capturador(url)
+
+
+def detectar_frames(frames):
+    """Inferencia por lotes para StreamDetector (comparte la instancia de YOLO)"""
+    with lock_yolo:
+        return get_backend().predict(frames, STREAM_CONFIANZA_MIN)
+
+
+def avisar_stream(url):
+    """Suscriptor: avisa cuando la confianza rolling de una cámara cruza el umbral"""
+    estado = {"alto": False}
+
+    def al_actualizar(actualizacion):
+        alto = actualizacion.rolling_confidence >= UMBRAL_ALERTA
+        if alto != estado["alto"]:
+            estado["alto"] = alto
+            icono = "🔥" if alto else "✅"
+            print(f"{icono} Vídeo {url}: confianza rolling {actualizacion.rolling_confidence:.2f}")
+
+    return al_actualizar
+
+
+def iniciar_streams():
+    """Arranca un detector de vídeo continuo por cada cámara configurada"""
+    for url in {CAMERA_URL, *CAMARAS.values()}:
+        detector = StreamDetector(
+            STREAMS.get(url, url + STREAM_RUTA),
+            detectar_frames,
+            window=STREAM_VENTANA,
+            gate=ChangeGate(
+                STREAM_DIFERENCIA_PIXEL, STREAM_PIXELES_CAMBIADOS, cache_size=STREAM_CACHE_RESULTADOS
+            )
+            if STREAM_FILTRO_CAMBIOS else None,
+            name=f"stream-{len(detectores_stream)}"
+        )
+        detector.subscribe(avisar_stream(url))
+        detector.start()
+        detectores_stream[url] = detector
+        print(f"📹 Detección continua activa: {detector.source}")
+
+
+def stream_reciente(dispositivo):
+    """Última inferencia del vídeo de la cámara del dispositivo (o None)"""
+    detector = detectores_stream.get(camara_de(dispositivo))
+    return detector.latest(STREAM_MAX_ANTIGUEDAD) if detector else None
+
+
+def avisar_audio(url):
+    """Suscriptor: avisa cuando la probabilidad de audio de una cámara cruza el umbral"""
+    estado = {"alto": False}
+
+    def al_resultado(resultado):
+        alto = resultado.probabilidad >= AUDIO_UMBRAL_RIESGO
+        if alto != estado["alto"]:
+            estado["alto"] = alto
+            icono = "🔥" if alto else "✅"
+            print(f"{icono} Audio {url}: probabilidad de incendio {resultado.probabilidad:.2f}")
+
+    return al_resultado
+
+
+def iniciar_audio_continuo():
+    """Engancha un detector de audio continuo al stream PCM de cada cámara"""
+    for url in {CAMERA_URL, *CAMARAS.values()}:
+        detector = DetectorAudioStream(probabilidad_incendio, al_resultado=avisar_audio(url))
+        iniciar_capturador(url).suscribir_pcm(detector.agregar_pcm)
+        detectores_audio[url] = detector
+        print(f"🎙 Detección continua de audio activa: {url}")
+
+
+def audio_continuo(dispositivo):
+    """Última ventana de audio analizada de la cámara del dispositivo (o None)"""
+    detector = detectores_audio.get(camara_de(dispositivo))
+    return detector.ultimo(AUDIO_MAX_ANTIGUEDAD) if detector else None
+
+
+def guardar_atomico(ruta, datos):
+    """Escritura atómica: nadie lee un archivo a medio escribir"""
+    with open(ruta + ".tmp", "wb") as f:
+        f.write(datos)
+    os.replace(ruta + ".tmp", ruta)
+
+
+def tomar_foto(dispositivo):
+    """Captura foto desde cámara IP (o desde el pre-roll). Devuelve bytes JPEG o None"""
     try:
-        img = requests.get(f"{CAMERA_URL}/shot.jpg", timeout=5).content
-        with open(PHOTO_PATH, "wb") as f:
-            f.write(img)
+        capturador = capturadores.get(camara_de(dispositivo))
+        img = capturador.ultima_foto(PREROLL_MAX_ANTIGUEDAD_FOTO) if capturador else None
+        if img is None:
+            img = requests.get(f"{camara_de(dispositivo)}/shot.jpg", timeout=5).content
+        else:
+            print("🎞 Foto tomada del pre-roll")
         print("✅ Foto capturada")
-        return True
+        return img
     except Exception as e:
         print(f"❌ Error tomando foto: {e}")
-        return False
+        return None
 
 
-def grabar_audio(duracion=5):
-    """Graba audio desde cámara IP"""
+def grabar_audio(dispositivo, duracion=5):
+    """Graba audio desde cámara IP (o desde el pre-roll). Devuelve bytes WAV o None"""
     try:
-        response = requests.get(f"{CAMERA_URL}/audio.wav", stream=True, timeout=duracion+2)
-        with open(AUDIO_PATH, "wb") as f:
-            inicio = time.time()
-            for chunk in response.iter_content(chunk_size=1024):
-                if chunk:
-                    f.write(chunk)
-                if time.time() - inicio > duracion:
-                    break
+        capturador = capturadores.get(camara_de(dispositivo))
+        wav = capturador.audio_reciente(duracion) if capturador else None
+        if wav is not None:
+            print("🎞 Audio tomado del pre-roll")
+            return wav
+
+        response = requests.get(f"{camara_de(dispositivo)}/audio.wav", stream=True, timeout=duracion+2)
+        audio = bytearray()
+        inicio = time.time()
+        for chunk in response.iter_content(chunk_size=1024):
+            if chunk:
+                audio += chunk
+            if time.time() - inicio > duracion:
+                break
         print("✅ Audio grabado")
-        return True
+        return bytes(audio)
     except Exception as e:
         print(f"❌ Error grabando audio: {e}")
-        return False
+        return None
+
+
+def nueva_evidencia(dispositivo):
+    """Evidencia de un evento: id único y rutas donde se persiste (una sola vez)"""
+    evento_id = f"{dispositivo}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+    return {
+        "evento_id": evento_id,
+        "dispositivo": dispositivo,
+        "directorio": os.path.join(EVIDENCIAS_DIR, evento_id),
+        "foto": None,
+        "audio": None,
+        "confirmada": False,     # la máquina de estados aceptó la alerta
+    }
+
+
+def persistir_evidencia(evidencia, tipo, nombre, datos):
+    """Guarda la evidencia del evento en disco y registra su ruta y su hash"""
+    os.makedirs(evidencia["directorio"], exist_ok=True)
+    ruta = os.path.join(evidencia["directorio"], nombre)
+    guardar_atomico(ruta, datos)
+    evidencia[f"hash_{tipo}"] = hashlib.sha256(datos).hexdigest()
+    evidencia[tipo] = ruta
+    return ruta
 
 
 # ════════════════════════════════════════════
 # FUNCIONES DE ANÁLISIS IA
 # ════════════════════════════════════════════
 
-def detectar_incendio_imagen(image_path):
-    """Detecta incendio en imagen con YOLOv8"""
-    result = detect_fire(image_path)
+def detectar_incendio_imagen(imagen, evidencia=None):
+    """
+    Detecta incendio en imagen con YOLOv8 (ruta, bytes o ndarray).
+    La imagen anotada se genera fuera del camino crítico.
+    """
+    with lock_yolo:
+        deteccion = locate_fire(imagen, tiled=YOLO_MOSAICO)
     
-    if result is False:
+    if deteccion is None:
         return {"confianza": 0.0}
-    else:
-        detected, image_path, confidence = result
-        return {"confianza": confidence}
 
+    confidence, box, frame = deteccion
+    if evidencia is not None:
+        ruta = os.path.join(evidencia["directorio"], "foto_anotada.jpg")
+        cola_tareas.encolar(save_annotated, frame, box, confidence, ruta)
+    return {"confianza": confidence}
 
-def decidir_alerta(prob_imagen, prob_audio):
-    """Fusiona probabilidades de imagen y audio"""
+
+def decidir_alerta(prob_imagen, prob_audio=None):
+    """
+    Fusiona probabilidades de imagen y audio.
+    Sin audio (prob_audio=None) se evalúa la cota inferior (audio = 0):
+    si aun así se supera el umbral, la alerta ya es segura.
+    """
     score = (
         PESO_IMAGEN * prob_imagen +
-        PESO_AUDIO * prob_audio
+        PESO_AUDIO * (prob_audio or 0.0)
     )
     return score >= UMBRAL_ALERTA, score
 
@@ -127,89 +409,112 @@ def decidir_alerta(prob_imagen, prob_audio):
 # FUNCIONES DE DASHBOARD (API REST)
 # ════════════════════════════════════════════
 
-def enviar_datos(temp, hum, lum):
-    """Envía datos de sensores al dashboard"""
-    data = {
+# Todas las funciones enviar_* son no bloqueantes: guardan el envío en el
+# outbox y un worker lo hace llegar al dashboard (con reintentos).
+
+def enviar_datos(dispositivo, temp, hum, lum):
+    """Añade la lectura al micro-lote que se envía al dashboard"""
+    lote_sensores.agregar({
+        "dispositivo": dispositivo,
         "temperatura": round(temp, 1),
         "humedad": round(hum, 1),
-        "luminosidad": round(lum, 0)
-    }
-    try:
-        response = requests.post(f"{API_URL}/sensores", json=data, timeout=5)
-        if response.status_code == 201:
-            print(f"📊 Dashboard actualizado: {data}")
-        else:
-            print(f"⚠️ Error dashboard: {response.status_code}")
-    except Exception as e:
-        print(f"❌ Error enviando datos dashboard: {e}")
+        "luminosidad": round(lum, 0),
+        "timestamp": datetime.now().isoformat()
+    })
+    return True
+
+
+def enviar_estado(dispositivo, estado):
+    """Envía estado al dashboard (solo el último: reemplaza al que siga pendiente)"""
+    data = {"dispositivo": dispositivo, "estado": estado}
+    return outbox.encolar(
+        "dashboard", "json", {"endpoint": "estado", "json": data},
+        clave=f"estado:{dispositivo}", reemplazar=True
+    )
 
 
-def enviar_estado(estado):
-    """Envía estado al dashboard"""
-    data = {"estado": estado}
-    try:
-        response = requests.post(f"{API_URL}/estado", json=data, timeout=5)
-        if response.status_code == 201:
-            print(f"📡 Estado enviado: {estado}")
-    except Exception as e:
-        print(f"❌ Error enviando estado: {e}")
+# Hash del último contenido entregado al dashboard por (dispositivo, tipo):
+# la misma foto/audio no se vuelve a subir mientras no cambie. Lo anota el
+# manejador del outbox tras un 2xx, así un envío fallido se puede repetir
+media_enviada = {}
+lock_media = threading.Lock()
 
 
-def enviar_imagen(ruta_imagen):
-    """Envía imagen al dashboard"""
-    try:
-        with open(ruta_imagen, "rb") as img_file:
-            b64_string = base64.b64encode(img_file.read()).decode("utf-8")
-            data_url = f"data:image/jpeg;base64,{b64_string}"
-        
-        payload = {
-            "nombre": ruta_imagen.split("/")[-1],
-            "data_url": data_url
-        }
-        
-        response = requests.post(f"{API_URL}/imagen", json=payload, timeout=5)
-        if response.status_code == 201:
-            print(f"📸 Imagen enviada al dashboard: {payload['nombre']}")
-        else:
-            print(f"⚠️ Error enviando imagen: {response.status_code}")
-    except Exception as e:
-        print(f"❌ Error enviando imagen: {e}")
+def ya_enviado(clave, hash_contenido):
+    """True si ese contenido es el último que el dashboard recibió para esa clave"""
+    with lock_media:
+        return media_enviada.get(clave) == hash_contenido
 
 
-def enviar_audio(ruta_audio):
-    """Envía audio al dashboard"""
-    try:
-        mime_type, _ = mimetypes.guess_type(ruta_audio)
-        if not mime_type:
-            mime_type = "audio/wav"
-        
-        with open(ruta_audio, "rb") as audio_file:
-            b64_string = base64.b64encode(audio_file.read()).decode("utf-8")
-            data_url = f"data:{mime_type};base64,{b64_string}"
-        
-        payload = {
-            "nombre": ruta_audio.split("/")[-1],
-            "data_url": data_url
-        }
-        
-        response = requests.post(f"{API_URL}/audio", json=payload, timeout=5)
-        if response.status_code == 201:
-            print(f"🎙 Audio enviado al dashboard: {payload['nombre']}")
-        else:
-            print(f"⚠️ Error enviando audio: {response.status_code}")
-    except Exception as e:
-        print(f"❌ Error enviando audio: {e}")
+def marcar_enviado(clave, hash_contenido):
+    with lock_media:
+        media_enviada[clave] = hash_contenido
+
+
+def enviar_media(endpoint, ruta, mime_type, dispositivo, hash_contenido):
+    """
+    Envía una imagen o audio al dashboard solo si su contenido (sha256)
+    cambió desde el último envío de ese dispositivo.
+    """
+    if hash_contenido is None:
+        try:
+            with open(ruta, "rb") as media_file:
+                hash_contenido = hashlib.sha256(media_file.read()).hexdigest()
+        except Exception as e:
+            print(f"❌ Error enviando {endpoint}: {e}")
+            return False
+
+    if ya_enviado((dispositivo, endpoint), hash_contenido):
+        return True
+
+    # Cuerpo binario (sin base64); el dashboard lo sirve luego por URL.
+    # Con reemplazar=True una tarea fallida (o ya entregada, si después se
+    # envió otro contenido) con el mismo hash se vuelve a enviar; una
+    # pendiente con el mismo payload no se duplica
+    return outbox.encolar("dashboard", "media", {
+        "endpoint": f"media/{endpoint}",
+        "ruta": ruta,
+        "mime": mime_type,
+        "hash": hash_contenido,
+        "params": {"nombre": ruta.split("/")[-1], "dispositivo": dispositivo}
+    }, clave=f"media:{dispositivo}:{endpoint}:{hash_contenido}", reemplazar=True)
+
+
+def enviar_imagen(ruta_imagen, dispositivo=DISPOSITIVO_DEFECTO, hash_contenido=None):
+    """Envía imagen al dashboard (si cambió)"""
+    return enviar_media("imagen", ruta_imagen, "image/jpeg", dispositivo, hash_contenido)
+
+
+def enviar_audio(ruta_audio, dispositivo=DISPOSITIVO_DEFECTO, hash_contenido=None):
+    """Envía audio al dashboard (si cambió)"""
+    mime_type, _ = mimetypes.guess_type(ruta_audio)
+    if not mime_type:
+        mime_type = "audio/wav"
+    return enviar_media("audio", ruta_audio, mime_type, dispositivo, hash_contenido)
+
+
+def enviar_evidencia(evidencia):
+    """Envía la foto/audio del evento que aún no estén en el dashboard"""
+    dispositivo = evidencia["dispositivo"]
+    if evidencia["foto"]:
+        enviar_imagen(evidencia["foto"], dispositivo, evidencia["hash_foto"])
+    if evidencia["audio"]:
+        enviar_audio(evidencia["audio"], dispositivo, evidencia["hash_audio"])
 
 
 # ════════════════════════════════════════════
 # FUNCIONES AWS (OPCIONAL - PARA LAMBDA)
 # ════════════════════════════════════════════
 
-def subir_a_s3(archivo_local, carpeta="fotos"):
+def clave_s3(archivo_local, carpeta="fotos"):
+    timestamp = datetime.now().strftime("%Y-%m-%d")
+    return f"{carpeta}/{timestamp}/{archivo_local}"
+
+
+def subir_a_s3(archivo_local, carpeta="fotos", s3_key=None):
     """Sube archivo a S3 (opcional)"""
     try:
-        timestamp = datetime.now().strftime("%Y-%m-%d")
-        s3_key = f"{carpeta}/{timestamp}/{archivo_local}"
+        s3_key = s3_key or clave_s3(archivo_local, carpeta)
         
         print(f"☁️ Subiendo a S3: {s3_key}...")
         s3_client.upload_file(
@@ -254,145 +559,341 @@ def invocar_lambda_analisis(foto_s3, audio_s3, evento_id):
 
 
 # ════════════════════════════════════════════
-# CALLBACK: LÓGICA PRINCIPAL
+# MANEJADORES DEL OUTBOX (workers por destino)
 # ════════════════════════════════════════════
+# Lanzan excepción para que el outbox reintente con backoff;
+# ErrorPermanente descarta la tarea (no tiene arreglo reintentando).
+
+def comprobar_respuesta(response, endpoint):
+    if response.status_code in (200, 201):
+        return response
+    if 400 <= response.status_code < 500 and response.status_code not in (408, 429):
+        raise ErrorPermanente(f"/{endpoint} respondió {response.status_code}")
+    raise RuntimeError(f"/{endpoint} respondió {response.status_code}")
+
+
+def outbox_dashboard_json(payload):
+    endpoint = payload["endpoint"]
+    comprobar_respuesta(dashboard.post(endpoint, json=payload["json"]), endpoint)
+    if endpoint == "estado":
+        print(f"📡 [{payload['json']['dispositivo']}] Estado enviado: {payload['json']['estado']}")
+    else:
+        print(f"📊 Dashboard actualizado: {len(payload['json'].get('lecturas', []))} lecturas")
 
-def on_message_received(topic, payload, **kwargs):
+
+def outbox_dashboard_media(payload):
+    endpoint = payload["endpoint"]
+    try:
+        with open(payload["ruta"], "rb") as media_file:
+            contenido = media_file.read()
+    except FileNotFoundError as e:
+        raise ErrorPermanente(e)
+    response = dashboard.post(
+        endpoint, data=contenido, params=payload["params"],
+        headers={"Content-Type": payload["mime"]}
+    )
+    comprobar_respuesta(response, endpoint)
+    if payload.get("hash"):
+        marcar_enviado((payload["params"]["dispositivo"], endpoint.split("/")[-1]), payload["hash"])
+    print(f"🖼 Evidencia enviada al dashboard: {payload['params']['nombre']}")
+
+
+def outbox_s3(payload):
+    if not os.path.exists(payload["ruta"]):
+        raise ErrorPermanente(f"No existe {payload['ruta']}")
+    if subir_a_s3(payload["ruta"], s3_key=payload["s3_key"]) is None:
+        raise RuntimeError("Subida a S3 fallida")
+
+
+def outbox_telegram(payload):
+    if not enviar_alerta_telegram(payload["foto"]):
+        raise RuntimeError("Telegram no aceptó la alerta")
+
+
+outbox.registrar("dashboard", "json", outbox_dashboard_json)
+outbox.registrar("dashboard", "media", outbox_dashboard_media)
+outbox.registrar("s3", "subir", outbox_s3)
+outbox.registrar("telegram", "alerta", outbox_telegram)
+
+
+def encolar_s3(evidencia, tipo, carpeta):
+    """Programa la subida a S3 de la evidencia (una vez por evento y tipo)"""
+    ruta = evidencia[tipo]
+    return outbox.encolar(
+        "s3", "subir",
+        {"ruta": ruta, "s3_key": clave_s3(ruta, carpeta)},
+        clave=f"s3:{evidencia['evento_id']}:{tipo}"
+    )
+
+
+# ════════════════════════════════════════════
+# TAREAS EN SEGUNDO PLANO (WORKERS)
+# ════════════════════════════════════════════
+
+def medir(tiempos, etapa, funcion, *args):
+    """Ejecuta funcion(*args) guardando su duración en tiempos[etapa]"""
+    inicio = time.perf_counter()
+    try:
+        return funcion(*args)
+    finally:
+        tiempos[etapa] = time.perf_counter() - inicio
+
+
+def rama_imagen(evidencia, tiempos):
+    """Captura la foto, la persiste, la envía al dashboard y la analiza con YOLOv8"""
+    jpeg = medir(tiempos, "foto", tomar_foto, evidencia["dispositivo"])
+    if jpeg is None:
+        return None
+    foto = persistir_evidencia(evidencia, "foto", "foto.jpg", jpeg)
+    enviar_imagen(foto, evidencia["dispositivo"], evidencia["hash_foto"])
+
+    # Si el vídeo ya se está analizando, la confianza máxima de su ventana
+    # evita otra inferencia (la media rolling diluye detecciones intermitentes
+    # de un fuego real y solo se usa para los avisos)
+    actualizacion = stream_reciente(evidencia["dispositivo"])
+    if actualizacion is not None:
+        if actualizacion.box is not None:
+            ruta = os.path.join(evidencia["directorio"], "foto_anotada.jpg")
+            cola_tareas.encolar(save_annotated, actualizacion.frame, actualizacion.box,
+                                actualizacion.confidence, ruta)
+        return actualizacion.peak_confidence
+
+    return medir(tiempos, "yolo", detectar_incendio_imagen, jpeg, evidencia)["confianza"]
+
+
+def rama_audio(evidencia, tiempos):
+    """Graba el audio, lo persiste, lo envía al dashboard y lo analiza con el modelo ML"""
+    wav = medir(tiempos, "audio", grabar_audio, evidencia["dispositivo"], 5)
+    if wav is None:
+        return None
+    audio = persistir_evidencia(evidencia, "audio", "audio.wav", wav)
+    enviar_audio(audio, evidencia["dispositivo"], evidencia["hash_audio"])
+
+    # Si el audio ya se está analizando de forma continua, usar la última ventana
+    resultado = audio_continuo(evidencia["dispositivo"])
+    if resultado is not None:
+        return resultado.probabilidad
+
+    return medir(tiempos, "audio_ml", detectar_incendio, wav)["confianza"]
+
+
+def procesar_evidencia(dispositivo, hum):
     """
-    Callback cuando llega mensaje MQTT de AWS IoT Core
-    Contiene toda la lógica de detección
+    Captura y analiza foto y audio en paralelo, en memoria.
+    Confirma en cuanto la imagen sola supera el umbral, sin esperar al audio.
+    El resultado se aplica a la máquina de estados del dispositivo.
     """
-    global estado_local
-    global contador_riesgo, contador_normal
-    global evidencia_tomada
-    global alerta_enviada
-    
-    # Parsear mensaje
-    data = json.loads(payload.decode('utf-8'))
-    
-    # Extraer datos
-    temp = data.get("temp", 0)
-    hum = data.get("hum", 0)
-    
-    # Adaptarse a ambos formatos (RGB o luz)
-    if "luz" in data:
-        luz = data["luz"]
+    if hum < HUMEDAD_MIN:
+        print(f"💧 [{dispositivo}] Humedad baja ({hum}%) - Condición favorable al fuego")
+
+    evidencia = nueva_evidencia(dispositivo)
+    print(f"\n🔍 [{dispositivo}] Capturando y analizando evidencia con IA ({evidencia['evento_id']})...")
+    tiempos = {}
+    inicio = time.perf_counter()
+    fut_imagen = pool_evidencia.submit(rama_imagen, evidencia, tiempos)
+    fut_audio = pool_evidencia.submit(rama_audio, evidencia, tiempos)
+
+    prob_imagen = prob_audio = None
+    confirmado = False
+    for fut in as_completed([fut_imagen, fut_audio]):
+        try:
+            valor = fut.result()
+        except Exception as e:
+            print(f"❌ [{dispositivo}] Error analizando evidencia: {e}")
+            valor = None
+
+        if fut is fut_imagen:
+            prob_imagen = valor
+            if valor is not None:
+                print(f"   📸 YOLOv8: {prob_imagen*100:.1f}%")
+        else:
+            prob_audio = valor
+            if valor is not None:
+                print(f"   🎙 Audio ML: {prob_audio*100:.1f}%")
+
+        # Confirmación temprana solo con la imagen
+        if not confirmado and prob_imagen is not None and prob_audio is None:
+            confirmado, score = decidir_alerta(prob_imagen)
+            if confirmado:
+                tiempos["confirmacion"] = time.perf_counter() - inicio
+                print(f"   ⚡ Confirmación temprana por imagen ({score*100:.1f}%)")
+                dispositivos.encolar(dispositivo, aplicar_resultado_analisis, True, evidencia)
+
+    tiempos["total"] = time.perf_counter() - inicio
+
+    if prob_imagen is not None and prob_audio is not None:
+        # Fusión de probabilidades
+        alerta_final, score = decidir_alerta(prob_imagen, prob_audio)
+        print(f"   🎯 Score final: {score*100:.1f}%")
+        if not confirmado:
+            if alerta_final:
+                tiempos["confirmacion"] = tiempos["total"]
+            dispositivos.encolar(dispositivo, aplicar_resultado_analisis, alerta_final, evidencia)
+
+    # Con confirmación temprana la alerta salió antes de tener el audio.
+    # Se decide en el hilo del shard, después de aplicar_resultado_analisis:
+    # si el resultado se descartó no se sube nada
+    if confirmado and evidencia["audio"]:
+        dispositivos.encolar(dispositivo, subir_audio_confirmado, evidencia)
+
+    print(f"   ⏱ [{dispositivo}] Tiempos: " + " | ".join(
+        f"{etapa} {segundos:.2f}s" for etapa, segundos in tiempos.items()
+    ))
+    return tiempos
+
+
+def aplicar_resultado_analisis(estado, alerta_final, evidencia):
+    """Actualiza la máquina de estados con el resultado del análisis IA"""
+    # El entorno pudo estabilizarse mientras se analizaba
+    if estado.estado != "Riesgo":
+        print(f"ℹ️ [{estado.dispositivo}] Resultado IA descartado: el estado ya cambió")
+        return
+
+    if alerta_final:
+        estado.estado = "Confirmado"
+        estado.alerta_enviada = False
+        estado.evidencia = evidencia
+        evidencia["confirmada"] = True
+        print(f"\n🚨🚨🚨 [{estado.dispositivo}] INCENDIO CONFIRMADO 🚨🚨🚨")
     else:
-        r = data.get("r", 0)
-        g = data.get("g", 0)
-        b = data.get("b", 0)
-        luz = r + g + b
-    
-    print(f"\n📊 DATOS RECIBIDOS:")
-    print(f"   🌡 Temp: {temp}°C | 💧 Hum: {hum}% | 💡 Luz: {luz}")
-    
-    # Enviar al dashboard
-    enviar_datos(temp, hum, luz)
-    
-    # Detectar condiciones de riesgo
+        print(f"✅ [{estado.dispositivo}] Evidencia insuficiente, continuando monitoreo...")
+
+
+def subir_audio_confirmado(estado, evidencia):
+    """Sube el audio de una confirmación temprana solo si la alerta se aplicó"""
+    if evidencia["confirmada"]:
+        encolar_s3(evidencia, "audio", "audios")
+
+
+def notificar_incendio(evidencia):
+    """Programa la alerta por Telegram y la subida de la evidencia a S3"""
+    print(f"\n📱 [{evidencia['dispositivo']}] Enviando alerta Telegram...")
+    evento_id = evidencia["evento_id"]
+    outbox.encolar("telegram", "alerta", {"foto": evidencia["foto"]}, clave=f"telegram:{evento_id}")
+
+    # Subir a S3 (fotos y audios se guardan local y en S3)
+    encolar_s3(evidencia, "foto", "fotos")
+    # Con confirmación temprana el audio lo encola procesar_evidencia al terminar
+    if evidencia["audio"]:
+        encolar_s3(evidencia, "audio", "audios")
+
+    # TODO: Invocar Lambda cuando los modelos estén en la nube
+    # invocar_lambda_analisis(foto_s3, audio_s3, evento_id)
+    return True
+
+
+# ════════════════════════════════════════════
+# MÁQUINA DE ESTADOS (hilo del shard)
+# ════════════════════════════════════════════
+
+def procesar_lectura(estado, temp, hum, luz):
+    """Aplica una lectura de sensores a la máquina de estados del dispositivo"""
+    dispositivo = estado.dispositivo
+
+    # Detectar condiciones de riesgo (el audio continuo es una señal temprana:
+    # el crepitar suele oírse antes de que suban temperatura o luz)
     condicion_riesgo = (temp > TEMP_UMBRAL) or (luz > LUZ_UMBRAL)
+    resultado_audio = audio_continuo(dispositivo)
+    if not condicion_riesgo and resultado_audio is not None \
+            and resultado_audio.probabilidad >= AUDIO_UMBRAL_RIESGO:
+        condicion_riesgo = True
+        print(f"🎙 [{dispositivo}] Riesgo por audio (probabilidad {resultado_audio.probabilidad:.2f})")
     
     # ════════════════════════════════════════════
     # ESTADO: NORMAL
     # ════════════════════════════════════════════
-    if estado_local == "Normal":
-        enviar_estado("normal")
+    if estado.estado == "Normal":
+        enviar_estado(dispositivo, "normal")
         
         if condicion_riesgo:
-            contador_riesgo += 1
-            print(f"⚠️ Lecturas en riesgo: {contador_riesgo}/{LECTURAS_RIESGO}")
+            estado.contador_riesgo += 1
+            print(f"⚠️ [{dispositivo}] Lecturas en riesgo: {estado.contador_riesgo}/{LECTURAS_RIESGO}")
             
-            if contador_riesgo >= LECTURAS_RIESGO:
-                estado_local = "Riesgo"
-                evidencia_tomada = False
-                contador_normal = 0
-                print("🔥 Estado: RIESGO - Capturando evidencias...")
+            if estado.contador_riesgo >= LECTURAS_RIESGO:
+                estado.estado = "Riesgo"
+                estado.evidencia_tomada = False
+                estado.contador_normal = 0
+                print(f"🔥 [{dispositivo}] Estado: RIESGO - Capturando evidencias...")
         else:
-            contador_riesgo = 0
+            estado.contador_riesgo = 0
     
     # ════════════════════════════════════════════
     # ESTADO: RIESGO
     # ════════════════════════════════════════════
-    elif estado_local == "Riesgo":
-        enviar_estado("riesgo")
+    elif estado.estado == "Riesgo":
+        enviar_estado(dispositivo, "riesgo")
         
-        # Tomar evidencia SOLO UNA VEZ
-        if not evidencia_tomada:
-            if hum < HUMEDAD_MIN:
-                print(f"💧 Humedad baja ({hum}%) - Condición favorable al fuego")
-            
-            # CAPTURAR EVIDENCIA
-            foto_ok = tomar_foto()
-            audio_ok = grabar_audio(5)
-            evidencia_tomada = True
-            
-            if foto_ok and audio_ok:
-                # Enviar al dashboard
-                enviar_imagen(PHOTO_PATH)
-                enviar_audio(AUDIO_PATH)
-                
-                # ===== ANÁLISIS CON IA =====
-                print("\n🔍 Analizando evidencia con IA...")
-                
-                # Detección por audio
-                resultado_audio = detectar_incendio(AUDIO_PATH)
-                prob_audio = resultado_audio["confianza"]
-                print(f"   🎙 Audio ML: {prob_audio*100:.1f}%")
-                
-                # Detección por imagen
-                resultado_imagen = detectar_incendio_imagen(PHOTO_PATH)
-                prob_imagen = resultado_imagen["confianza"]
-                print(f"   📸 YOLOv8: {prob_imagen*100:.1f}%")
-                
-                # Fusión de probabilidades
-                alerta_final, score = decidir_alerta(prob_imagen, prob_audio)
-                print(f"   🎯 Score final: {score*100:.1f}%")
-                
-                if alerta_final:
-                    estado_local = "Confirmado"
-                    alerta_enviada = False
-                    print("\n🚨🚨🚨 INCENDIO CONFIRMADO 🚨🚨🚨")
-                else:
-                    print("✅ Evidencia insuficiente, continuando monitoreo...")
+        # Tomar evidencia SOLO UNA VEZ (en segundo plano)
+        if not estado.evidencia_tomada:
+            estado.evidencia_tomada = cola_tareas.encolar(procesar_evidencia, dispositivo, hum)
         
         # Verificar recuperación
         if not condicion_riesgo:
-            contador_normal += 1
-            print(f"✅ Lecturas normales: {contador_normal}/{LECTURAS_RECUPERACION}")
+            estado.contador_normal += 1
+            print(f"✅ [{dispositivo}] Lecturas normales: {estado.contador_normal}/{LECTURAS_RECUPERACION}")
             
-            if contador_normal >= LECTURAS_RECUPERACION:
-                estado_local = "Normal"
-                contador_riesgo = 0
-                contador_normal = 0
-                evidencia_tomada = False
-                alerta_enviada = False
-                print("✅ Estado: Entorno ESTABILIZADO")
+            if estado.contador_normal >= LECTURAS_RECUPERACION:
+                estado.estado = "Normal"
+                estado.contador_riesgo = 0
+                estado.contador_normal = 0
+                estado.evidencia_tomada = False
+                estado.alerta_enviada = False
+                estado.evidencia = None
+                print(f"✅ [{dispositivo}] Estado: Entorno ESTABILIZADO")
         else:
-            contador_normal = 0
+            estado.contador_normal = 0
     
     # ════════════════════════════════════════════
     # ESTADO: CONFIRMADO
     # ════════════════════════════════════════════
-    elif estado_local == "Confirmado":
-        enviar_estado("incendio confirmado")
-        enviar_imagen(PHOTO_PATH)
-        enviar_audio(AUDIO_PATH)
+    elif estado.estado == "Confirmado":
+        enviar_estado(dispositivo, "incendio confirmado")
+        # Solo se sube lo que cambió (p. ej. el audio que llegó tras la confirmación)
+        enviar_evidencia(estado.evidencia)
         
-        if not alerta_enviada:
-            print("\n📱 Enviando alerta Telegram...")
-            enviar_alerta_telegram(PHOTO_PATH)
-            alerta_enviada = True
-            
-            # Subir a S3 (fotos y audios se guardan local y en S3)
-            evento_id = f"incendio_{int(time.time())}"
-            foto_s3 = subir_a_s3(PHOTO_PATH, "fotos")
-            audio_s3 = subir_a_s3(AUDIO_PATH, "audios")
-            
-            # TODO: Invocar Lambda cuando los modelos estén en la nube
-            # if foto_s3 and audio_s3:
-            #     invocar_lambda_analisis(foto_s3, audio_s3, evento_id)
+        if not estado.alerta_enviada:
+            estado.alerta_enviada = notificar_incendio(estado.evidencia)
+    
+    print(f"📍 [{dispositivo}] Estado actual: {estado.estado}")
+
+
+# ════════════════════════════════════════════
+# CALLBACK: LÓGICA PRINCIPAL
+# ════════════════════════════════════════════
+
+def on_message_received(topic, payload, **kwargs):
+    """
+    Callback cuando llega mensaje MQTT de AWS IoT Core
+    Solo parsea y encola la lectura en el shard de su dispositivo
+    """
+    # Parsear mensaje
+    data = json.loads(payload.decode('utf-8'))
     
-    print(f"📍 Estado actual: {estado_local}")
+    # Extraer datos
+    dispositivo = str(data.get("device", DISPOSITIVO_DEFECTO))
+    temp = data.get("temp", 0)
+    hum = data.get("hum", 0)
+    
+    # Adaptarse a ambos formatos (RGB o luz)
+    if "luz" in data:
+        luz = data["luz"]
+    else:
+        r = data.get("r", 0)
+        g = data.get("g", 0)
+        b = data.get("b", 0)
+        luz = r + g + b
+    
+    print(f"\n📊 DATOS RECIBIDOS [{dispositivo}]:")
+    print(f"   🌡 Temp: {temp}°C | 💧 Hum: {hum}% | 💡 Luz: {luz}")
+    
+    # Enviar al dashboard
+    enviar_datos(dispositivo, temp, hum, luz)
+    
+    # Aplicar la lectura en el hilo del shard del dispositivo
+    if not dispositivos.encolar(dispositivo, procesar_lectura, temp, hum, luz):
+        print(f"⚠️ [{dispositivo}] Shard saturado, lectura descartada")
+    
+    print(f"📍 Dispositivos: {len(dispositivos)} | Lecturas pendientes: {dispositivos.pendientes()} | Tareas pendientes: {cola_tareas.pendientes()} | Outbox: {profundidad_outbox}")
     print("-" * 60)
 
 
@@ -443,6 +944,24 @@ except Exception as e:
     print(f"   • Confirma que el endpoint coincida con: aws iot describe-endpoint --endpoint-type iot:Data-ATS")
     exit(1)
 
+# Cargar los modelos antes de la primera alerta (se recargan solos si
+# el archivo cambia en disco)
+print(f"🧠 Cargando detector de imagen ({YOLO_BACKEND})...")
+use_backend(YOLO_BACKEND, YOLO_MODELO, YOLO_HILOS)
+try:
+    registro.obtener("audio_incendio")
+except FileNotFoundError:
+    print("⚠️ Modelo de audio no entrenado: ejecuta DeteccionAudio/entrenar_modelo.py")
+
+if PREROLL_ACTIVO:
+    iniciar_preroll()
+
+if STREAM_ACTIVO:
+    iniciar_streams()
+
+if AUDIO_CONTINUO_ACTIVO:
+    iniciar_audio_continuo()
+
 print(f"👂 Suscribiéndose al topic: {TOPIC_SENSORES}")
 subscribe_future, packet_id = mqtt_connection.subscribe(
     topic=TOPIC_SENSORES,
@@ -472,5 +991,16 @@ try:
 except KeyboardInterrupt:
     print("\n\n⛔ Deteniendo sistema...")
     mqtt_connection.disconnect()
+    dispositivos.detener()
+    cola_tareas.detener()
+    lote_sensores.cerrar()
+    outbox.cerrar()
+    dashboard.cerrar()
+    pool_evidencia.shutdown(wait=False)
+    for capturador in capturadores.values():
+        capturador.detener()
+    for url, detector in detectores_stream.items():
+        detector.stop()
+        print(f"📹 {url}: {detector.stats()}")
     print("✅ Desconectado de AWS IoT Core")
     print("👋 Sistema finalizado")
\ No newline at end of file
@@ -0,0 +1,260 @@
+# ============================================
+# OUTBOX PERSISTENTE
+# Cola en SQLite (modo WAL) para los efectos secundarios
+# (dashboard, S3, Telegram) con reintentos y backoff
+# ============================================
+
+import json
+import random
+import sqlite3
+import threading
+import time
+
+
+class ErrorPermanente(Exception):
+    """El envío falló de forma definitiva: no tiene sentido reintentarlo"""
+
+
+class Outbox:
+    """
+    Bandeja de salida duradera.
+
+    - encolar() solo inserta una fila en SQLite: nunca espera a la red.
+    - Cada destino tiene sus propios workers (límite de concurrencia).
+    - Si el manejador lanza una excepción la tarea se reintenta con
+      backoff exponencial (con jitter); ErrorPermanente la marca como fallida.
+    - La clave de idempotencia evita encolar dos veces el mismo efecto,
+      también después de entregarlo: las tareas con clave quedan como
+      'hecha' en vez de borrarse. Con reemplazar=True la última tarea con
+      esa clave sustituye a la anterior (p. ej. el estado de un
+      dispositivo: solo importa el último) y se vuelve a enviar.
+    - Tras max_intentos fallos la tarea queda como fallida; las fallidas
+      y las hechas se borran pasados `retencion` segundos.
+    - Las tareas sobreviven a reinicios del proceso.
+    """
+
+    def __init__(self, ruta, concurrencia=None, backoff_base=1.0,
+                 backoff_max=300.0, max_intentos=50, retencion=7 * 86400):
+        self.ruta = ruta
+        self.concurrencia = concurrencia or {}
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_intentos = max_intentos
+        self.retencion = retencion
+        self._ultima_purga = 0.0
+
+        self._local = threading.local()
+        self._lock_reclamar = threading.Lock()
+        self._manejadores = {}
+        self._eventos = {}
+        self._hilos = []
+        self._activo = True
+
+        conexion = self._conexion()
+        conexion.executescript("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                destino TEXT NOT NULL,
+                operacion TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                clave TEXT UNIQUE,
+                estado TEXT NOT NULL DEFAULT 'pendiente',
+                intentos INTEGER NOT NULL DEFAULT 0,
+                proximo_intento REAL NOT NULL,
+                creado REAL NOT NULL,
+                ultimo_error TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_outbox_listas
+                ON outbox (destino, estado, proximo_intento);
+        """)
+        # Lo que quedó "en curso" en una ejecución anterior se reintenta
+        conexion.execute(
+            "UPDATE outbox SET estado = 'pendiente' WHERE estado IN ('en_curso', 'reemplazada')"
+        )
+
+    # ---------------- configuración ----------------
+
+    def registrar(self, destino, operacion, manejador):
+        """manejador(payload) se ejecuta en un worker del destino"""
+        self._manejadores[(destino, operacion)] = manejador
+        if destino not in self._eventos:
+            self._eventos[destino] = threading.Event()
+            for i in range(self.concurrencia.get(destino, 1)):
+                hilo = threading.Thread(
+                    target=self._bucle, args=(destino,),
+                    name=f"outbox-{destino}-{i}", daemon=True
+                )
+                hilo.start()
+                self._hilos.append(hilo)
+
+    # ---------------- productor ----------------
+
+    def encolar(self, destino, operacion, payload, clave=None, reemplazar=False):
+        """
+        Guarda la tarea en disco. Devuelve False si ya existía una tarea
+        con la misma clave de idempotencia (aunque ya se hubiera entregado).
+
+        Con reemplazar=True (y una clave) la tarea existente con esa clave
+        pasa a llevar el payload nuevo: si estaba pendiente, fallida o hecha
+        se envía ya; si está en curso, se vuelve a enviar al terminar. Con
+        el mismo payload solo se reenvían las fallidas y las hechas (una
+        pendiente o en curso no se reinicia ni se duplica).
+        """
+        ahora = time.time()
+        if reemplazar and clave is not None:
+            cursor = self._conexion().execute(
+                "INSERT INTO outbox (destino, operacion, payload, clave, proximo_intento, creado) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (clave) DO UPDATE SET "
+                "operacion = excluded.operacion, payload = excluded.payload, intentos = 0, "
+                "proximo_intento = excluded.proximo_intento, creado = excluded.creado, ultimo_error = NULL, "
+                "estado = CASE WHEN estado IN ('en_curso', 'reemplazada') THEN 'reemplazada' ELSE 'pendiente' END "
+                "WHERE outbox.estado IN ('fallida', 'hecha') OR outbox.payload != excluded.payload",
+                (destino, operacion, json.dumps(payload), clave, ahora, ahora)
+            )
+        else:
+            cursor = self._conexion().execute(
+                "INSERT OR IGNORE INTO outbox (destino, operacion, payload, clave, proximo_intento, creado) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (destino, operacion, json.dumps(payload), clave, ahora, ahora)
+            )
+        evento = self._eventos.get(destino)
+        if evento is not None:
+            evento.set()
+        return cursor.rowcount == 1
+
+    # ---------------- métricas ----------------
+
+    def profundidad(self):
+        """Tareas pendientes por destino, más las fallidas definitivamente"""
+        filas = self._conexion().execute(
+            "SELECT destino, estado, COUNT(*) FROM outbox WHERE estado != 'hecha' GROUP BY destino, estado"
+        ).fetchall()
+        resultado = {}
+        for destino, estado, cantidad in filas:
+            clave = "fallidas" if estado == "fallida" else destino
+            resultado[clave] = resultado.get(clave, 0) + cantidad
+        return resultado
+
+    def pendientes(self):
+        return self._conexion().execute(
+            "SELECT COUNT(*) FROM outbox WHERE estado NOT IN ('fallida', 'hecha')"
+        ).fetchone()[0]
+
+    def cerrar(self, timeout=5):
+        self._activo = False
+        for evento in self._eventos.values():
+            evento.set()
+        for hilo in self._hilos:
+            hilo.join(timeout=timeout)
+
+    # ---------------- workers ----------------
+
+    def _conexion(self):
+        conexion = getattr(self._local, "conexion", None)
+        if conexion is None:
+            conexion = sqlite3.connect(self.ruta, timeout=30, isolation_level=None)
+            conexion.execute("PRAGMA journal_mode=WAL")
+            conexion.execute("PRAGMA synchronous=NORMAL")
+            self._local.conexion = conexion
+        return conexion
+
+    def _reclamar(self, destino):
+        """Marca como 'en_curso' la siguiente tarea lista del destino"""
+        conexion = self._conexion()
+        with self._lock_reclamar:
+            fila = conexion.execute(
+                "SELECT id, operacion, payload, intentos, clave FROM outbox "
+                "WHERE destino = ? AND estado = 'pendiente' AND proximo_intento <= ? "
+                "ORDER BY proximo_intento, id LIMIT 1",
+                (destino, time.time())
+            ).fetchone()
+            if fila is not None:
+                conexion.execute("UPDATE outbox SET estado = 'en_curso' WHERE id = ?", (fila[0],))
+        return fila
+
+    def _espera(self, destino):
+        """Segundos hasta la próxima tarea programada del destino (máx. 5)"""
+        fila = self._conexion().execute(
+            "SELECT MIN(proximo_intento) FROM outbox WHERE destino = ? AND estado = 'pendiente'",
+            (destino,)
+        ).fetchone()
+        if fila[0] is None:
+            return 5.0
+        return min(5.0, max(0.0, fila[0] - time.time()))
+
+    def _purgar(self):
+        """Borra las tareas fallidas y hechas más viejas que retencion (como mucho cada hora)"""
+        if self.retencion is None:
+            return
+        with self._lock_reclamar:
+            if time.time() - self._ultima_purga < 3600:
+                return
+            self._ultima_purga = time.time()
+        borradas = self._conexion().execute(
+            "DELETE FROM outbox WHERE estado IN ('fallida', 'hecha') AND creado < ?",
+            (time.time() - self.retencion,)
+        ).rowcount
+        if borradas:
+            print(f"🧹 Outbox: {borradas} tareas terminadas antiguas borradas")
+
+    def _terminar(self, id_tarea, sql, parametros):
+        """
+        Aplica el resultado de una tarea en curso. Si mientras tanto fue
+        reemplazada (payload nuevo), se deja pendiente para enviarla ya.
+        """
+        conexion = self._conexion()
+        if conexion.execute(sql + " AND estado = 'en_curso'", parametros).rowcount == 0:
+            conexion.execute(
+                "UPDATE outbox SET estado = 'pendiente', proximo_intento = ? "
+                "WHERE id = ? AND estado = 'reemplazada'",
+                (time.time(), id_tarea)
+            )
+
+    def _bucle(self, destino):
+        evento = self._eventos[destino]
+        while self._activo:
+            fila = self._reclamar(destino)
+            if fila is None:
+                self._purgar()
+                evento.wait(self._espera(destino))
+                evento.clear()
+                continue
+
+            id_tarea, operacion, payload, intentos, clave = fila
+            try:
+                manejador = self._manejadores[(destino, operacion)]
+                manejador(json.loads(payload))
+                # Con clave se conserva la fila (sin payload) para que la clave
+                # siga deduplicando; sin clave no hace falta guardarla
+                if clave is None:
+                    self._terminar(id_tarea, "DELETE FROM outbox WHERE id = ?", (id_tarea,))
+                else:
+                    self._terminar(
+                        id_tarea,
+                        "UPDATE outbox SET estado = 'hecha', payload = 'null', ultimo_error = NULL WHERE id = ?",
+                        (id_tarea,)
+                    )
+            except ErrorPermanente as e:
+                print(f"❌ Outbox {destino}/{operacion}: fallo definitivo: {e}")
+                self._terminar(
+                    id_tarea,
+                    "UPDATE outbox SET estado = 'fallida', ultimo_error = ? WHERE id = ?",
+                    (str(e), id_tarea)
+                )
+            except Exception as e:
+                intentos += 1
+                if self.max_intentos is not None and intentos >= self.max_intentos:
+                    estado = "fallida"
+                    print(f"❌ Outbox {destino}/{operacion}: agotados {intentos} intentos: {e}")
+                else:
+                    estado = "pendiente"
+                    print(f"⚠️ Outbox {destino}/{operacion}: intento {intentos} falló: {e}")
+                espera = min(self.backoff_max, self.backoff_base * 2 ** (intentos - 1))
+                espera *= random.uniform(0.5, 1.0)
+                self._terminar(
+                    id_tarea,
+                    "UPDATE outbox SET estado = ?, intentos = ?, proximo_intento = ?, ultimo_error = ? "
+                    "WHERE id = ?",
+                    (estado, intentos, time.time() + espera, str(e), id_tarea)
+                )
@@ -0,0 +1,133 @@
+# ============================================
+# REGISTRO DE MODELOS
+# Un único modelo cargado por proceso (audio, YOLO...) con
+# recarga en caliente cuando cambia el archivo en disco
+# ============================================
+
+import hashlib
+import os
+import threading
+import time
+
+
+class _Entrada:
+    __slots__ = (
+        "ruta", "cargador", "vigilar", "modelo", "firma",
+        "hash", "comprobado", "recargas", "lock",
+    )
+
+    def __init__(self, ruta, cargador, vigilar):
+        self.ruta = ruta
+        self.cargador = cargador
+        self.vigilar = vigilar
+        self.modelo = None
+        self.firma = None               # (mtime_ns, tamaño) del archivo cargado
+        self.hash = None                # sha256 del archivo cargado
+        self.comprobado = 0.0
+        self.recargas = 0
+        self.lock = threading.Lock()
+
+
+class RegistroModelos:
+    """
+    Modelos compartidos por todo el proceso.
+
+    - obtener() carga el modelo la primera vez que se pide (una sola vez
+      aunque lo pidan varios hilos a la vez).
+    - Si vigilar=True, como mucho cada intervalo segundos se mira el
+      mtime/tamaño del archivo; si cambió y su sha256 también, se carga
+      el modelo nuevo y se sustituye al anterior sin reiniciar.
+    - Si la recarga falla (p. ej. archivo a medio escribir) se sigue
+      usando el modelo anterior.
+    """
+
+    def __init__(self, intervalo=2.0):
+        self.intervalo = intervalo
+        self._entradas = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, nombre, ruta, cargador, vigilar=True):
+        """cargador(ruta) -> modelo. Registrar de nuevo un nombre lo reemplaza"""
+        with self._lock:
+            self._entradas[nombre] = _Entrada(ruta, cargador, vigilar)
+
+    def registrado(self, nombre):
+        return nombre in self._entradas
+
+    def obtener(self, nombre):
+        entrada = self._entradas.get(nombre)
+        if entrada is None:
+            raise KeyError(f"Modelo no registrado: {nombre}")
+
+        if entrada.modelo is None:
+            with entrada.lock:
+                if entrada.modelo is None:
+                    self._cargar(entrada)
+        elif entrada.vigilar and time.monotonic() - entrada.comprobado >= self.intervalo:
+            self._comprobar(nombre, entrada)
+        return entrada.modelo
+
+    def info(self):
+        return {
+            nombre: {
+                "ruta": entrada.ruta,
+                "cargado": entrada.modelo is not None,
+                "sha256": entrada.hash,
+                "recargas": entrada.recargas,
+            }
+            for nombre, entrada in list(self._entradas.items())
+        }
+
+    # Llamar con entrada.lock tomado
+
+    def _cargar(self, entrada):
+        if entrada.vigilar:
+            entrada.firma = _firma(entrada.ruta)
+            entrada.hash = _sha256(entrada.ruta)
+        entrada.modelo = entrada.cargador(entrada.ruta)
+        entrada.comprobado = time.monotonic()
+
+    def _comprobar(self, nombre, entrada):
+        # Si otro hilo ya está comprobando/recargando, usar el modelo actual
+        if not entrada.lock.acquire(blocking=False):
+            return
+        try:
+            entrada.comprobado = time.monotonic()
+            try:
+                firma = _firma(entrada.ruta)
+            except OSError:
+                return                  # archivo reemplazándose: seguir con el actual
+            if firma == entrada.firma:
+                return
+
+            hash_nuevo = _sha256(entrada.ruta)
+            if hash_nuevo != entrada.hash:
+                try:
+                    modelo = entrada.cargador(entrada.ruta)
+                except Exception as e:
+                    print(f"⚠️ No se pudo recargar el modelo '{nombre}': {e}")
+                    return
+                entrada.modelo = modelo
+                entrada.hash = hash_nuevo
+                entrada.recargas += 1
+                print(f"🔄 Modelo '{nombre}' recargado desde {entrada.ruta}")
+            entrada.firma = firma
+        finally:
+            entrada.lock.release()
+
+
+def _firma(ruta):
+    estado = os.stat(ruta)
+    return estado.st_mtime_ns, estado.st_size
+
+
+def _sha256(ruta):
+    digest = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(bloque)
+    return digest.hexdigest()
+
+
+# Registro global del proceso
+registro = RegistroModelos()
@@ -12,6 +12,9 @@ char pass[] = "EPCC2022$";
 const char broker[] = "test.mosquitto.org";
 const char topic[]  = "incendio/sensores";
 
+// -------- ID DEL DISPOSITIVO (único por placa) --------
+const char deviceId[] = "mkr-01";
+
 WiFiClient wifiClient;
 MqttClient mqttClient(wifiClient);
 
@@ -81,6 +84,7 @@ void loop() {
   // -------- MQTT --------
   mqttClient.beginMessage(topic);
   mqttClient.print("{");
+  mqttClient.print("\"device\":\""); mqttClient.print(deviceId); mqttClient.print("\",");
   mqttClient.print("\"temp\":"); mqttClient.print(temp_valida); mqttClient.print(",");
   mqttClient.print("\"hum\":");  mqttClient.print(hum_valida);  mqttClient.print(",");
   mqttClient.print("\"luz\":");  mqttClient.print(luz_valida);
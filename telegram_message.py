@@ -16,10 +16,12 @@ def enviar_alerta_telegram(foto_path):
         }
         
         # Enviar la foto con el mensaje
-        response = requests.post(url, files=files, data=data)
+        response = requests.post(url, files=files, data=data, timeout=15)
 
     # Verifica si el mensaje fue enviado correctamente
     if response.status_code == 200:
         print("Foto enviada correctamente")
+        return True
     else:
-        print(f"Error al enviar la foto: {response.text}")
\ No newline at end of file
+        print(f"Error al enviar la foto: {response.text}")
+        return False
\ No newline at end of file